@@ -0,0 +1,11 @@
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from timeclock import create_app
+
+# Views run in a thread pool so the event loop only shuffles bytes. Open
+# overview event streams each hold a thread, size the pool accordingly.
+app = WSGIMiddleware(
+    create_app(), workers=int(os.getenv("TIMECLOCK_ASGI_THREADS", 32))
+)
@@ -0,0 +1,126 @@
+"""Benchmark the workday anomaly sweep on a generated database.
+
+Creates a database with --rows workdays spread over --users users, one in
+every --every of them overlapping, negative, too long or never closed, then
+times a full `anomalies.scan` and the `anomalies.check` run by every edit.
+
+    python benchmark_anomalies.py --rows 2000000 --users 2000
+"""
+import argparse
+import random
+import resource
+import statistics
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import pendulum
+
+from timeclock import anomalies
+from timeclock.db import CONNECTIONS, create_db, db_conn, transaction, use_db
+
+START = pendulum.datetime(2000, 1, 3, tz="America/New_York")
+
+
+def workdays(
+    rows: int, users: int, every: int
+) -> Iterator[Tuple[int, str, Optional[str]]]:
+    """Daily 8 hour workdays per user, with an anomaly every *every* rows."""
+    per_user = rows // users
+    n = 0
+    for user_id in range(1, users + 1):
+        for day in range(per_user):
+            clock_in = START.add(days=day, hours=8)
+            clock_out: Optional[pendulum.DateTime] = clock_in.add(hours=8)
+            n += 1
+            if n % every == 0:
+                kind = (n // every) % 4
+                if kind == 0:
+                    # Starts before yesterday's clock out
+                    clock_in = clock_in.subtract(hours=17)
+                    clock_out = clock_in.add(hours=8)
+                elif kind == 1:
+                    clock_out = clock_in.subtract(hours=1)
+                elif kind == 2:
+                    clock_out = clock_in.add(hours=30)
+                else:
+                    clock_out = None
+            yield (
+                user_id,
+                clock_in.isoformat(" "),
+                clock_out.isoformat(" ") if clock_out else None,
+            )
+
+
+def fill(db_file: Path, rows: int, users: int, every: int) -> None:
+    """Create the database and its users and workdays."""
+    create_db(db_file)
+    with db_conn() as conn:
+        with transaction(conn):
+            conn.executemany(
+                "INSERT INTO user (email, password_hash, username) VALUES (?, '', ?)",
+                ((f"{n}@bench", f"user{n}") for n in range(1, users + 1)),
+            )
+            conn.executemany(
+                "INSERT INTO workday (user_id, clock_in, clock_out) VALUES (?, ?, ?)",
+                workdays(rows, users, every),
+            )
+
+
+def maxrss_mb() -> float:
+    """Peak resident memory of this process so far."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    """Run the benchmark and print a summary."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--every", type=int, default=997)
+    parser.add_argument("--checks", type=int, default=1000)
+    parser.add_argument("--db", type=Path, help="Reuse or keep this database.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = args.db or Path(tmp) / "bench.db"
+        with use_db(db_file):
+            if not db_file.exists():
+                start = time.perf_counter()
+                fill(db_file, args.rows, args.users, args.every)
+                print(f"fill:     {time.perf_counter() - start:.1f}s")
+            with db_conn() as conn:
+                total = conn.execute("SELECT count(*) FROM workday").fetchone()[0]
+                ids = [r[0] for r in conn.execute("SELECT id, user_id FROM workday")]
+
+            rss = maxrss_mb()
+            start = time.perf_counter()
+            found = Counter(a.kind for a in anomalies.scan())
+            elapsed = time.perf_counter() - start
+            print(f"scan:     {total} workdays in {elapsed:.2f}s "
+                  f"({total / elapsed:,.0f} rows/s), "
+                  f"peak RSS +{maxrss_mb() - rss:.1f}MB")
+            print(f"found:    {dict(found)}")
+
+            latencies = []
+            with db_conn() as conn:
+                for workday_id in random.sample(ids, min(args.checks, len(ids))):
+                    user_id, clock_in, clock_out = conn.execute(
+                        "SELECT user_id, clock_in, clock_out FROM workday "
+                        "WHERE id = ?",
+                        (workday_id,),
+                    ).fetchone()
+                    start = time.perf_counter()
+                    anomalies.check(conn, workday_id, user_id, clock_in, clock_out)
+                    latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            print(f"check ms: p50={statistics.median(latencies):.2f} "
+                  f"p95={latencies[int(len(latencies) * 0.95)]:.2f} "
+                  f"max={latencies[-1]:.2f}")
+        CONNECTIONS.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Load test a running timeclock server.
+
+Logs in as an employee and requests the index page and current timesheet from
+many threads. Optionally an OWNER holds overview event streams open the whole
+time, these stand in for slow requests hogging workers.
+
+    python loadtest.py --url http://127.0.0.1:5000 --concurrency 16 --streams 2
+"""
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+
+class Client:
+    """Keep-alive connection that remembers the session cookie."""
+
+    def __init__(self, url: str, timeout: float) -> None:
+        """Init Client."""
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(
+            parts.hostname, parts.port, timeout=timeout
+        )
+        self.cookie: Optional[str] = None
+
+    def request(
+        self, method: str, path: str, body: Optional[str] = None, **headers: str
+    ) -> http.client.HTTPResponse:
+        """Send a request, the caller must read the response."""
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        try:
+            self.conn.request(method, path, body, headers)
+            resp = self.conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError):
+            # Server closed the kept-alive connection, uWSGI's http-socket
+            # does this after every response.
+            self.conn.close()
+            self.conn.request(method, path, body, headers)
+            resp = self.conn.getresponse()
+        cookie = resp.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return resp
+
+    def login(self, email: str, password: str) -> None:
+        """Log in or raise RuntimeError."""
+        body = urlencode(dict(email=email, unhashed_password=password))
+        resp = self.request("POST", "/timeclock/auth/login", body)
+        resp.read()
+        if resp.status != 302:
+            raise RuntimeError(f"login failed for {email}: {resp.status}")
+
+
+def user_id(client: Client) -> str:
+    """Find the logged in user's id from the link on the index page."""
+    resp = client.request("GET", "/timeclock/")
+    text = resp.read().decode()
+    marker = "timesheet?user_id="
+    start = text.index(marker) + len(marker)
+    return text[start : text.index('"', start)]
+
+
+def hold_stream(args: argparse.Namespace, stop: threading.Event) -> None:
+    """Keep an overview event stream open until *stop* is set."""
+    client = Client(args.url, timeout=args.timeout)
+    client.login(args.owner_email, args.owner_password)
+    while not stop.is_set():
+        resp = client.request("GET", "/timeclock/timesheet/overview/events")
+        while not stop.is_set() and resp.fp and resp.fp.readline():
+            pass
+        resp.close()
+
+
+def worker(args: argparse.Namespace, n: int) -> List[Tuple[float, int]]:
+    """Make *n* requests, returning (latency, status) for each."""
+    client = Client(args.url, timeout=args.timeout)
+    client.login(args.email, args.password)
+    paths = ["/timeclock/", f"/timeclock/timesheet?user_id={user_id(client)}"]
+    results = []
+    for i in range(n):
+        start = time.perf_counter()
+        try:
+            resp = client.request("GET", paths[i % len(paths)])
+            resp.read()
+            status = resp.status
+        except (OSError, http.client.HTTPException):
+            client = Client(args.url, timeout=args.timeout)
+            client.login(args.email, args.password)
+            status = 0
+        results.append((time.perf_counter() - start, status))
+    return results
+
+
+def main() -> None:
+    """Run the load test and print a summary."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--email", default="dan@chamberlainbuildersllc.com")
+    parser.add_argument("--password", default="Coffee32")
+    parser.add_argument("--owner-email")
+    parser.add_argument("--owner-password")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--streams", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    streams = [
+        threading.Thread(target=hold_stream, args=(args, stop), daemon=True)
+        for _ in range(args.streams)
+    ]
+    for t in streams:
+        t.start()
+    time.sleep(1 if streams else 0)
+
+    per_worker = args.requests // args.concurrency
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        futures = [
+            pool.submit(worker, args, per_worker) for _ in range(args.concurrency)
+        ]
+        results = [r for f in futures for r in f.result()]
+    elapsed = time.perf_counter() - start
+    stop.set()
+
+    latencies = sorted(r[0] * 1000 for r in results)
+    errors = sum(1 for r in results if r[1] != 200)
+    print(f"requests:   {len(results)} ({errors} errors)")
+    print(f"throughput: {len(results) / elapsed:.1f} req/s")
+    print(f"latency ms: p50={statistics.median(latencies):.1f} "
+          f"p95={latencies[int(len(latencies) * 0.95)]:.1f} max={latencies[-1]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -90,14 +90,20 @@ test_one() {
     TIMECLOCK_TESTING=True TIMECLOCK_DB=test.db wrapped_python -m pytest -rA "${1}"
 }
 
+importtime() {
+    TIMECLOCK_TESTING=True wrapped_python -X importtime -c "import timeclock" 2>&1 |
+        sort -t '|' -k 2 -n | tail -n "${1:-20}"
+}
+
 line_count() {
     clean &&
     cloc --exclude-lang=JavaScript --exclude-dir=venv .
 }
 
 collectstatic() {
-    rm -rf ./www && mkdir www
-    rsync -azP src/timeclock/static www
+    # Keeps www/static/uploads, old hashed files stay for cached pages
+    mkdir -p www/static/uploads
+    "${VENVPATH}"/bin/timeclock-cli collectstatic www/static
 }
 
 initdb() {
@@ -114,8 +120,29 @@ devserver() {
 prodserver() {
     TIMECLOCK_DB=timeclock.db \
         TIMECLOCK_UPLOAD_PATH="www/static/uploads" \
+        TIMECLOCK_STATIC_MANIFEST="www/static/manifest.json" \
+        TIMECLOCK_PROXIES=1 \
+        TIMECLOCK_PHOTO_OFFLOAD=x-accel-redirect \
         TIMECLOCK_SECRET_KEY="$(head -c 64 /dev/urandom | base64)" \
-        "${VENVPATH}"/bin/uwsgi --http-socket 127.0.0.1:5000 --master -p 2 -w wsgi:app
+        "${VENVPATH}"/bin/uwsgi --ini uwsgi.ini
+}
+
+asgiserver() {
+    TIMECLOCK_DB=timeclock.db \
+        TIMECLOCK_UPLOAD_PATH="www/static/uploads" \
+        TIMECLOCK_STATIC_MANIFEST="www/static/manifest.json" \
+        TIMECLOCK_PROXIES=1 \
+        TIMECLOCK_PHOTO_OFFLOAD=x-accel-redirect \
+        TIMECLOCK_SECRET_KEY="$(head -c 64 /dev/urandom | base64)" \
+        wrapped_python -m uvicorn asgi:app --host 127.0.0.1 --port 5000 --no-access-log
+}
+
+loadtest() {
+    wrapped_python loadtest.py "$@"
+}
+
+bench_anomalies() {
+    wrapped_python benchmark_anomalies.py "$@"
 }
 
 default() {
@@ -2,11 +2,23 @@ import os
 from pathlib import Path
 from typing import Optional
 
-from flask import Blueprint, Flask
+from flask import Blueprint, Flask, session
 from flask_login import LoginManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from . import views
-from .db import create_db
+from . import (
+    api,
+    assets,
+    idempotency,
+    maintenance,
+    memory,
+    pdfs,
+    profiling,
+    tenants,
+    views,
+)
+from .db import CONNECTIONS, DEFAULT_DB_FILE, create_db, migrate
+from .photos import DEFAULT_UPLOAD_PATH
 from .users import User
 
 
@@ -23,23 +35,108 @@ def create_app() -> Flask:
     if app.config["TESTING"]:
         app.config["DEBUG"] = True
     app.config["SECRET_KEY"] = os.getenv("TIMECLOCK_SECRET_KEY", FAKE_SECRET_KEY)
-    db_file = Path(os.getenv("TIMECLOCK_DB", "test.db"))
+    db_file = DEFAULT_DB_FILE
 
     # Do not continue if not in DEBUG and a real secret key has not been set
     if not app.config["DEBUG"] and app.config["SECRET_KEY"] == FAKE_SECRET_KEY:
         raise RuntimeError("TIMECLOCK_SECRET_KEY must be set!")
 
-    # Create sqlite3 database if not exists and not in TESTING mode.
-    if not db_file.exists() and not app.config["TESTING"]:
+    # One database per company, see tenants.py. Otherwise create sqlite3
+    # database if not exists and not in TESTING mode, or bring an existing
+    # one up to the latest schema.
+    tenant_routing = os.getenv("TIMECLOCK_TENANT_ROUTING")
+    if tenant_routing:
+        tenants_dir = Path(os.getenv("TIMECLOCK_TENANTS_DIR", "tenants"))
+        tenants.init_app(app, tenant_routing, tenants_dir)
+    elif db_file.exists():
+        migrate(db_file)
+    elif not app.config["TESTING"]:
         create_db(db_file)
+        # uWSGI forks the workers from this process, don't leave them a
+        # connection opened here
+        CONNECTIONS.clear()
+
+    # Number of reverse proxies (Caddy) in front, so request.remote_addr is
+    # the client's address for login throttling
+    proxies = int(os.getenv("TIMECLOCK_PROXIES", 0))
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies)  # type: ignore
+
+    # Off until an OWNER or ADMIN turns it on, after tenants so the switch
+    # is read from the tenant's database.
+    profiling.init_app(app)
+
+    # Memory snapshots and recycling workers over TIMECLOCK_MAX_RSS_MB
+    max_rss = os.getenv("TIMECLOCK_MAX_RSS_MB")
+    memory.init_app(
+        app,
+        float(max_rss) if max_rss else None,
+        Path(os.getenv("TIMECLOCK_MEMORY_SNAPSHOT_DIR", memory.DEFAULT_SNAPSHOT_DIR)),
+    )
 
     # Photo upload config
-    DEFAULT_UPLOAD_PATH = "src/timeclock/static/uploads"
     UPLOAD_PATH = Path(os.getenv("TIMECLOCK_UPLOAD_PATH", DEFAULT_UPLOAD_PATH))
     app.config["UPLOAD_PATH"] = UPLOAD_PATH
     app.config["UPLOAD_EXTENSIONS"] = [".jpg", ".jpeg", ".png"]
     app.config["MAX_CONTENT_LENGTH"] = 4 * 1024 * 1024  # 4MB
 
+    # Let the front proxy send photo files after views.photo checked
+    # permission: x-accel-redirect (Caddy, nginx) redirects to
+    # TIMECLOCK_PHOTO_ACCEL_PREFIX + the path under UPLOAD_PATH, x-sendfile
+    # (Apache, lighttpd) sends the file's absolute path.
+    photo_offload = os.getenv("TIMECLOCK_PHOTO_OFFLOAD", "")
+    if photo_offload not in ("", "x-accel-redirect", "x-sendfile"):
+        raise RuntimeError(f"Unknown TIMECLOCK_PHOTO_OFFLOAD={photo_offload}")
+    app.config["PHOTO_OFFLOAD"] = photo_offload
+    app.config["USE_X_SENDFILE"] = photo_offload == "x-sendfile"
+    app.config["PHOTO_ACCEL_PREFIX"] = os.getenv(
+        "TIMECLOCK_PHOTO_ACCEL_PREFIX", "/static/uploads/"
+    )
+
+    # PDFs of saved timesheets, rendered by a thread in the worker that saved
+    # them. TIMECLOCK_PDF_WORKER=0 leaves them to `timeclock-cli render-pdfs`.
+    pdfs.init_app(
+        app,
+        Path(os.getenv("TIMECLOCK_PDF_PATH", pdfs.DEFAULT_PDF_PATH)),
+        worker=not app.config["TESTING"]
+        and os.getenv("TIMECLOCK_PDF_WORKER", "1") != "0",
+    )
+
+    # Auto clock-out, WAL checkpoints and backups, run by one worker process.
+    # Auto clock-out is opt-in: without a planned shift a forgotten workday
+    # is clocked out with 0 hours, set TIMECLOCK_AUTO_CLOCK_OUT_HOURS (16)
+    # once shifts are planned. Backups are only made with
+    # TIMECLOCK_BACKUP_PATH.
+    backup_path = os.getenv("TIMECLOCK_BACKUP_PATH")
+    scheduler_lock = os.getenv("TIMECLOCK_SCHEDULER_LOCK")
+    auto_clock_out_hours = os.getenv("TIMECLOCK_AUTO_CLOCK_OUT_HOURS", 0)
+    maintenance.init_app(
+        app,
+        enabled=not app.config["TESTING"]
+        and os.getenv("TIMECLOCK_MAINTENANCE", "1") != "0",
+        lock_path=Path(scheduler_lock) if scheduler_lock else None,
+        auto_clock_out_hours=float(auto_clock_out_hours),
+        backup_path=Path(backup_path) if backup_path else None,
+        backup_seconds=float(
+            os.getenv("TIMECLOCK_BACKUP_SECONDS", maintenance.BACKUP_SECONDS)
+        ),
+    )
+
+    # How long a response is replayed for a retried Idempotency-Key
+    idempotency.init_app(
+        app, int(os.getenv("TIMECLOCK_IDEMPOTENCY_TTL", 24 * 60 * 60))
+    )
+
+    # How long an overview event stream stays open before the browser has to
+    # reconnect. Each open stream holds a worker thread.
+    app.config["SSE_STREAM_SECONDS"] = int(
+        os.getenv("TIMECLOCK_SSE_STREAM_SECONDS", 60)
+    )
+
+    # Hashed static file names, written by `timeclock-cli collectstatic`
+    manifest = os.getenv("TIMECLOCK_STATIC_MANIFEST")
+    assets.init_app(app, Path(manifest) if manifest else None)
+
     # Blueprints
     URL_PREFIX = os.getenv("TIMECLOCK_URL_PREFIX", "/timeclock")
     timeclock = Blueprint(
@@ -56,6 +153,7 @@ def create_app() -> Flask:
         static_folder="static",
         url_prefix="/workday",
     )
+    api_v1 = Blueprint("api_v1", __name__, url_prefix="/api/v1")
     auth = Blueprint(
         "auth",
         __name__,
@@ -72,6 +170,8 @@ def create_app() -> Flask:
     @login_manager.user_loader
     def load_user(user_id: str) -> Optional[User]:
         """Needed by flask-login. Must return None if no User."""
+        if not tenants.session_matches(session):
+            return None
         try:
             return User.get(user_id)
         except Exception as exc:
@@ -93,12 +193,68 @@ def create_app() -> Flask:
     timeclock.add_url_rule(
         "/timesheet/<int:id>", view_func=views.timesheet, methods=["GET"]
     )
+    timeclock.add_url_rule(
+        "/timesheet/<int:id>/pdf", view_func=views.timesheet_pdf, methods=["GET"]
+    )
+    timeclock.add_url_rule(
+        "/timesheet/pdfs.zip", view_func=views.pay_period_pdfs, methods=["GET"]
+    )
     timeclock.add_url_rule(
         "/timesheet/overview", view_func=views.overview, methods=["GET"]
     )
+    timeclock.add_url_rule(
+        "/timesheet/hours", view_func=views.hours_dashboard, methods=["GET"]
+    )
+    timeclock.add_url_rule(
+        "/timesheet/history", view_func=views.workday_history, methods=["GET"]
+    )
+    timeclock.add_url_rule(
+        "/timesheet/schedule", view_func=views.schedule, methods=["GET"]
+    )
+    timeclock.add_url_rule(
+        "/timesheet/schedule", view_func=views.add_shift, methods=["POST"]
+    )
+    timeclock.add_url_rule(
+        "/timesheet/schedule/<int:id>",
+        view_func=views.end_shift_template,
+        methods=["DELETE"],
+    )
+    timeclock.add_url_rule(
+        "/timesheet/overview/events", view_func=views.overview_events, methods=["GET"]
+    )
     timeclock.add_url_rule(
         "/photo/<string:filename>", view_func=views.photo, methods=["GET"]
     )
+    timeclock.add_url_rule(
+        "/kiosk/punches", view_func=views.kiosk_punches, methods=["POST"]
+    )
+    timeclock.add_url_rule(
+        "/admin/profiling",
+        view_func=views.profiling_switch,
+        methods=["POST", "DELETE"],
+    )
+    timeclock.add_url_rule(
+        "/admin/throttle", view_func=views.throttle_counters, methods=["GET"]
+    )
+    timeclock.add_url_rule(
+        "/admin/memory", view_func=views.memory_status, methods=["GET"]
+    )
+    timeclock.add_url_rule(
+        "/admin/maintenance", view_func=views.maintenance_runs, methods=["GET"]
+    )
+    timeclock.add_url_rule(
+        "/admin/memory/snapshots",
+        view_func=views.memory_snapshots,
+        methods=["GET", "POST"],
+    )
+    timeclock.add_url_rule(
+        "/admin/memory/diff", view_func=views.memory_diff, methods=["GET"]
+    )
+    timeclock.add_url_rule(
+        "/admin/profiling/<string:format>",
+        view_func=views.profiling_download,
+        methods=["GET"],
+    )
 
     workday.add_url_rule("/<int:id>", view_func=views.get_workday, methods=["GET"])
     workday.add_url_rule("/<int:id>", view_func=views.update_workday, methods=["POST"])
@@ -113,11 +269,25 @@ def create_app() -> Flask:
         "/<int:id>/photo", view_func=views.delete_photo, methods=["DELETE"]
     )
 
+    api_v1.add_url_rule("/status", view_func=api.status, methods=["GET"])
+    api_v1.add_url_rule(
+        "/workday/current", view_func=api.current_workday, methods=["GET"]
+    )
+    api_v1.add_url_rule(
+        "/timesheet/current", view_func=api.current_timesheet, methods=["GET"]
+    )
+    api_v1.add_url_rule("/timesheets", view_func=api.past_timesheets, methods=["GET"])
+    api_v1.add_url_rule("/overview", view_func=api.overview, methods=["GET"])
+    api_v1.add_url_rule("/hours", view_func=api.hours, methods=["GET"])
+    api_v1.add_url_rule("/coverage", view_func=api.coverage, methods=["GET"])
+    api_v1.add_url_rule("/workdays", view_func=api.workday_history, methods=["GET"])
+
     auth.add_url_rule("/login", view_func=views.login, methods=["GET", "POST"])
     auth.add_url_rule("/logout", view_func=views.logout, methods=["GET"])
 
     timeclock.register_blueprint(auth)
     timeclock.register_blueprint(workday)
+    timeclock.register_blueprint(api_v1)
     app.register_blueprint(timeclock)
 
     return app
@@ -0,0 +1,177 @@
+"""Find workdays that would be wrong on a paycheck.
+
+Workdays are swept per user in clock in order, keeping the latest clock out
+seen so far. A workday that clocks in before it overlaps the workday that
+clocked out then. Along the way workdays that clock out before they clock
+in, last longer than MAX_SHIFT_HOURS or were never clocked out are flagged.
+
+`scan` streams every workday through the sweep in one pass, SQLite sorts
+them, only one user's state is kept in memory. `check` runs the same sweep
+over the workdays around one edited workday, `WorkDay.update` uses it to
+refuse edits that would make a bad workday.
+"""
+from __future__ import annotations
+
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import pendulum
+
+from .db import Q, db_conn
+
+# Longer than a double shift, most likely a forgotten clock out
+MAX_SHIFT_HOURS = 16
+OVERLAP = "overlap"
+NEGATIVE = "negative"
+LONG = "long"
+OPEN = "open"
+KINDS = (OVERLAP, NEGATIVE, LONG, OPEN)
+
+# id, user_id, clock in and clock out as unix times
+Span = Tuple[int, int, int, Optional[int]]
+
+
+class InvalidWorkDay(ValueError):
+    """Raised when an edit would make a workday overlap, negative or too long."""
+
+    def __init__(self, anomalies: List[Anomaly]) -> None:
+        """Init InvalidWorkDay."""
+        super().__init__("; ".join(a.describe() for a in anomalies))
+        self.anomalies = anomalies
+
+
+@dataclass
+class Anomaly:
+    """Something wrong with a workday.
+
+    Attributes:
+        kind (str): One of KINDS.
+            overlap: clocked in before *other_id* clocked out.
+            negative: clocked out before clocking in.
+            long: longer than MAX_SHIFT_HOURS.
+            open: never clocked out, either *other_id* clocked in after it or
+                it's been open for longer than MAX_SHIFT_HOURS.
+        user_id (int): The workday's user.
+        workday_id (int): The workday.
+        start (int): Its clock in, unix time.
+        end (Optional[int]): Its clock out, unix time.
+        other_id (Optional[int]): The workday it overlaps, or the workday
+            after an open one.
+    """
+
+    kind: str
+    user_id: int
+    workday_id: int
+    start: int
+    end: Optional[int] = None
+    other_id: Optional[int] = None
+
+    def describe(self) -> str:
+        """What is wrong, for people."""
+        local = pendulum.tz.local_timezone()
+        clock_in = pendulum.from_timestamp(self.start).in_timezone(local)
+        when = clock_in.format("ddd YYYY-MM-DD HH:mm")
+        if self.kind == OVERLAP:
+            return f"Clocked in {when} before workday {self.other_id} clocked out"
+        if self.kind == NEGATIVE:
+            return f"Clocked out before clocking in at {when}"
+        if self.kind == LONG:
+            hours = ((self.end or self.start) - self.start) / 3600
+            return f"Clocked in {when} for {hours:.1f} hours"
+        if self.other_id:
+            return f"Clocked in {when} and never clocked out"
+        return f"Clocked in {when} and still not clocked out"
+
+
+def sweep(spans: Iterable[Span], now: Optional[float] = None) -> Iterator[Anomaly]:
+    """Yield the anomalies of workday spans sorted by user_id and clock in.
+
+    Runs in one pass and keeps one user's state, the input decides how much
+    is in memory.
+
+    Args:
+        spans (Iterable[Span]): (id, user_id, clock in, clock out) tuples
+            with unix times, clock out None for open workdays.
+        now (Optional[float]): Unix time open workdays are measured to.
+    """
+    max_shift = MAX_SHIFT_HOURS * 3600
+    open_before = (time.time() if now is None else now) - max_shift
+    user = None
+    # Latest clock out of the user so far, and its workday
+    reach = reach_id = 0
+    dangling: Optional[Anomaly] = None
+    for id, user_id, start, end in spans:
+        if user_id != user:
+            if dangling and dangling.start < open_before:
+                yield dangling
+            user, reach, reach_id, dangling = user_id, 0, 0, None
+        elif dangling:
+            dangling.other_id = id
+            yield dangling
+            dangling = None
+        if start < reach:
+            yield Anomaly(OVERLAP, user_id, id, start, end, other_id=reach_id)
+        if end is None:
+            dangling = Anomaly(OPEN, user_id, id, start)
+            continue
+        if end < start:
+            yield Anomaly(NEGATIVE, user_id, id, start, end)
+            continue
+        if end - start > max_shift:
+            yield Anomaly(LONG, user_id, id, start, end)
+        if end > reach:
+            reach, reach_id = end, id
+    if dangling and dangling.start < open_before:
+        yield dangling
+
+
+def scan(now: Optional[float] = None) -> Iterator[Anomaly]:
+    """Yield the anomalies of every workday, streamed from the database."""
+    with db_conn() as conn:
+        with Q.get_workday_spans_cursor(conn) as cursor:
+            yield from sweep(cursor, now)
+
+
+def check(
+    conn: sqlite3.Connection,
+    workday_id: int,
+    user_id: int,
+    clock_in: pendulum.DateTime,
+    clock_out: Optional[pendulum.DateTime],
+) -> List[Anomaly]:
+    """Anomalies a workday would have with the new clock in and out.
+
+    Only the user's workdays that overlap the new times are read. A workday
+    that is still open isn't an anomaly here, it's the one being worked.
+
+    Returns:
+        List[Anomaly]: Anomalies of the workday, or of the workdays it would
+            overlap.
+    """
+    start = clock_in.int_timestamp
+    end = clock_out.int_timestamp if clock_out else None
+    # Pad by a day so clock_in compared as text can't miss an offset. An
+    # earlier workday longer than MAX_SHIFT_HOURS is missed, `scan` has it.
+    after = pendulum.from_timestamp(min(start, end or start)).subtract(
+        hours=MAX_SHIFT_HOURS, days=1
+    )
+    before = pendulum.from_timestamp(max(start, end or start)).add(days=1)
+    neighbours = Q.get_user_workday_spans(
+        conn,
+        user_id=user_id,
+        workday_id=workday_id,
+        after=after.to_date_string(),
+        before=before.to_date_string(),
+        start=start,
+        end=max(start, end or start),
+    )
+    spans = sorted(
+        [*neighbours, (workday_id, user_id, start, end)], key=lambda span: span[2]
+    )
+    return [
+        a
+        for a in sweep(spans)
+        if a.kind != OPEN and workday_id in (a.workday_id, a.other_id)
+    ]
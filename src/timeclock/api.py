@@ -0,0 +1,276 @@
+"""Versioned JSON API for the mobile client.
+
+Same data as the HTML views without the markup. Responses are compact JSON
+(orjson when it's installed). Every endpoint takes `fields=a,b` to only
+return some fields, and list endpoints are paginated with `limit` and the
+opaque `next_cursor` of the previous page.
+"""
+import datetime
+import json
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+
+from flask import abort, request
+from flask_login import current_user, login_required
+from werkzeug import Response
+
+from . import history, rollups, shifts, timeclock
+from .db import Q, class_row, db_conn
+from .timesheet import TimeSheet, get_overview_row
+from .users import Role, User
+from .workday import WorkDay
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def _default(obj: Any) -> str:
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(data: Any) -> bytes:
+    """Encode *data* as compact JSON."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(",", ":")).encode()
+
+
+def _fields() -> Optional[List[str]]:
+    fields = request.args.get("fields")
+    return [f for f in fields.split(",") if f] if fields else None
+
+
+def _select(obj: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return obj
+    return {f: obj[f] for f in fields if f in obj}
+
+
+def _response(obj: Dict[str, Any]) -> Response:
+    return Response(dumps(_select(obj, _fields())), mimetype="application/json")
+
+
+def _page(items: List[Dict[str, Any]], next_cursor: Optional[int]) -> Response:
+    fields = _fields()
+    data = dict(
+        items=[_select(item, fields) for item in items],
+        next_cursor=None if next_cursor is None else str(next_cursor),
+    )
+    return Response(dumps(data), mimetype="application/json")
+
+
+def _limit() -> int:
+    try:
+        limit = int(request.args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        abort(400)
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def _cursor() -> Optional[int]:
+    cursor = request.args.get("cursor")
+    if cursor is None:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        abort(400)
+
+
+def _user() -> User:
+    """The user from the user_id arg, OWNERs may ask for any user."""
+    user_id = request.args.get("user_id", current_user.id)
+    if user_id != current_user.id and current_user.role != Role.OWNER:
+        abort(403)
+    try:
+        return User.get(user_id)
+    except ValueError:
+        abort(404)
+
+
+def workday_dict(wd: WorkDay) -> Dict[str, Any]:
+    """The JSON representation of a workday."""
+    return dict(
+        id=wd.id,
+        clock_in=wd.clock_in,
+        clock_out=wd.clock_out,
+        notes=wd.notes,
+        hours=wd.hours,
+        photos=[p.filename for p in wd.photos or []],
+    )
+
+
+def timesheet_summary(ts: TimeSheet) -> Dict[str, Any]:
+    """The JSON representation of a timesheet without its workdays."""
+    return dict(
+        id=ts.id,
+        notes=ts.notes,
+        start_date=ts.start_date if ts.work_days else None,
+        end_date=ts.end_date if ts.work_days else None,
+        hours=ts.hours,
+    )
+
+
+@login_required
+def status() -> Response:
+    """Whether the user is clocked in and on which workday."""
+    user = _user()
+    clocked_in = timeclock.clocked_in(user)
+    workday_id = WorkDay.current(user).id if clocked_in else None
+    return _response(dict(clocked_in=clocked_in, workday_id=workday_id))
+
+
+@login_required
+def current_workday() -> Response:
+    """The workday the user is clocked in on, 404 if not clocked in."""
+    user = _user()
+    if not timeclock.clocked_in(user):
+        abort(404)
+    return _response(workday_dict(WorkDay.current(user)))
+
+
+@login_required
+def current_timesheet() -> Response:
+    """The workdays not on a saved timesheet yet."""
+    ts = TimeSheet.current(_user())
+    data = timesheet_summary(ts)
+    data["work_days"] = [workday_dict(wd) for wd in ts.work_days]
+    return _response(data)
+
+
+@login_required
+def past_timesheets() -> Response:
+    """Saved timesheets, newest first."""
+    user = _user()
+    limit = _limit()
+    with db_conn() as conn:
+        ids = [
+            r[0]
+            for r in Q.get_user_timesheet_ids(
+                conn, user_id=user.user_id, cursor=_cursor(), limit=limit + 1
+            )
+        ]
+    next_cursor = ids[limit - 1] if len(ids) > limit else None
+    items = [timesheet_summary(TimeSheet.from_id(id)) for id in ids[:limit]]
+    return _page(items, next_cursor)
+
+
+@login_required
+def overview() -> Response:
+    """Every EMPLOYEE's current hours and clocked in status, OWNER only."""
+    if current_user.role != Role.OWNER:
+        abort(403)
+    limit = _limit()
+    with db_conn(row_factory=class_row(User)) as conn:
+        employees = Q.get_employees_after(
+            conn, cursor=_cursor() or 0, limit=limit + 1
+        )
+    next_cursor = int(employees[limit - 1].id) if len(employees) > limit else None
+    week = shifts.this_week()
+    items = [get_overview_row(user, week) for user in employees[:limit]]
+    return _page(items, next_cursor)
+
+
+@login_required
+def hours() -> Response:
+    """Hours per user per period between `start` and `end` from the rollups.
+
+    EMPLOYEEs get their own hours, OWNERs everyone's unless they pass
+    `user_id`. `period` is one of day, week (default), month or year.
+    """
+    if current_user.role == Role.OWNER and "user_id" not in request.args:
+        user_id = None
+    else:
+        user_id = _user().user_id
+    period = request.args.get("period", "week")
+    try:
+        start, end = rollups.parse_range(
+            request.args.get("start"), request.args.get("end")
+        )
+        rows = rollups.hours(start, end, period, user_id)
+    except ValueError:
+        abort(400)
+    fields = _fields()
+    data = dict(
+        start=start,
+        end=end,
+        period=period,
+        items=[_select(asdict(row), fields) for row in rows],
+    )
+    return Response(dumps(data), mimetype="application/json")
+
+
+@login_required
+def coverage() -> Response:
+    """Shift coverage and lateness per user between `start` and `end`.
+
+    EMPLOYEEs get their own, OWNERs everyone's unless they pass `user_id`.
+    The range defaults to the current week.
+    """
+    if current_user.role == Role.OWNER and "user_id" not in request.args:
+        user_id = None
+    else:
+        user_id = _user().user_id
+    try:
+        start, end = rollups.parse_range(
+            request.args.get("start"), request.args.get("end"), weeks=1
+        )
+        users = shifts.coverage(shifts.results(start, end, user_id))
+    except ValueError:
+        abort(400)
+    fields = _fields()
+    items = []
+    for cov in sorted(users.values(), key=lambda cov: cov.username):
+        item = asdict(cov)
+        item["results"] = [
+            dict(
+                start=result.shift.start,
+                end=result.shift.end,
+                status=result.status,
+                clock_in=result.clock_in,
+                late_minutes=result.late_minutes,
+            )
+            for result in cov.results
+        ]
+        item["percent"] = cov.percent
+        items.append(_select(item, fields))
+    data = dict(start=start, end=end, items=items)
+    return Response(dumps(data), mimetype="application/json")
+
+
+@login_required
+def workday_history() -> Response:
+    """The user's workdays clocked in between `start` and `end`, oldest first.
+
+    The range defaults to the current month. Besides the page, `page_hours`
+    adds up the page's closed workdays and `hours` and `workdays` the whole
+    range's.
+    """
+    user = _user()
+    try:
+        start, end = history.parse_range(
+            request.args.get("start"), request.args.get("end")
+        )
+        page = history.get_history(
+            user.user_id, start, end, request.args.get("cursor"), _limit()
+        )
+    except ValueError:
+        abort(400)
+    fields = _fields()
+    data = dict(
+        start=start,
+        end=end,
+        hours=page.hours,
+        workdays=page.workdays,
+        page_hours=page.page_hours,
+        items=[_select(asdict(row), fields) for row in page.rows],
+        next_cursor=page.next_cursor,
+    )
+    return Response(dumps(data), mimetype="application/json")
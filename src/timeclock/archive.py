@@ -0,0 +1,102 @@
+"""Move old timesheets out of the hot tables into an archive database.
+
+Saved timesheets keep their workdays in the workday, timesheet_workday and
+workday_photo tables forever, and every query scanning those tables pays for
+them. `archive_timesheets` moves saved timesheets older than a given age,
+with their workdays and photo links, to <db>.archive.db next to the database.
+
+Every connection attaches that file as `archive` and the all_* temp views read
+both databases, so moved timesheets still show up in the past timesheets list
+and load with `TimeSheet.from_id`. Photos stay in the main database, only the
+links to them move.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+
+import pendulum
+
+from .db import Q, archive_path, db_conn, get_db_file, transaction
+
+
+@dataclass
+class ArchiveReport:
+    """What one call of `archive_timesheets` moved.
+
+    Attributes:
+        timesheets (int): Timesheets moved to the archive.
+        workdays (int): Workdays moved with them.
+        done (bool): There was nothing left to move.
+    """
+
+    timesheets: int = 0
+    workdays: int = 0
+    done: bool = False
+
+
+def create_archive(db_file: Path) -> Path:
+    """Create the archive database for *db_file* unless it already exists.
+
+    Connections opened before the archive existed have an empty in-memory
+    one attached, `CONNECTIONS` reopens them the next time they're used.
+
+    Returns:
+        Path: The archive database file.
+    """
+    path = archive_path(db_file)
+    if path.exists():
+        return path
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive;", (str(path),))
+        conn.execute("pragma archive.journal_mode=wal;")
+        Q.create_archive_schema(conn)
+    finally:
+        conn.close()
+    return path
+
+
+def archive_timesheets(
+    older_than: pendulum.Duration, batch_size: int = 100
+) -> ArchiveReport:
+    """Move one batch of old saved timesheets to the archive database.
+
+    A timesheet is old when its last workday clocked in more than
+    *older_than* ago. Rows are copied to the archive and committed before
+    they're deleted from the main database. In WAL mode a commit spanning
+    two files is only atomic per file, this way a crash can leave a row in
+    both files (the views ignore the archive copy and the next run finishes
+    the move) but never in neither.
+
+    Args:
+        older_than (pendulum.Duration): Minimum age of a timesheet.
+        batch_size (int): Max number of timesheets to move.
+
+    Returns:
+        ArchiveReport: What was moved.
+    """
+    create_archive(get_db_file())
+    cutoff = pendulum.now() - older_than
+    with db_conn() as conn:
+        rows = Q.get_archivable_timesheets(
+            conn, cutoff=cutoff.int_timestamp, limit=batch_size
+        )
+        if not rows:
+            return ArchiveReport(done=True)
+        ids = json.dumps([r[0] for r in rows])
+        with transaction(conn):
+            Q.copy_timesheets_to_archive(conn, ids=ids)
+            Q.copy_workdays_to_archive(conn, ids=ids)
+            Q.copy_timesheet_workdays_to_archive(conn, ids=ids)
+            Q.copy_workday_photos_to_archive(conn, ids=ids)
+        with transaction(conn):
+            Q.delete_archived_workdays(conn, ids=ids)
+            Q.delete_archived_timesheets(conn, ids=ids)
+    return ArchiveReport(
+        timesheets=len(rows),
+        workdays=sum(r[1] for r in rows),
+        done=len(rows) < batch_size,
+    )
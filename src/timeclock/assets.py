@@ -0,0 +1,103 @@
+"""Fingerprinted, precompressed static files.
+
+`collect` copies the static folder to where the web server serves it from.
+Every file is also written as <name>.<hash>.<ext> along with .gz (and .br
+when brotli is installed) variants, plus a manifest.json mapping each name to
+its hashed name. With TIMECLOCK_STATIC_MANIFEST pointing at the manifest,
+templates' `static_url` links the hashed names, which never change content
+and can be cached by browsers forever.
+"""
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from flask import Flask, current_app, url_for
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+MANIFEST_NAME = "manifest.json"
+# Hex digits of the sha256 in a hashed file name
+HASH_LENGTH = 12
+# Only text compresses, images are compressed already
+COMPRESS_SUFFIXES = {".css", ".js", ".svg", ".html", ".json", ".txt", ".map"}
+# Never collected, uploads are served from the same directory in production
+SKIP_DIRS = {"uploads"}
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    """Return *name* with the content hash of *data* before the suffix."""
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    path = Path(name)
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+
+def _write(path: Path, data: bytes) -> None:
+    """Write only if different so mtimes (and ETags) survive a rerun."""
+    if path.exists() and path.read_bytes() == data:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _write_compressed(path: Path, data: bytes) -> None:
+    # mtime=0 so the .gz is the same bytes every build
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            _write(path.with_name(path.name + suffix), compressed)
+
+
+def collect(src: Path, dest: Path) -> Dict[str, str]:
+    """Copy static files from *src* to *dest*, hashed and compressed.
+
+    Args:
+        src (Path): The static folder.
+        dest (Path): Where the web server serves /static from.
+
+    Returns:
+        Dict[str, str]: The manifest, file name -> hashed file name, both
+            relative to *dest*.
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(src):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        for filename in sorted(files):
+            path = Path(root, filename)
+            name = path.relative_to(src).as_posix()
+            data = path.read_bytes()
+            manifest[name] = hashed_name(name, data)
+            for out_name in (name, manifest[name]):
+                _write(dest / out_name, data)
+                if path.suffix in COMPRESS_SUFFIXES:
+                    _write_compressed(dest / out_name, data)
+    _write(dest / MANIFEST_NAME, json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+def load_manifest(path: Optional[Path]) -> Dict[str, str]:
+    """Read a manifest written by `collect`, empty without one."""
+    if path is None:
+        return {}
+    return json.loads(path.read_text())
+
+
+def static_url(filename: str) -> str:
+    """Like url_for('static', filename=...) but links the hashed file."""
+    manifest = current_app.config["STATIC_MANIFEST"]
+    return url_for("static", filename=manifest.get(filename, filename))
+
+
+def init_app(app: Flask, manifest_path: Optional[Path]) -> None:
+    """Load the manifest and add `static_url` to templates."""
+    app.config["STATIC_MANIFEST"] = load_manifest(manifest_path)
+    app.add_template_global(static_url)
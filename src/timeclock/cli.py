@@ -0,0 +1,383 @@
+"""Command line tool for managing a timeclock database.
+
+Right now just assume that if you have physical access to the database you're
+an ADMIN. The database is chosen with the same TIMECLOCK_ environment vars the
+web app uses, or --db for one tenant's database.
+"""
+import csv
+import sqlite3
+from collections import Counter
+from pathlib import Path
+from typing import Optional, Tuple
+
+import click
+import pendulum
+
+from . import (
+    anomalies,
+    archive,
+    assets,
+    kiosk,
+    maintenance,
+    memory,
+    pdfs,
+    photos,
+    punch_import,
+    rollups,
+    tenants,
+    users,
+)
+from .db import MIGRATIONS, get_db_file, migrate, set_db_file
+
+
+@click.group()
+@click.option(
+    "--db",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Database file, defaults to TIMECLOCK_DB.",
+)
+def run(db: Optional[Path]) -> None:
+    """Manage the timeclock database."""
+    if db:
+        set_db_file(db)
+
+
+ROLES = click.Choice([role.name for role in users.Role], case_sensitive=False)
+
+
+@run.command("adduser")
+@click.option("--email", prompt=True)
+@click.option("--username", prompt=True)
+@click.option("--role", type=ROLES, default="EMPLOYEE", show_default=True)
+@click.password_option()
+def adduser(email: str, username: str, role: str, password: str) -> None:
+    """Create a user."""
+    try:
+        user = users.register_user(email, password, users.Role[role.upper()], username)
+    except sqlite3.IntegrityError:
+        raise click.ClickException("Email or username already registered")
+    click.echo(f"created user {user.id}")
+
+
+@run.command("deluser")
+@click.argument("login")
+@click.option("--yes", is_flag=True, help="Don't ask before deleting.")
+def deluser(login: str, yes: bool) -> None:
+    """Delete the user whose email, username or else id is LOGIN."""
+    user = users.find_user(login)
+    if user is None:
+        raise click.ClickException(f"No user {login!r}")
+    if not yes:
+        click.confirm(
+            f"Delete user {user.id} {user.email} ({user.username})"
+            " and all their workdays?",
+            abort=True,
+        )
+    users.delete_user(user.user_id)
+    click.echo(f"deleted user {user.id} {user.email}")
+
+
+@run.command("import-users")
+@click.argument(
+    "csv_file", type=click.Path(exists=True, dir_okay=False, path_type=Path)
+)
+@click.option("--role", type=ROLES, default="EMPLOYEE", show_default=True)
+@click.option("--workers", type=int, help="Hashing processes, default all cores.")
+def import_users(csv_file: Path, role: str, workers: Optional[int]) -> None:
+    """Create the users in CSV_FILE.
+
+    The file has a header with email, username, password and optionally
+    role columns. Bad rows are reported and skipped, the rest are created.
+    """
+    with open(csv_file, newline="") as f:
+        report = users.import_users(
+            csv.DictReader(f), users.Role[role.upper()], workers
+        )
+    failed = [row for row in report if row.error]
+    for row in failed:
+        click.echo(f"line {row.line} {row.email}: {row.error}", err=True)
+    click.echo(f"created {len(report) - len(failed)} users, skipped {len(failed)}")
+    if failed:
+        raise SystemExit(1)
+
+
+@run.command("import-punches")
+@click.argument(
+    "csv_file", type=click.Path(exists=True, dir_okay=False, path_type=Path)
+)
+@click.option("--tz", help="Timezone of timestamps without an offset.")
+@click.option(
+    "--format", "timestamp_format", help="strptime format, ISO 8601 if unset."
+)
+@click.option("--chunk-size", default=punch_import.CHUNK_SIZE, show_default=True)
+@click.option("--restart", is_flag=True, help="Ignore an earlier import's checkpoint.")
+def import_punches(
+    csv_file: Path,
+    tz: Optional[str],
+    timestamp_format: Optional[str],
+    chunk_size: int,
+    restart: bool,
+) -> None:
+    """Import workdays from another timeclock system's CSV export.
+
+    The header needs user (email, username or badge code), clock_in and
+    clock_out columns, notes is optional. An interrupted import resumes
+    where it stopped when run again, a new file at the same path starts
+    over.
+    """
+    try:
+        report = punch_import.import_punches(
+            csv_file, tz, timestamp_format, chunk_size, restart
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for row, error in report.errors:
+        click.echo(f"row {row}: {error}", err=True)
+    if report.resumed_at:
+        click.echo(f"resumed after row {report.resumed_at}")
+    click.echo(
+        f"read {report.rows} rows, inserted {report.inserted}, "
+        f"{report.conflicts} already there, {report.invalid} invalid"
+    )
+
+
+@run.command("anomalies")
+@click.option(
+    "--kind",
+    type=click.Choice(anomalies.KINDS),
+    multiple=True,
+    help="Only report these, default all.",
+)
+def report_anomalies(kind: Tuple[str, ...]) -> None:
+    """Report overlapping, negative, too long and never closed workdays.
+
+    Exits with 1 if anything was found, for cron.
+    """
+    counts: Counter[str] = Counter()
+    for anomaly in anomalies.scan():
+        if kind and anomaly.kind not in kind:
+            continue
+        counts[anomaly.kind] += 1
+        click.echo(
+            f"{anomaly.kind}\tuser {anomaly.user_id}\tworkday {anomaly.workday_id}"
+            f"\t{anomaly.describe()}"
+        )
+    click.echo(
+        ", ".join(f"{counts[k]} {k}" for k in kind or anomalies.KINDS), err=True
+    )
+    if counts:
+        raise SystemExit(1)
+
+
+@run.command("create-tenant")
+@click.argument("name")
+@click.option(
+    "--tenants-dir",
+    envvar="TIMECLOCK_TENANTS_DIR",
+    default="tenants",
+    type=click.Path(file_okay=False, path_type=Path),
+    show_default=True,
+)
+def create_tenant(name: str, tenants_dir: Path) -> None:
+    """Create the database for a new tenant (company)."""
+    try:
+        db_file = tenants.create_tenant(tenants_dir, name)
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f"created {db_file}")
+
+
+@run.command("migrate")
+def migrate_db() -> None:
+    """Bring the database up to the latest schema, the app does on start."""
+    db_file = get_db_file()
+    version = migrate(db_file)
+    click.echo(f"migrated {db_file} from version {version} to {len(MIGRATIONS)}")
+
+
+@run.command("add-kiosk")
+@click.argument("name")
+def add_kiosk(name: str) -> None:
+    """Register a kiosk device and print its token."""
+    try:
+        token = kiosk.add_kiosk(name)
+    except sqlite3.IntegrityError:
+        raise click.ClickException(f"A kiosk named {name!r} already exists")
+    click.echo(f"token for {name} (shown only once): {token}")
+
+
+@run.command("set-badge")
+@click.argument("user_id", type=int)
+@click.argument("code")
+def set_badge(user_id: int, code: str) -> None:
+    """Give a user a badge code or PIN for kiosks."""
+    try:
+        kiosk.set_badge(user_id, code)
+    except sqlite3.IntegrityError:
+        raise click.ClickException(f"No user with id {user_id}")
+    click.echo(f"badge set for user {user_id}")
+
+
+@run.command("gc-photos")
+@click.option(
+    "--upload-path",
+    envvar="TIMECLOCK_UPLOAD_PATH",
+    default=photos.DEFAULT_UPLOAD_PATH,
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    show_default=True,
+)
+@click.option("--batch-size", default=500, show_default=True)
+@click.option(
+    "--all", "run_all", is_flag=True, help="Keep going until everything is checked."
+)
+def gc_photos(upload_path: Path, batch_size: int, run_all: bool) -> None:
+    """Remove photo files and rows no workday uses.
+
+    Each run checks one batch and remembers where it stopped.
+    """
+    files_done = rows_done = False
+    while True:
+        report = photos.collect_garbage(upload_path, batch_size)
+        files_done |= report.files_done
+        rows_done |= report.rows_done
+        for filename in report.removed:
+            click.echo(f"removed {filename}")
+        for filename in report.missing:
+            click.echo(f"missing {filename}", err=True)
+        click.echo(
+            f"checked {report.files_checked} files, {report.rows_checked} rows"
+        )
+        if not run_all or (files_done and rows_done):
+            break
+
+
+@run.command("archive")
+@click.option(
+    "--older-than",
+    default=365,
+    show_default=True,
+    help="Move saved timesheets whose last workday is older than this many days.",
+)
+@click.option("--batch-size", default=100, show_default=True)
+@click.option(
+    "--all", "run_all", is_flag=True, help="Keep going until nothing is left."
+)
+def archive_timesheets(older_than: int, batch_size: int, run_all: bool) -> None:
+    """Move old saved timesheets to the archive database."""
+    while True:
+        report = archive.archive_timesheets(
+            pendulum.duration(days=older_than), batch_size
+        )
+        click.echo(
+            f"archived {report.timesheets} timesheets, {report.workdays} workdays"
+        )
+        if not run_all or report.done:
+            break
+
+
+@run.command("render-pdfs")
+@click.option(
+    "--upload-path",
+    envvar="TIMECLOCK_UPLOAD_PATH",
+    default=photos.DEFAULT_UPLOAD_PATH,
+    type=click.Path(file_okay=False, path_type=Path),
+    show_default=True,
+)
+@click.option(
+    "--pdf-path",
+    envvar="TIMECLOCK_PDF_PATH",
+    default=pdfs.DEFAULT_PDF_PATH,
+    type=click.Path(file_okay=False, path_type=Path),
+    show_default=True,
+)
+@click.option(
+    "--missing", is_flag=True, help="Also queue saved timesheets without a PDF."
+)
+@click.option(
+    "--retry-failed", is_flag=True, help="Also queue the failed jobs again."
+)
+def render_pdfs(
+    upload_path: Path, pdf_path: Path, missing: bool, retry_failed: bool
+) -> None:
+    """Render the queued timesheet PDFs."""
+    if missing:
+        click.echo(f"queued {pdfs.queue_missing()} timesheets")
+    if retry_failed:
+        click.echo(f"queued {pdfs.retry_failed()} failed jobs again")
+    ran = pdfs.run_jobs(upload_path, pdf_path)
+    counts = ", ".join(f"{n} {status}" for status, n in pdfs.counts().items())
+    click.echo(f"ran {ran} jobs; {counts}")
+
+
+@run.command("maintenance")
+@click.option(
+    "--auto-clock-out-hours",
+    envvar="TIMECLOCK_AUTO_CLOCK_OUT_HOURS",
+    type=float,
+    default=0,
+    show_default=True,
+    help=f"Clock out workdays open this long, e.g. {maintenance.AUTO_CLOCK_OUT_HOURS}.",
+)
+@click.option(
+    "--backup-path",
+    envvar="TIMECLOCK_BACKUP_PATH",
+    type=click.Path(file_okay=False, path_type=Path),
+    help="Back up the database here.",
+)
+@click.option(
+    "--job",
+    type=click.Choice(["checkpoint", "auto-clock-out", "backup"]),
+    multiple=True,
+    help="Only run these, default all.",
+)
+def run_maintenance(
+    auto_clock_out_hours: float, backup_path: Optional[Path], job: Tuple[str, ...]
+) -> None:
+    """Run the maintenance jobs now, for when the app's scheduler is off."""
+    for scheduled in maintenance.jobs(auto_clock_out_hours, backup_path):
+        if job and scheduled.name not in job:
+            continue
+        run = maintenance.run_job(scheduled)
+        click.echo(
+            f"{run.job}\t{run.seconds:.3f}s\t{run.error or run.result}",
+            err=bool(run.error),
+        )
+
+
+@run.command("rebuild-rollups")
+def rebuild_rollups() -> None:
+    """Recompute the daily and weekly hours rollups from the workdays."""
+    rollups.rebuild()
+    click.echo("rebuilt hours rollups")
+
+
+@run.command("collectstatic")
+@click.argument(
+    "dest", type=click.Path(file_okay=False, path_type=Path), default="www/static"
+)
+def collectstatic(dest: Path) -> None:
+    """Copy static files to DEST with hashed names and .gz/.br variants."""
+    src = Path(__file__).parent / "static"
+    manifest = assets.collect(src, dest)
+    click.echo(f"collected {len(manifest)} files into {dest}")
+
+
+@run.command("memory-top")
+@click.argument("snapshot", type=click.Path(exists=True, path_type=Path))
+@click.option("--limit", default=20, show_default=True)
+def memory_top(snapshot: Path, limit: int) -> None:
+    """Show the allocation sites holding the most memory in SNAPSHOT."""
+    for stat in memory.top(snapshot, limit):
+        click.echo(f"{stat['size_kb']:10.1f}KB {stat['count']:8} {stat['site']}")
+
+
+@run.command("memory-diff")
+@click.argument("old", type=click.Path(exists=True, path_type=Path))
+@click.argument("new", type=click.Path(exists=True, path_type=Path))
+@click.option("--limit", default=20, show_default=True)
+def memory_diff(old: Path, new: Path, limit: int) -> None:
+    """Show the allocation sites that grew the most from OLD to NEW."""
+    for stat in memory.diff(old, new, limit):
+        click.echo(
+            f"{stat['size_diff_kb']:+10.1f}KB {stat['count_diff']:+8} {stat['site']}"
+        )
@@ -1,10 +1,25 @@
 """All database classes and functions."""
 import importlib.resources as imp
+import itertools
+import os
 import sqlite3
+import threading
+from collections import OrderedDict
 from contextlib import contextmanager
+from contextvars import ContextVar, Token
 from functools import cache, lru_cache
 from pathlib import Path
-from typing import Any, Callable, Generator, Tuple, Type, Union
+from typing import (
+    Any,
+    Callable,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 import aiosql
 import pendulum
@@ -21,7 +36,12 @@ sqlite3.register_converter("TIMESTAMP", lambda s: pendulum.parse(s.decode()))
 
 @cache
 def get_queries() -> Any:
-    """Returns the aiosql queries object."""
+    """Returns the aiosql queries object.
+
+    Notes:
+        - Use `Q` instead of calling this, the sql files are parsed once when
+          this module is imported.
+    """
     sql_dir = imp.files("timeclock") / "sql"
     return aiosql.from_path(sql_dir, "sqlite3")  # type: ignore
 
@@ -55,46 +75,247 @@ def class_row(cls: Type) -> Callable:
 
 RowFactoryType = Union[Callable[[Type], Callable], Type[sqlite3.Row]]
 
+# The database used when no tenant has been selected with `use_db`
+DEFAULT_DB_FILE = Path(os.getenv("TIMECLOCK_DB", "test.db"))
+_db_file: ContextVar[Path] = ContextVar("db_file", default=DEFAULT_DB_FILE)
+# Seconds to wait for another connection's write lock
+BUSY_TIMEOUT = 5.0
+
+
+def get_db_file() -> Path:
+    """Return the database file for the current tenant."""
+    return _db_file.get()
+
+
+def set_db_file(db_file: Path) -> Token:
+    """Use *db_file* from now on, pass the token to `reset_db_file` to undo."""
+    return _db_file.set(Path(db_file))
+
+
+def reset_db_file(token: Token) -> None:
+    """Go back to the database used before `set_db_file`."""
+    _db_file.reset(token)
+
+
+def archive_path(db_file: Path) -> Path:
+    """Return the archive database file that belongs to *db_file*."""
+    return Path(db_file).with_suffix(".archive.db")
+
 
 @contextmanager
-def db_conn(
-    db_file: Path, row_factory: RowFactoryType = sqlite3.Row
-) -> Generator[sqlite3.Connection, None, None]:
-    """Context manager for sqlite connections.
+def use_db(db_file: Path) -> Generator[None, None, None]:
+    """Run the block against *db_file* instead of the current database."""
+    token = set_db_file(db_file)
+    try:
+        yield
+    finally:
+        reset_db_file(token)
+
+
+def _connect(db_file: Path) -> sqlite3.Connection:
+    """Open and configure a new connection.
 
     Fixes the weird default behavior of transactions, enable reads while
-    a transaction is open, improve write performance, enforce foreign keys,
+    a transaction is open, improve write performance, enforce foreign keys and
     set detect_types arg so that columns of type timestamp will be parsed
-    into a python datetime and run `pragma optimize` on connection close to
-    keep query planner statistics as up to date as possible.
+    into a python datetime.
 
-    Args:
-        db_file (str, Path): A str or pathlib.Path representing the database file.
-        row_factory (RowFactoryType): A function for mapping rows to types.
-            Default is sqlite3.Row.
+    The archive database is attached as `archive`, an empty in-memory one if
+    nothing has been archived yet, so the all_* views reading both always
+    exist.
     """
     conn = sqlite3.connect(
         db_file,
         isolation_level=None,
         detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        timeout=BUSY_TIMEOUT,
     )
     conn.execute("pragma journal_mode=wal;")
     conn.execute("pragma synchronous = normal;")
     conn.execute("pragma temp_store = memory;")
     conn.execute("PRAGMA foreign_keys = on;")
-    conn.row_factory = row_factory
+    archive = archive_path(db_file)
+    conn.execute(
+        "ATTACH DATABASE ? AS archive;",
+        (str(archive) if archive.exists() else ":memory:",),
+    )
+    Q.create_archive_schema(conn)
+    Q.create_archive_views(conn)
+    return conn
 
+
+def _optimize(conn: sqlite3.Connection) -> None:
+    """Keep query planner statistics as up to date as possible."""
     try:
-        yield conn
-    finally:
         conn.execute("pragma analysis_limit=400;")
         conn.execute("pragma optimize;")
-        conn.close()
+    except sqlite3.OperationalError:
+        # optimize needs the write lock. It's only a best effort to keep
+        # statistics fresh so skip it when another connection is writing.
+        pass
+
+
+class ConnectionCache:
+    """LRU of open, configured connections keyed by database file.
+
+    Connecting and running the pragmas costs more than most of the queries the
+    app runs, so connections are kept open between `db_conn` calls. Each
+    thread has its own cache because sqlite3 connections can't be shared
+    between threads. Each tenant gets its own connection and its own file, so
+    a busy writer in one company never holds a lock another company needs.
+
+    Nor can they be shared between processes, SQLite's POSIX locks belong
+    to the process. A forked child (a uWSGI worker of a master that opened
+    the database) starts with an empty cache, see `_forget`.
+
+    Attributes:
+        size (int): Max open connections per thread, the least recently used
+            connection is closed when a new one is needed.
+        optimize_every (int): Run `pragma optimize` every this many uses of a
+            connection, and always when it's closed.
+    """
+
+    def __init__(self, size: int, optimize_every: int = 1000) -> None:
+        """Init ConnectionCache."""
+        self.size = size
+        self.optimize_every = optimize_every
+        self._local = threading.local()
+        # The parent's connections, kept so they're never closed in the child
+        self._inherited: List[threading.local] = []
+        os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self) -> None:
+        """Drop the connections inherited from the parent without closing them.
+
+        Closing one runs `pragma optimize` and may checkpoint and delete the
+        WAL file the parent is still using.
+        """
+        self._inherited.append(self._local)
+        self._local = threading.local()
+
+    @property
+    def _conns(self) -> "OrderedDict[str, _CachedConnection]":
+        try:
+            return self._local.conns
+        except AttributeError:
+            self._local.conns = OrderedDict()
+            return self._local.conns
+
+    def get(self, db_file: Path) -> "_CachedConnection":
+        """Return an open connection to *db_file*."""
+        conns = self._conns
+        key = str(db_file)
+        cached = conns.pop(key, None)
+        if cached and cached.depth == 0 and not cached.is_current():
+            # The file was deleted or replaced (e.g. restored from a backup)
+            # or an archive was created, the connection still points at the
+            # old files.
+            cached.close()
+            cached = None
+        if cached is None:
+            cached = _CachedConnection(db_file)
+        conns[key] = cached
+        for oldest in list(conns)[: max(len(conns) - self.size, 0)]:
+            # Never close a connection an enclosing db_conn is still using
+            if conns[oldest].depth == 0:
+                conns.pop(oldest).close()
+        cached.uses += 1
+        if cached.uses % self.optimize_every == 0:
+            _optimize(cached.conn)
+        return cached
+
+    def clear(self) -> None:
+        """Close every connection opened by this thread."""
+        conns = self._conns
+        while conns:
+            _, cached = conns.popitem()
+            cached.close()
+
+
+class _CachedConnection:
+    def __init__(self, db_file: Path) -> None:
+        self.db_file = db_file
+        self.conn = _connect(db_file)
+        self.inodes = self._inodes()
+        self.uses = 0
+        # How many db_conn blocks are using the connection right now
+        self.depth = 0
+
+    @staticmethod
+    def _inode(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _inodes(self) -> Tuple[Optional[Tuple[int, int]], ...]:
+        return self._inode(self.db_file), self._inode(archive_path(self.db_file))
+
+    def is_current(self) -> bool:
+        return self.inodes[0] is not None and self.inodes == self._inodes()
+
+    def close(self) -> None:
+        _optimize(self.conn)
+        self.conn.close()
+
+
+CONNECTIONS = ConnectionCache(int(os.getenv("TIMECLOCK_DB_CACHE_SIZE", 8)))
+
+
+@contextmanager
+def db_conn(
+    db_file: Optional[Path] = None, row_factory: RowFactoryType = sqlite3.Row
+) -> Generator[sqlite3.Connection, None, None]:
+    """Context manager for sqlite connections.
+
+    The connection comes from `CONNECTIONS` and stays open afterwards.
+    Any transaction left open by the block is rolled back.
+
+    Args:
+        db_file (str, Path): A str or pathlib.Path representing the database file.
+            Default is the current tenant's database, see `get_db_file`.
+        row_factory (RowFactoryType): A function for mapping rows to types.
+            Default is sqlite3.Row.
+    """
+    cached = CONNECTIONS.get(Path(db_file) if db_file else get_db_file())
+    conn = cached.conn
+    previous_row_factory = conn.row_factory
+    # Cursors keep the row factory they were created with so changing it here
+    # doesn't affect cursors of an enclosing db_conn block.
+    conn.row_factory = row_factory  # type: ignore
+    cached.depth += 1
+    try:
+        yield conn
+    finally:
+        cached.depth -= 1
+        conn.row_factory = previous_row_factory
+        if cached.depth == 0 and conn.in_transaction:
+            conn.rollback()
+
+
+_savepoints = itertools.count()
 
 
 @contextmanager
 def transaction(conn: sqlite3.Connection) -> Generator[None, None, None]:
-    """Context manager for explict transactions."""
+    """Context manager for explict transactions.
+
+    Nests, an inner transaction becomes a savepoint of the outer one.
+    """
+    if conn.in_transaction:
+        name = f"sp_{next(_savepoints)}"
+        conn.execute(f"SAVEPOINT {name}")
+        try:
+            yield
+        except:  # noqa: E722
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+            raise
+        else:
+            conn.execute(f"RELEASE {name}")
+        return
+
     # We must issue a "BEGIN" explicitly when running in auto-commit mode.
     conn.execute("BEGIN")
     try:
@@ -107,10 +328,107 @@ def transaction(conn: sqlite3.Connection) -> Generator[None, None, None]:
         conn.commit()
 
 
+def _statements(sql: str) -> Iterator[str]:
+    """Split a script into statements."""
+    statement = ""
+    for line in sql.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+
+
+def _script(name: str) -> Callable[[sqlite3.Connection], None]:
+    """A migration step running the statements of the sql script *name*.
+
+    Not with executescript, it commits first and the step would no longer be
+    part of the migration's transaction.
+    """
+    sql = getattr(Q, name).sql
+
+    def step(conn: sqlite3.Connection) -> None:
+        for statement in _statements(sql):
+            conn.execute(statement)
+
+    return step
+
+
+def _migrate_hours_rollups(conn: sqlite3.Connection) -> None:
+    """Create the hours rollups and fill them from the existing workdays."""
+    _script("migrate_hours_rollups")(conn)
+    Q.rebuild_daily_hours(conn)
+    Q.rebuild_weekly_hours(conn)
+
+
+# Changes to schema.sql since the first release, in order. The schema
+# version (`PRAGMA user_version`) is the number of steps a database has had,
+# schema.sql always creates the latest version. Add a step for every change.
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _script("migrate_photo_hashes"),
+    _script("migrate_events"),
+    _script("migrate_autoincrement"),
+    _script("migrate_kiosks"),
+    _script("migrate_profiling"),
+    _migrate_hours_rollups,
+    _script("migrate_throttle"),
+    _script("migrate_idempotency"),
+    _script("migrate_pdf_jobs"),
+    _script("migrate_shifts"),
+    _script("migrate_maintenance_runs"),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Return the schema version of the connection's main database."""
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def migrate(db_file: Path) -> int:
+    """Bring an existing database up to the latest schema version.
+
+    All missing steps run in one transaction on a connection of its own,
+    with the archive attached and foreign keys off so steps can rebuild
+    tables. The write lock is taken before the version is read again,
+    workers starting together migrate once.
+
+    Raises:
+        sqlite3.IntegrityError: If the migrated rows break a foreign key.
+
+    Returns:
+        int: The version the database was at.
+    """
+    conn = _connect(db_file)
+    try:
+        version = schema_version(conn)
+        if version >= len(MIGRATIONS):
+            return version
+        # Rebuilding a table is create new_x, copy, drop x and rename new_x to
+        # x, https://www.sqlite.org/lang_altertable.html#otheralter. Foreign
+        # keys off (a no-op inside a transaction) so dropping x doesn't
+        # cascade, legacy renames so the all_* views aren't checked while x
+        # is missing.
+        conn.execute("PRAGMA foreign_keys = off;")
+        conn.execute("PRAGMA legacy_alter_table = on;")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            for step in MIGRATIONS[version:]:
+                step(conn)
+            if conn.execute("PRAGMA main.foreign_key_check;").fetchone():
+                raise sqlite3.IntegrityError("Migrated rows break a foreign key")
+            conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)};")
+        except:  # noqa: E722
+            conn.rollback()
+            raise
+        conn.commit()
+        return version
+    finally:
+        conn.close()
+
+
 def create_db(db_file: Path) -> None:
-    """Create the database."""
+    """Create the database at the latest schema version."""
     with db_conn(db_file) as conn:
         with transaction(conn):
             Q.create_schema(conn)
-        # conn.executescript(SCHEMA)
-        # conn.commit()
+            conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)};")
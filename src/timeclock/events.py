@@ -0,0 +1,84 @@
+"""Event log used to push changes to open pages.
+
+Writes add a row to the event table in the same transaction as the change
+itself. Every process serving a server-sent events stream polls the table, so
+clients connected to any uWSGI worker see every event.
+"""
+from __future__ import annotations
+
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Iterator, List
+
+import pendulum
+
+from .db import Q, class_row, db_conn
+
+# Only the newest events are needed to catch up reconnecting clients
+KEEP_EVENTS = 1000
+PRUNE_EVERY = 100
+POLL_SECONDS = 2.0
+
+
+@dataclass
+class Event:
+    """A change to a workday.
+
+    Attributes:
+        id (int): event id primary key, used as the SSE event id.
+        name (str): What happened. One of clock_in, clock_out, workday_update.
+        user_id (int): The user the workday belongs to.
+        workday_id (int): The workday that changed.
+        created (pendulum.DateTime): When it happened.
+    """
+
+    id: int
+    name: str
+    user_id: int
+    workday_id: int
+    created: pendulum.DateTime
+
+
+def publish(conn: sqlite3.Connection, name: str, workday_id: int) -> int:
+    """Add an event for the workday.
+
+    Call inside the transaction making the change so the event is only seen
+    if the change is committed.
+
+    Returns:
+        int: The new event id.
+    """
+    event_id = Q.insert_workday_event(
+        conn, name=name, workday_id=workday_id, created=pendulum.now()
+    )
+    if event_id % PRUNE_EVERY == 0:
+        Q.prune_events(conn, keep=KEEP_EVENTS)
+    return event_id
+
+
+def latest_id() -> int:
+    """Return the id of the newest event, 0 if there are none."""
+    with db_conn() as conn:
+        return Q.get_latest_event_id(conn)
+
+
+def listen(
+    last_id: int, timeout: float, poll_seconds: float = POLL_SECONDS
+) -> Iterator[List[Event]]:
+    """Poll for events newer than *last_id* until *timeout* seconds pass.
+
+    Yields a (possibly empty) list of new events after every poll so callers
+    can send keepalives and notice clients that went away.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        with db_conn(row_factory=class_row(Event)) as conn:
+            batch = Q.get_events_after(conn, last_id=last_id)
+        if batch:
+            last_id = batch[-1].id
+        yield batch
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(poll_seconds, remaining))
@@ -0,0 +1,150 @@
+"""Browse a user's workdays by the day they clocked in.
+
+Saved and archived workdays included, without loading timesheets. Pages are
+keyset paginated: the cursor holds the clock in and id of the last workday
+of the previous page and the next page starts after them, so every page is
+an index range scan on (user_id, clock_in) however deep it is, where OFFSET
+would read and skip every earlier workday. The cursor doesn't look the
+workday up, deleting or editing it doesn't move the next page. Hours of the
+page and of the whole range are added up by SQLite.
+"""
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import pendulum
+
+from . import rollups
+from .db import Q, class_row, db_conn
+
+PAGE_SIZE = 50
+
+
+@dataclass
+class HistoryRow:
+    """One workday of the history.
+
+    Attributes:
+        id (int): The workday id.
+        clock_in (pendulum.DateTime): When it started.
+        clock_out (Optional[pendulum.DateTime]): When it ended, None while open.
+        notes (Optional[str]): The workday's notes.
+        hours (Optional[float]): Hours rounded to the quarter hour, None while
+            open.
+        running_hours (float): Hours of the page up to this workday.
+    """
+
+    id: int
+    clock_in: pendulum.DateTime
+    clock_out: Optional[pendulum.DateTime]
+    notes: Optional[str]
+    hours: Optional[float]
+    running_hours: float
+
+    @property
+    def date(self) -> pendulum.Date:
+        """The day clock_in happened."""
+        return self.clock_in.date()
+
+
+@dataclass
+class History:
+    """A page of a user's workdays between two days.
+
+    Attributes:
+        user_id (int): The user.
+        start (pendulum.Date): First day.
+        end (pendulum.Date): Last day.
+        rows (List[HistoryRow]): The page, oldest first.
+        next_cursor (Optional[str]): Cursor of the next page, None on the last.
+        page_hours (float): Hours of the page's closed workdays.
+        hours (float): Hours of every closed workday in the range.
+        workdays (int): Number of closed workdays in the range.
+    """
+
+    user_id: int
+    start: pendulum.Date
+    end: pendulum.Date
+    rows: List[HistoryRow] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    page_hours: float = 0.0
+    hours: float = 0.0
+    workdays: int = 0
+
+
+def parse_range(
+    start: Optional[str], end: Optional[str]
+) -> Tuple[pendulum.Date, pendulum.Date]:
+    """Parse YYYY-MM-DD *start* and *end*, by default the current month.
+
+    Raises:
+        ValueError: If a date doesn't parse or *end* is before *start*.
+    """
+    if start or end:
+        return rollups.parse_range(start, end, weeks=4)
+    first = pendulum.today().date().start_of("month")
+    return first, first.end_of("month")
+
+
+def encode_cursor(row: HistoryRow) -> str:
+    """The opaque cursor of the page after *row*."""
+    cursor = f"{row.clock_in.isoformat()} {row.id}"
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[pendulum.DateTime, int]:
+    """The clock in and id of the workday *cursor* was made from.
+
+    Raises:
+        ValueError: If *cursor* isn't one `encode_cursor` made.
+    """
+    # Bad base64, utf-8, dates and ints all raise ValueError
+    clock_in, id = base64.urlsafe_b64decode(cursor).decode().split(" ")
+    after = pendulum.parse(clock_in)
+    if not isinstance(after, pendulum.DateTime):
+        raise ValueError(f"Bad cursor {cursor!r}")
+    return after, int(id)
+
+
+def get_history(
+    user_id: int,
+    start: pendulum.Date,
+    end: pendulum.Date,
+    cursor: Optional[str] = None,
+    limit: int = PAGE_SIZE,
+) -> History:
+    """The page of the user's workdays clocked in from *start* to *end*.
+
+    Args:
+        user_id (int): The user.
+        start (pendulum.Date): First day.
+        end (pendulum.Date): Last day, inclusive.
+        cursor (Optional[str]): `next_cursor` of the previous page.
+        limit (int): Workdays per page.
+
+    Raises:
+        ValueError: If *cursor* isn't a `next_cursor`.
+    """
+    after_clock_in, after_id = decode_cursor(cursor) if cursor else ("", 0)
+    params = dict(user_id=user_id, start=start, next_day=end.add(days=1))
+    with db_conn(row_factory=class_row(HistoryRow)) as conn:
+        # One more to know if there is a next page
+        rows = Q.get_workday_history(
+            conn,
+            after_clock_in=after_clock_in,
+            after_id=after_id,
+            limit=limit + 1,
+            **params,
+        )
+    with db_conn() as conn:
+        workdays, hours = Q.get_workday_history_totals(conn, **params)
+    history = History(
+        user_id, start, end, rows[:limit], hours=hours, workdays=workdays
+    )
+    if history.rows:
+        history.page_hours = history.rows[-1].running_hours
+    if len(rows) > limit:
+        history.next_cursor = encode_cursor(history.rows[-1])
+    return history
@@ -0,0 +1,139 @@
+"""Idempotency-Key support for requests that crews retry on bad connections.
+
+A view decorated with `idempotent` saves its response under the key the
+client sent in the Idempotency-Key header. Sending the same key again
+replays the saved response without running the view, so a retried clock in
+doesn't fail with "already clocked in" and a retried photo upload isn't
+processed twice. Responses are kept in the idempotency_key table, shared by
+every worker, for IDEMPOTENCY_TTL seconds.
+
+Pages give each button or form a fresh key with `idempotency_key()`, see
+static/js/idempotency.js.
+"""
+from __future__ import annotations
+
+import json
+import time
+import uuid
+from functools import wraps
+from typing import Any, Callable, Dict
+
+from flask import Flask, abort, current_app, make_response, request
+from flask_login import current_user
+from werkzeug import Response
+
+from .db import Q, db_conn, transaction
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+# A key whose request hasn't finished after this long (the worker died) can
+# be used again, longer than uwsgi.ini's harakiri
+ABANDONED_SECONDS = 300
+# Delete expired keys every this many requests with a key in a process
+PRUNE_EVERY = 100
+# Never replayed, they depend on the client's session
+SKIP_HEADERS = {"set-cookie", "content-length", "vary"}
+
+
+def idempotency_key() -> str:
+    """A new key for a page to send with a request."""
+    return uuid.uuid4().hex
+
+
+class _Pruner:
+    def __init__(self) -> None:
+        self.requests = 0
+
+    def maybe_prune(self, expired: float) -> None:
+        self.requests += 1
+        if self.requests % PRUNE_EVERY:
+            return
+        with db_conn() as conn:
+            with transaction(conn):
+                Q.prune_idempotency_keys(conn, expired=expired)
+
+
+PRUNER = _Pruner()
+
+
+def _replay(status: int, headers: str, body: bytes) -> Response:
+    resp = Response(body, status=status, headers=json.loads(headers))
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def idempotent(view: Callable[..., Any]) -> Callable[..., Response]:
+    """Replay the saved response of a request with an Idempotency-Key.
+
+    Requests without the header run as usual. A key that is still running
+    gets 409, a key used for a different method or path gets 422. Responses
+    with a 5xx status aren't saved, the request can be retried.
+
+    Notes:
+        - Goes under @login_required, keys belong to the current user.
+    """
+
+    @wraps(view)
+    def wrapper(*args: Any, **kwargs: Any) -> Response:
+        key = request.headers.get(HEADER)
+        if not key:
+            return make_response(view(*args, **kwargs))
+        if len(key) > MAX_KEY_LENGTH:
+            abort(400)
+        now = time.time()
+        expired = now - current_app.config["IDEMPOTENCY_TTL"]
+        PRUNER.maybe_prune(expired)
+        ident = dict(user_id=current_user.user_id, key=key)
+        signature = f"{request.method} {request.path}"
+        with db_conn() as conn:
+            with transaction(conn):
+                claimed = Q.reserve_idempotency_key(
+                    conn,
+                    request=signature,
+                    now=now,
+                    expired=expired,
+                    abandoned=now - ABANDONED_SECONDS,
+                    **ident,
+                )
+                saved = None if claimed else Q.get_idempotency_key(conn, **ident)
+        if saved:
+            saved_signature, status, headers, body = saved
+            if saved_signature != signature:
+                abort(422)
+            if status is None:
+                abort(409)
+            return _replay(status, headers, body)
+
+        try:
+            resp = make_response(view(*args, **kwargs))
+        except Exception:
+            _release(ident)
+            raise
+        if resp.status_code >= 500 or resp.is_streamed:
+            _release(ident)
+            return resp
+        headers = [(k, v) for k, v in resp.headers if k.lower() not in SKIP_HEADERS]
+        with db_conn() as conn:
+            with transaction(conn):
+                Q.save_idempotent_response(
+                    conn,
+                    status=resp.status_code,
+                    headers=json.dumps(headers),
+                    body=resp.get_data(),
+                    **ident,
+                )
+        return resp
+
+    return wrapper
+
+
+def _release(ident: Dict[str, Any]) -> None:
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.release_idempotency_key(conn, **ident)
+
+
+def init_app(app: Flask, ttl: int) -> None:
+    """Keep responses for *ttl* seconds and add `idempotency_key` to templates."""
+    app.config["IDEMPOTENCY_TTL"] = ttl
+    app.add_template_global(idempotency_key)
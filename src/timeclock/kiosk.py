@@ -0,0 +1,189 @@
+"""Punches from shared kiosk devices.
+
+A kiosk is a tablet at a job site that crews clock in and out on one after
+another with a badge code or PIN instead of logging in. Kiosks authenticate
+with a bearer token created by `timeclock-cli add-kiosk` and send punches in
+batches, including punches buffered while the kiosk was offline. Sending the
+same punch twice is harmless, punches are deduplicated by (user, timestamp).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import secrets
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+import pendulum
+
+from . import events, rollups
+from .db import Q, db_conn, transaction
+
+DIRECTIONS = ("in", "out")
+# Most punches one request may carry
+MAX_PUNCHES = 500
+# Accept punches from kiosks whose clock runs a little fast
+MAX_CLOCK_SKEW = pendulum.duration(minutes=5)
+
+
+@dataclass
+class Punch:
+    """One badge scan on a kiosk.
+
+    Attributes:
+        code (str): The badge code or PIN.
+        direction (str): "in" or "out".
+        timestamp (Optional[pendulum.DateTime]): When the badge was scanned,
+            None if the kiosk sent something that isn't a datetime with an
+            offset.
+    """
+
+    code: str
+    direction: str
+    timestamp: Optional[pendulum.DateTime]
+
+    @classmethod
+    def from_json(cls, data: Any) -> Punch:
+        """Build a punch from its JSON object.
+
+        A bad timestamp is not an error here, it's reported as an invalid
+        punch so the rest of the batch still goes through.
+
+        Raises:
+            ValueError: If *data* isn't an object with string code, direction
+                and timestamp or the direction is unknown.
+        """
+        if not isinstance(data, dict):
+            raise ValueError("A punch must be an object")
+        code, direction, timestamp = (
+            data.get("code"),
+            data.get("direction"),
+            data.get("timestamp"),
+        )
+        if not (
+            isinstance(code, str)
+            and isinstance(direction, str)
+            and isinstance(timestamp, str)
+        ):
+            raise ValueError("code, direction and timestamp must be strings")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}")
+        try:
+            parsed = pendulum.parse(timestamp, tz=None)
+        except ValueError:
+            parsed = None
+        if not isinstance(parsed, pendulum.DateTime) or parsed.tzinfo is None:
+            parsed = None
+        return cls(code, direction, parsed)
+
+
+@dataclass
+class PunchResult:
+    """What happened to a punch.
+
+    Attributes:
+        status (str): One of ok, duplicate, invalid, unknown_badge,
+            already_clocked_in, not_clocked_in or out_of_order.
+        workday_id (Optional[int]): The workday the punch was applied to or
+            conflicted with.
+    """
+
+    status: str
+    workday_id: Optional[int] = None
+
+
+def _token_sha256(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def add_kiosk(name: str) -> str:
+    """Register a kiosk and return its bearer token.
+
+    Only a hash of the token is stored, it can't be shown again.
+    """
+    token = secrets.token_urlsafe(32)
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.insert_kiosk(conn, name=name, token_sha256=_token_sha256(token))
+    return token
+
+
+def get_kiosk_id(token: str) -> Optional[int]:
+    """Return the id of the kiosk the token belongs to, None if none does."""
+    if not token:
+        return None
+    with db_conn() as conn:
+        return Q.get_kiosk_by_token(conn, token_sha256=_token_sha256(token))
+
+
+def set_badge(user_id: int, code: str) -> None:
+    """Give the user a badge code or PIN."""
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.set_badge(conn, code=code, user_id=user_id)
+
+
+def apply_punches(punches: List[Punch]) -> List[PunchResult]:
+    """Apply a batch of punches in one transaction.
+
+    Punches are applied in timestamp order so a buffered clock in and clock
+    out of the same person work in any order in the batch. A punch that can't
+    be applied doesn't stop the others.
+
+    Returns:
+        List[PunchResult]: One result per punch, in the order of *punches*.
+    """
+    local_tz = pendulum.tz.local_timezone()
+    now = pendulum.now()
+    results = [PunchResult("invalid") for _ in punches]
+    codes = json.dumps(sorted({p.code for p in punches}))
+    order = sorted(
+        ((p.timestamp, i, p) for i, p in enumerate(punches) if p.timestamp),
+        key=lambda item: (item[0], item[1]),
+    )
+    with db_conn() as conn:
+        with transaction(conn):
+            badges = dict(Q.get_badge_users(conn, codes=codes))
+            for timestamp, i, punch in order:
+                user_id = badges.get(punch.code)
+                if timestamp > now + MAX_CLOCK_SKEW:
+                    continue
+                if user_id is None:
+                    results[i] = PunchResult("unknown_badge")
+                    continue
+                # Stored like the web app's pendulum.now() so that
+                # (user, timestamp) of a resent punch matches exactly.
+                at = timestamp.in_timezone(local_tz)
+                results[i] = _apply(conn, user_id, punch.direction, at)
+    return results
+
+
+def _apply(
+    conn: sqlite3.Connection, user_id: int, direction: str, at: pendulum.DateTime
+) -> PunchResult:
+    if direction == "in":
+        duplicate = Q.get_user_workday_clocked_in_at(conn, user_id=user_id, at=at)
+    else:
+        duplicate = Q.get_user_workday_clocked_out_at(conn, user_id=user_id, at=at)
+    if duplicate:
+        return PunchResult("duplicate", duplicate)
+
+    latest = Q.get_user_current_workday(conn, user_id=user_id)
+    if direction == "in":
+        if latest and latest[2] is None:
+            return PunchResult("already_clocked_in", latest[0])
+        if latest and at <= latest[2]:
+            return PunchResult("out_of_order", latest[0])
+        workday_id = Q.insert_punch_workday(conn, user_id=user_id, clock_in=at)
+        events.publish(conn, "clock_in", workday_id)
+        return PunchResult("ok", workday_id)
+
+    if not latest or latest[2] is not None:
+        return PunchResult("not_clocked_in")
+    if at <= latest[1]:
+        return PunchResult("out_of_order", latest[0])
+    Q.clock_out_workday(conn, workday_id=latest[0], clock_out=at)
+    rollups.refresh(conn, user_id, [latest[1].date()])
+    events.publish(conn, "clock_out", latest[0])
+    return PunchResult("ok", latest[0])
@@ -0,0 +1,384 @@
+"""Scheduled maintenance jobs, run by one worker process.
+
+- auto-clock-out: opt-in, workdays left open for the configured hours
+  (AUTO_CLOCK_OUT_HOURS is a sensible value) are clocked out at the end of
+  the shift they were planned for (see shifts.py), or at their clock in when
+  none was, so nobody gets paid hours nobody confirmed. Their notes say so
+  and they show up on the current timesheet.
+- checkpoint: `wal_checkpoint(TRUNCATE)` once the WAL file hasn't been
+  written for QUIET_SECONDS. Connections are cached and long lived, so the
+  automatic checkpoints rarely get the file back to zero.
+- backup: an online backup to TIMECLOCK_BACKUP_PATH every BACKUP_SECONDS,
+  copied BACKUP_PAGES pages at a time with a pause in between so requests
+  still get the write lock.
+
+Every worker process runs a `_Scheduler` thread, the one holding an
+exclusive lock on TIMECLOCK_SCHEDULER_LOCK runs the jobs of every database
+and the others check again each tick, so a recycled leader is replaced
+within TICK_SECONDS. Each job's last run, duration and result is kept in
+the maintenance_run table and logged.
+"""
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Callable, List, Optional
+
+import pendulum
+from flask import Flask
+
+from . import events, rollups, shifts, tenants
+from .db import (
+    CONNECTIONS,
+    DEFAULT_DB_FILE,
+    Q,
+    archive_path,
+    class_row,
+    db_conn,
+    get_db_file,
+    transaction,
+    use_db,
+)
+
+TICK_SECONDS = 60
+AUTO_CLOCK_OUT_HOURS = 16
+AUTO_CLOCK_OUT_NOTE = "[clocked out automatically]"
+# Workdays clocked out per transaction
+BATCH_SIZE = 100
+QUIET_SECONDS = 30
+BACKUP_SECONDS = 6 * 60 * 60
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.05
+DEFAULT_LOCK_FILE = "timeclock-scheduler.lock"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """A maintenance job.
+
+    Attributes:
+        name (str): The job's name.
+        every (float): Seconds between runs.
+        run (Callable[[], str]): Runs the job on the current database and
+            says what it did.
+    """
+
+    name: str
+    every: float
+    run: Callable[[], str]
+
+
+@dataclass
+class Run:
+    """The last run of a job on a database.
+
+    Attributes:
+        job (str): The job's name.
+        started (float): When it started, unix time.
+        seconds (float): How long it took.
+        result (str): What it did.
+        error (Optional[str]): Why it failed.
+    """
+
+    job: str
+    started: float
+    seconds: float
+    result: str = ""
+    error: Optional[str] = None
+
+
+def clock_out_at(
+    user_id: int, clock_in: pendulum.DateTime, now: float
+) -> pendulum.DateTime:
+    """When a forgotten workday is clocked out.
+
+    At the end of the planned shift it was clocked in for (up to an hour
+    early counts), otherwise at its clock in.
+    """
+    day = clock_in.date()
+    start = clock_in.int_timestamp
+    for shift in shifts.get_shifts(day.subtract(days=1), day, user_id):
+        if shift.start - 3600 <= start < shift.end <= now:
+            return clock_in.add(seconds=shift.end - start)
+    return clock_in
+
+
+def auto_clock_out(
+    hours: float = AUTO_CLOCK_OUT_HOURS, now: Optional[float] = None
+) -> int:
+    """Clock out the workdays of the current database open for *hours*.
+
+    Returns:
+        int: How many workdays were clocked out.
+    """
+    now = time.time() if now is None else now
+    closed = 0
+    while True:
+        with db_conn() as conn:
+            forgotten = Q.get_forgotten_workdays(
+                conn, before=int(now - hours * 3600), limit=BATCH_SIZE
+            )
+        if not forgotten:
+            return closed
+        clock_outs = [
+            (workday_id, user_id, clock_in, clock_out_at(user_id, clock_in, now))
+            for workday_id, user_id, clock_in in forgotten
+        ]
+        with db_conn() as conn:
+            with transaction(conn):
+                for workday_id, user_id, clock_in, clock_out in clock_outs:
+                    if Q.auto_clock_out_workday(
+                        conn,
+                        workday_id=workday_id,
+                        clock_out=clock_out,
+                        note=AUTO_CLOCK_OUT_NOTE,
+                    ):
+                        rollups.refresh(conn, user_id, [clock_in.date()])
+                        events.publish(conn, "clock_out", workday_id)
+                        closed += 1
+        if len(forgotten) < BATCH_SIZE:
+            return closed
+
+
+def checkpoint(quiet: float = QUIET_SECONDS) -> str:
+    """Truncate the current database's WAL files if they're quiet.
+
+    Returns:
+        str: What was done per database file.
+    """
+    db_file = get_db_file()
+    done = []
+    for schema, path in (("main", db_file), ("archive", archive_path(db_file))):
+        wal = Path(f"{path}-wal")
+        try:
+            st = wal.stat()
+        except FileNotFoundError:
+            continue
+        if not st.st_size:
+            continue
+        idle = time.time() - st.st_mtime
+        if idle < quiet:
+            done.append(f"{schema}: written {idle:.0f}s ago")
+            continue
+        with db_conn() as conn:
+            busy, frames, _ = conn.execute(
+                f"PRAGMA {schema}.wal_checkpoint(TRUNCATE);"
+            ).fetchone()
+        if busy:
+            done.append(f"{schema}: {frames} frames, readers in the way")
+        else:
+            done.append(f"{schema}: truncated {st.st_size} bytes")
+    return "; ".join(done) or "nothing to do"
+
+
+def backup(
+    backup_path: Path, pages: int = BACKUP_PAGES, sleep: float = BACKUP_SLEEP
+) -> str:
+    """Copy the current database (and its archive) into *backup_path*.
+
+    The copy is written next to the last one and replaces it once complete,
+    there's always a whole backup. A write by another connection during the
+    copy makes SQLite start over, the pause between steps keeps those rare.
+
+    Returns:
+        str: The backup files and their sizes.
+    """
+    db_file = get_db_file()
+    backup_path.mkdir(parents=True, exist_ok=True)
+    dest = backup_path / db_file.name
+    copied = []
+    for schema, target in (("main", dest), ("archive", archive_path(dest))):
+        if schema == "archive" and not archive_path(db_file).exists():
+            continue
+        tmp = target.with_name(f".{target.name}.tmp")
+        tmp.unlink(missing_ok=True)
+        copy = sqlite3.connect(tmp)
+        try:
+            with db_conn() as conn:
+                conn.backup(copy, pages=pages, name=schema, sleep=sleep)
+        finally:
+            copy.close()
+        os.replace(tmp, target)
+        copied.append(f"{target.name} {target.stat().st_size} bytes")
+    return "; ".join(copied)
+
+
+def get_runs() -> List[Run]:
+    """The last run of every job on the current database."""
+    with db_conn(row_factory=class_row(Run)) as conn:
+        return Q.get_maintenance_runs(conn)
+
+
+def run_due(jobs: List[Job], now: Optional[float] = None) -> List[Run]:
+    """Run the jobs due on the current database and record their runs.
+
+    Returns:
+        List[Run]: The runs, failed ones have their error.
+    """
+    now = time.time() if now is None else now
+    last = {run.job: run.started for run in get_runs()}
+    runs = []
+    for job in jobs:
+        if job.name in last and last[job.name] + job.every > now:
+            continue
+        runs.append(run_job(job))
+    return runs
+
+
+def run_job(job: Job) -> Run:
+    """Run a job on the current database, time it and record the run."""
+    started = time.time()
+    start = time.perf_counter()
+    run = Run(job.name, started, 0.0)
+    try:
+        run.result = job.run()
+    except Exception as exc:
+        logger.exception("Maintenance job %s of %s failed", job.name, get_db_file())
+        run.error = f"{type(exc).__name__}: {exc}"
+    run.seconds = time.perf_counter() - start
+    logger.info(
+        "Maintenance job %s of %s took %.3fs: %s",
+        job.name,
+        get_db_file(),
+        run.seconds,
+        run.error or run.result,
+    )
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.record_maintenance_run(
+                conn,
+                job=run.job,
+                started=run.started,
+                seconds=run.seconds,
+                result=run.result,
+                error=run.error,
+            )
+    return run
+
+
+def jobs(
+    auto_clock_out_hours: Optional[float],
+    backup_path: Optional[Path],
+    backup_seconds: float = BACKUP_SECONDS,
+) -> List[Job]:
+    """The jobs to run, auto clock-out and backup only when configured."""
+    # The checkpoint goes first, recording the other jobs' runs writes to
+    # the WAL and would make it look busy
+    scheduled = [Job("checkpoint", TICK_SECONDS, checkpoint)]
+    if auto_clock_out_hours:
+        hours = auto_clock_out_hours
+        scheduled.append(
+            Job(
+                "auto-clock-out",
+                5 * 60,
+                lambda: f"clocked out {auto_clock_out(hours)} workdays",
+            )
+        )
+    if backup_path:
+        path = backup_path
+        scheduled.append(Job("backup", backup_seconds, lambda: backup(path)))
+    return scheduled
+
+
+class _Scheduler:
+    """Background thread running the jobs while this process is the leader.
+
+    Started by the first request of a process, so uWSGI workers forked from
+    the master each get their own, only the one holding the lock runs jobs.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = 0
+        self._leader: Optional[IO[bytes]] = None
+
+    def start(
+        self, lock_path: Path, db_files: Callable[[], List[Path]], jobs: List[Job]
+    ) -> None:
+        """Start this process's thread unless it's running."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # A forked process isn't the leader, even if its parent was
+            self._leader = None
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(lock_path, db_files, jobs),
+                name="timeclock-maintenance",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def lead(self, lock_path: Path) -> bool:
+        """Whether this process runs the jobs, taking the lock if it's free."""
+        if self._leader is not None:
+            return True
+        f = open(lock_path, "ab")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        # Released when the process exits
+        self._leader = f
+        logger.info("Worker %s runs the maintenance jobs", os.getpid())
+        return True
+
+    def _run(
+        self, lock_path: Path, db_files: Callable[[], List[Path]], jobs: List[Job]
+    ) -> None:
+        try:
+            while True:
+                if self.lead(lock_path):
+                    for db_file in db_files():
+                        try:
+                            with use_db(db_file):
+                                run_due(jobs)
+                        except Exception:
+                            logger.exception("Maintenance of %s failed", db_file)
+                time.sleep(TICK_SECONDS)
+        finally:
+            CONNECTIONS.clear()
+
+
+SCHEDULER = _Scheduler()
+
+
+def init_app(
+    app: Flask,
+    enabled: bool,
+    lock_path: Optional[Path],
+    auto_clock_out_hours: Optional[float],
+    backup_path: Optional[Path],
+    backup_seconds: float,
+) -> None:
+    """Run the maintenance jobs in one of the processes serving *app*.
+
+    Call after tenants.init_app, every tenant's database is maintained.
+    """
+    app.config["MAINTENANCE"] = enabled
+    if not enabled:
+        return
+    scheduled = jobs(auto_clock_out_hours, backup_path, backup_seconds)
+    tenants_dir = app.config.get("TENANTS_DIR")
+    lock = lock_path or (tenants_dir or DEFAULT_DB_FILE.parent) / DEFAULT_LOCK_FILE
+
+    def db_files() -> List[Path]:
+        if tenants_dir:
+            return tenants.db_files(tenants_dir)
+        return [DEFAULT_DB_FILE]
+
+    def start() -> None:
+        SCHEDULER.start(lock, db_files, scheduled)
+
+    app.before_request(start)
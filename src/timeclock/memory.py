@@ -0,0 +1,159 @@
+"""Worker memory introspection and recycling.
+
+Start the app with PYTHONTRACEMALLOC=<frames> to trace allocations. uWSGI
+forks the workers from the master, so they inherit the tracing. Snapshots of
+a worker are written to SNAPSHOT_DIR so any worker (or `timeclock-cli
+memory-top` / `memory-diff`) can read them back and compare two of them.
+
+With TIMECLOCK_MAX_RSS_MB set, a worker whose resident memory grew over the
+limit logs why and recycles itself after the response.
+"""
+from __future__ import annotations
+
+import os
+import re
+import signal
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from flask import Flask, current_app
+from werkzeug import Response
+
+try:
+    import uwsgi
+except ImportError:
+    uwsgi = None
+
+DEFAULT_SNAPSHOT_DIR = Path(tempfile.gettempdir()) / "timeclock-snapshots"
+SNAPSHOT_RE = re.compile(r"^\d+-\d+\.tracemalloc$")
+# Only look at RSS every this many requests
+CHECK_EVERY = 10
+# Allocations made by tracemalloc and the import system aren't ours
+IGNORE = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def rss_mb() -> Optional[float]:
+    """Resident memory of this process in MB, None where /proc isn't there."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def snapshot_path(snapshot_dir: Path, name: str) -> Path:
+    """Return the file of the snapshot called *name*.
+
+    Raises:
+        ValueError: If *name* isn't a snapshot name.
+    """
+    if not SNAPSHOT_RE.match(name):
+        raise ValueError(f"Invalid snapshot name {name!r}")
+    return snapshot_dir / name
+
+
+def take_snapshot(snapshot_dir: Path) -> str:
+    """Save a snapshot of this process's traced allocations.
+
+    Raises:
+        RuntimeError: If tracemalloc isn't tracing.
+
+    Returns:
+        str: The snapshot name, <pid>-<unix time in ms>.tracemalloc
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("Start with PYTHONTRACEMALLOC=<frames> to trace memory")
+    snapshot_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+    name = f"{os.getpid()}-{time.time_ns() // 1_000_000}.tracemalloc"
+    tracemalloc.take_snapshot().dump(str(snapshot_dir / name))
+    return name
+
+
+def list_snapshots(snapshot_dir: Path) -> List[str]:
+    """Names of the saved snapshots, oldest first per process."""
+    if not snapshot_dir.exists():
+        return []
+    return sorted(p.name for p in snapshot_dir.iterdir() if SNAPSHOT_RE.match(p.name))
+
+
+def _load(path: Path) -> tracemalloc.Snapshot:
+    return tracemalloc.Snapshot.load(str(path)).filter_traces(IGNORE)
+
+
+def top(path: Path, limit: int = 20) -> List[Dict]:
+    """The allocation sites holding the most memory in a snapshot."""
+    stats = _load(path).statistics("lineno")
+    return [
+        dict(site=str(stat.traceback), size_kb=stat.size / 1024, count=stat.count)
+        for stat in stats[:limit]
+    ]
+
+
+def diff(old: Path, new: Path, limit: int = 20) -> List[Dict]:
+    """The allocation sites that grew (or shrank) the most between snapshots."""
+    stats = _load(new).compare_to(_load(old), "lineno")
+    return [
+        dict(
+            site=str(stat.traceback),
+            size_kb=stat.size / 1024,
+            size_diff_kb=stat.size_diff / 1024,
+            count_diff=stat.count_diff,
+        )
+        for stat in stats[:limit]
+    ]
+
+
+class _Recycler:
+    """Recycle this worker once its RSS is over the limit."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.recycling = False
+
+    def check(self, response: Response) -> Response:
+        max_rss = current_app.config["MAX_RSS_MB"]
+        self.requests += 1
+        if self.recycling or self.requests % CHECK_EVERY:
+            return response
+        rss = rss_mb()
+        if rss is None or rss < max_rss:
+            return response
+        self.recycling = True
+        reason = (
+            f"worker {os.getpid()} RSS {rss:.1f}MB is over TIMECLOCK_MAX_RSS_MB="
+            f"{max_rss} after {self.requests} requests"
+        )
+        if tracemalloc.is_tracing():
+            stats = tracemalloc.take_snapshot().filter_traces(IGNORE)
+            sites = stats.statistics("lineno")[:5]
+            reason += "; top allocations: " + ", ".join(
+                f"{s.traceback} {s.size / 1024:.0f}KB" for s in sites
+            )
+        if uwsgi is None:
+            current_app.logger.warning("%s; not under uWSGI, not recycling", reason)
+            return response
+        current_app.logger.warning("%s; recycling", reason)
+        # uWSGI workers treat SIGHUP as "finish the current requests and
+        # exit", the master forks a fresh worker.
+        os.kill(os.getpid(), signal.SIGHUP)
+        return response
+
+
+RECYCLER = _Recycler()
+
+
+def init_app(app: Flask, max_rss_mb: Optional[float], snapshot_dir: Path) -> None:
+    """Configure snapshots and, with *max_rss_mb*, worker recycling."""
+    app.config["MEMORY_SNAPSHOT_DIR"] = snapshot_dir
+    app.config["MAX_RSS_MB"] = max_rss_mb
+    if max_rss_mb:
+        app.after_request(RECYCLER.check)
@@ -0,0 +1,520 @@
+"""Printable PDFs of saved timesheets for payroll, rendered in the background.
+
+`TimeSheet.save` queues a job in the pdf_job table in the same transaction
+as the timesheet and wakes a thread of the worker process that saved it,
+which renders the PDF with Pillow while the request has long returned. Jobs
+live in the database so a job whose worker died is picked up again by the
+next one, and any process can claim a job without another doing it twice.
+A job failed MAX_ATTEMPTS times stays failed until `timeclock-cli render-pdfs
+--retry-failed`, asking for its PDF again gets its error.
+
+PDFs are stored in PDF_PATH as <sha256>.pdf. Rendering the same timesheet
+again gives the same bytes, so a re-render never duplicates a file and a
+PDF is served from the file as long as it exists.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pendulum
+from flask import Flask, current_app, has_app_context
+from werkzeug.utils import secure_filename
+
+from . import tenants
+from .db import CONNECTIONS, Q, class_row, db_conn, get_db_file, transaction, use_db
+
+if TYPE_CHECKING:
+    from .timesheet import TimeSheet
+
+DEFAULT_PDF_PATH = "pdfs"
+# A job is failed for good after this many attempts
+MAX_ATTEMPTS = 3
+# A job running for longer than this belongs to a worker that died
+STALE_SECONDS = 10 * 60
+# The worker thread exits after this long without jobs
+IDLE_SECONDS = 60
+
+# US Letter at 100 dpi
+DPI = 100
+PAGE_SIZE = (850, 1100)
+MARGIN = 50
+FONT_SIZE = 14
+TITLE_SIZE = 22
+LINE_HEIGHT = 20
+THUMB_SIZE = 110
+GAP = 10
+# x of the date, clock in, clock out, hours and notes columns
+COLUMNS = (MARGIN, 210, 290, 370, 440)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """The state of a timesheet's PDF.
+
+    Attributes:
+        status (str): queued, running, done or failed.
+        sha256 (Optional[str]): Digest of the PDF once it's done.
+        error (Optional[str]): Why the last attempt failed.
+    """
+
+    status: str
+    sha256: Optional[str]
+    error: Optional[str]
+
+    @property
+    def filename(self) -> str:
+        """Content addressed filename of the PDF in PDF_PATH."""
+        return f"{self.sha256}.pdf"
+
+    def ready(self, pdf_path: Path) -> bool:
+        """Whether the PDF can be served from *pdf_path*."""
+        return self.status == "done" and (pdf_path / self.filename).exists()
+
+
+@dataclass
+class PeriodPdf(Job):
+    """A saved timesheet of a pay period and the state of its PDF.
+
+    Attributes:
+        id (int): The timesheet.
+        username (str): The timesheet's user.
+        start (str): Day of its first workday, YYYY-MM-DD.
+        end (str): Day of its last workday, YYYY-MM-DD.
+    """
+
+    id: int = 0
+    username: str = ""
+    start: str = ""
+    end: str = ""
+
+    @property
+    def archive_name(self) -> str:
+        """Name of the PDF in a pay period's zip file."""
+        return secure_filename(f"{self.username}-{self.start}-{self.end}-{self.id}.pdf")
+
+
+def queue(
+    conn: Any, timesheet_id: int, force: bool = False, retry: bool = False
+) -> None:
+    """Queue rendering the timesheet's PDF.
+
+    Call inside the transaction saving the timesheet, then `wake` the worker
+    once it's committed. A done job is only queued again with *force* and a
+    failed one with *retry*.
+    """
+    Q.queue_pdf(
+        conn, timesheet_id=timesheet_id, now=time.time(), force=force, retry=retry
+    )
+
+
+def request_pdfs(timesheet_ids: Iterable[int], pdf_path: Path) -> None:
+    """Queue the PDFs of the timesheets that aren't ready and wake the worker.
+
+    A timesheet is queued if it never had a job or its done PDF is missing
+    from *pdf_path*. Ready, queued, running and failed jobs are left alone.
+    """
+    with db_conn(row_factory=class_row(Job)) as conn:
+        with transaction(conn):
+            for timesheet_id in timesheet_ids:
+                job = Q.get_pdf_job(conn, timesheet_id=timesheet_id)
+                if job is None or (job.status == "done" and not job.ready(pdf_path)):
+                    queue(conn, timesheet_id, force=True)
+    wake()
+
+
+def retry_failed() -> int:
+    """Queue every failed job again with MAX_ATTEMPTS new attempts.
+
+    Returns:
+        int: How many were queued.
+    """
+    with db_conn() as conn:
+        with transaction(conn):
+            return Q.retry_failed_pdfs(conn, now=time.time())
+
+
+def queue_missing() -> int:
+    """Queue every saved timesheet that never had a PDF, e.g. older ones.
+
+    Returns:
+        int: How many were queued.
+    """
+    with db_conn() as conn:
+        with transaction(conn):
+            return Q.queue_missing_pdfs(conn, now=time.time())
+
+
+def get_job(timesheet_id: int) -> Optional[Job]:
+    """The timesheet's PDF job, None if it was never queued."""
+    with db_conn(row_factory=class_row(Job)) as conn:
+        return Q.get_pdf_job(conn, timesheet_id=timesheet_id)
+
+
+def timesheet_user_id(timesheet_id: int) -> Optional[int]:
+    """The user a saved timesheet belongs to, None if there's no such timesheet."""
+    with db_conn() as conn:
+        row = Q.get_timesheet_user(conn, timesheet_id=timesheet_id)
+    return row[0] if row else None
+
+
+def pay_period(start: pendulum.Date, end: pendulum.Date) -> List[PeriodPdf]:
+    """Saved timesheets whose last workday is from *start* to *end*."""
+    with db_conn() as conn:
+        rows = Q.get_pay_period_pdfs(conn, start=start, end=end)
+    return [
+        PeriodPdf(
+            id=id,
+            username=username,
+            start=first,
+            end=last,
+            status=status or "",
+            sha256=sha256,
+            error=error,
+        )
+        for id, username, first, last, status, sha256, error in rows
+    ]
+
+
+def write_zip(f: IO[bytes], pdf_path: Path, timesheets: List[PeriodPdf]) -> None:
+    """Write the ready PDFs of *timesheets* to a zip file.
+
+    PDFs are stored as is, their pages are already compressed.
+    """
+    with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED) as zf:
+        for ts in timesheets:
+            zf.write(pdf_path / ts.filename, arcname=ts.archive_name)
+
+
+def _wrap(text: str, font: Any, width: float) -> List[str]:
+    """Break *text* into lines no wider than *width*, words aren't split."""
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and font.getlength(candidate) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def render(timesheet: TimeSheet, username: str, upload_path: Path) -> bytes:
+    """Render a saved timesheet, its notes and photo thumbnails as a PDF.
+
+    Every workday gets a row, followed by thumbnails of its photos. The last
+    page has the owner's notes and lines to sign off. The PDF's dates are
+    the timesheet's last clock out, so the same timesheet always renders to
+    the same bytes.
+
+    Args:
+        timesheet (TimeSheet): A saved timesheet.
+        username (str): The timesheet's user.
+        upload_path (Path): Where the photos are.
+
+    Returns:
+        bytes: The PDF.
+    """
+    # PIL is only needed here, don't make every worker pay for importing it
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = ImageFont.load_default(size=FONT_SIZE)
+    title_font = ImageFont.load_default(size=TITLE_SIZE)
+    right = PAGE_SIZE[0] - MARGIN
+    pages: List[Image.Image] = []
+    y = PAGE_SIZE[1]
+
+    def room(height: int) -> ImageDraw.ImageDraw:
+        """Start a new page unless *height* fits on this one."""
+        nonlocal y
+        if y + height > PAGE_SIZE[1] - MARGIN:
+            pages.append(Image.new("RGB", PAGE_SIZE, "white"))
+            y = MARGIN
+        return ImageDraw.Draw(pages[-1])
+
+    def row(
+        cells: Iterable[Tuple[int, str]],
+        row_font: Any = font,
+        line_height: int = LINE_HEIGHT,
+    ) -> None:
+        """Draw (x, text) cells side by side, wrapping each to its column."""
+        nonlocal y
+        columns = list(cells)
+        edges = [x for x, _ in columns[1:]] + [right]
+        wrapped = [
+            (x, _wrap(text, row_font, edge - x - GAP))
+            for (x, text), edge in zip(columns, edges)
+        ]
+        height = max(len(lines) for _, lines in wrapped) * line_height
+        draw = room(height)
+        for x, lines in wrapped:
+            for n, text in enumerate(lines):
+                draw.text((x, y + n * line_height), text, font=row_font, fill="black")
+        y += height
+
+    def thumbnails(filenames: List[str]) -> None:
+        nonlocal y
+        step = THUMB_SIZE + GAP
+        per_row = (right - COLUMNS[1]) // step
+        for i in range(0, len(filenames), per_row):
+            draw = room(step)
+            for n, filename in enumerate(filenames[i:i + per_row]):
+                x = COLUMNS[1] + n * step
+                try:
+                    with Image.open(upload_path / filename) as photo:
+                        photo.draft("RGB", (THUMB_SIZE, THUMB_SIZE))
+                        photo.thumbnail((THUMB_SIZE, THUMB_SIZE))
+                        pages[-1].paste(photo.convert("RGB"), (x, y))
+                except (OSError, SyntaxError):
+                    # Deleted by hand or never finished uploading
+                    draw.rectangle(
+                        (x, y, x + THUMB_SIZE, y + THUMB_SIZE), outline="black"
+                    )
+                    draw.text((x + GAP, y + GAP), "missing", font=font, fill="black")
+            y += step
+
+    row(
+        [(MARGIN, f"Timesheet #{timesheet.id}: {username}")],
+        title_font,
+        TITLE_SIZE + GAP,
+    )
+    row(
+        [
+            (
+                MARGIN,
+                f"{timesheet.start_date} to {timesheet.end_date}, "
+                f"{timesheet.hours} hours",
+            )
+        ]
+    )
+    y += LINE_HEIGHT
+    row(zip(COLUMNS, ("Date", "In", "Out", "Hours", "Notes")))
+    ImageDraw.Draw(pages[-1]).line((MARGIN, y, right, y), fill="black")
+    y += GAP
+    for wd in timesheet.work_days:
+        row(
+            zip(
+                COLUMNS,
+                (
+                    wd.clock_in.format("ddd YYYY-MM-DD"),
+                    wd.clock_in.format("HH:mm"),
+                    wd.clock_out.format("HH:mm") if wd.clock_out else "",
+                    str(wd.hours),
+                    wd.notes or "",
+                ),
+            )
+        )
+        thumbnails([p.filename for p in wd.photos])
+    y += LINE_HEIGHT
+    # Keep the totals, notes and signatures on one page
+    room(8 * LINE_HEIGHT)
+    row([(MARGIN, f"Total hours: {timesheet.hours}")])
+    row([(MARGIN, f"Notes: {timesheet.notes or ''}")])
+    y += LINE_HEIGHT
+    for signer in ("Employee", "Signed off by"):
+        y += LINE_HEIGHT
+        row([(MARGIN, f"{signer} " + "_" * 30), (COLUMNS[3], "Date " + "_" * 15)])
+
+    for n, page in enumerate(pages, start=1):
+        ImageDraw.Draw(page).text(
+            (right, PAGE_SIZE[1] - MARGIN // 2),
+            f"Page {n} of {len(pages)}",
+            font=font,
+            fill="black",
+            anchor="rs",
+        )
+    last = max(wd.clock_out or wd.clock_in for wd in timesheet.work_days)
+    stamp = time.gmtime(last.int_timestamp)
+    buf = io.BytesIO()
+    try:
+        pages[0].save(
+            buf,
+            format="PDF",
+            resolution=DPI,
+            save_all=True,
+            append_images=pages[1:],
+            title=f"Timesheet #{timesheet.id}",
+            author=username,
+            creationDate=stamp,
+            modDate=stamp,
+        )
+        return buf.getvalue()
+    finally:
+        for page in pages:
+            page.close()
+
+
+def store(pdf_path: Path, data: bytes) -> str:
+    """Save a PDF under its sha256 unless that file already exists.
+
+    Returns:
+        str: The sha256, the file is <sha256>.pdf in *pdf_path*.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    dest = pdf_path / f"{sha256}.pdf"
+    if dest.exists():
+        return sha256
+    pdf_path.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(prefix=".pdf-", dir=pdf_path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # Readers never see a half written file
+        os.replace(name, dest)
+    except:  # noqa: E722
+        os.unlink(name)
+        raise
+    return sha256
+
+
+def run_job(timesheet_id: int, upload_path: Path, pdf_path: Path) -> str:
+    """Render and store the PDF of a saved timesheet.
+
+    Raises:
+        LookupError: If there's no such timesheet.
+
+    Returns:
+        str: The PDF's sha256.
+    """
+    # timesheet.py queues jobs, import it once one runs
+    from .timesheet import TimeSheet
+
+    with db_conn() as conn:
+        user = Q.get_timesheet_user(conn, timesheet_id=timesheet_id)
+    if user is None:
+        raise LookupError(f"No saved timesheet {timesheet_id}")
+    timesheet = TimeSheet.from_id(timesheet_id)
+    return store(pdf_path, render(timesheet, user[1], upload_path))
+
+
+def run_jobs(upload_path: Path, pdf_path: Path, limit: Optional[int] = None) -> int:
+    """Run queued PDF jobs of the current database until none are left.
+
+    A job that raises is queued again, after MAX_ATTEMPTS it's failed and
+    its error is kept.
+
+    Args:
+        upload_path (Path): Where the photos are.
+        pdf_path (Path): Where the PDFs go.
+        limit (Optional[int]): Max number of jobs to run.
+
+    Returns:
+        int: How many jobs ran, successful or not.
+    """
+    ran = 0
+    while limit is None or ran < limit:
+        now = time.time()
+        with db_conn() as conn:
+            with transaction(conn):
+                timesheet_id = Q.claim_pdf_job(
+                    conn,
+                    now=now,
+                    stale=now - STALE_SECONDS,
+                    max_attempts=MAX_ATTEMPTS,
+                )
+        if timesheet_id is None:
+            break
+        ran += 1
+        try:
+            sha256 = run_job(timesheet_id, upload_path, pdf_path)
+        except Exception as exc:
+            logger.exception("PDF of timesheet %s failed", timesheet_id)
+            with db_conn() as conn:
+                with transaction(conn):
+                    Q.fail_pdf_job(
+                        conn,
+                        timesheet_id=timesheet_id,
+                        error=f"{type(exc).__name__}: {exc}",
+                        now=time.time(),
+                        max_attempts=MAX_ATTEMPTS,
+                    )
+            continue
+        with db_conn() as conn:
+            with transaction(conn):
+                Q.finish_pdf_job(conn, timesheet_id=timesheet_id, sha256=sha256)
+    return ran
+
+
+def counts() -> Dict[str, int]:
+    """How many PDF jobs there are per status."""
+    with db_conn() as conn:
+        return dict(Q.count_pdf_jobs(conn))
+
+
+class _Worker:
+    """Background thread running the jobs of the databases it was woken for.
+
+    Started by the first `wake` of a process, so uWSGI workers forked from
+    the master each get their own. It exits after IDLE_SECONDS without a
+    wake and the next one starts it again.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._woken = threading.Event()
+        self._targets: Set[Tuple[Path, Path, Path]] = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def wake(self, db_file: Path, upload_path: Path, pdf_path: Path) -> None:
+        """Run the jobs of *db_file* soon."""
+        with self._lock:
+            self._targets.add((db_file, upload_path, pdf_path))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="timeclock-pdfs", daemon=True
+                )
+                self._thread.start()
+        self._woken.set()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                self._woken.wait(IDLE_SECONDS)
+                self._woken.clear()
+                with self._lock:
+                    targets, self._targets = self._targets, set()
+                    if not targets:
+                        self._thread = None
+                        return
+                for db_file, upload_path, pdf_path in targets:
+                    try:
+                        with use_db(db_file):
+                            run_jobs(upload_path, pdf_path)
+                    except Exception:
+                        logger.exception("PDF jobs of %s failed", db_file)
+        finally:
+            CONNECTIONS.clear()
+
+
+WORKER = _Worker()
+
+
+def wake() -> None:
+    """Have this process's worker thread run the current database's jobs.
+
+    Does nothing outside the app or with PDF_WORKER off, e.g. in tests or
+    when `timeclock-cli render-pdfs` runs the jobs instead.
+    """
+    if not has_app_context() or not current_app.config["PDF_WORKER"]:
+        return
+    WORKER.wake(get_db_file(), tenants.upload_path(), tenants.pdf_path())
+
+
+def init_app(app: Flask, pdf_path: Path, worker: bool) -> None:
+    """Store PDFs in *pdf_path*, rendered by a thread if *worker* is set."""
+    app.config["PDF_PATH"] = pdf_path
+    app.config["PDF_WORKER"] = worker
@@ -0,0 +1,276 @@
+"""Photo upload processing."""
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, List
+
+from .db import Q, db_conn, transaction
+
+DEFAULT_UPLOAD_PATH = "src/timeclock/static/uploads"
+
+# Read/write uploads in 64KB pieces so a whole image is never held in memory
+CHUNK_SIZE = 64 * 1024
+# Saved photos are 1/REDUCE_FACTOR the width and height of the original
+REDUCE_FACTOR = 4
+# Magic bytes at the start of every file PIL is allowed to decode
+SIGNATURES = {
+    b"\xff\xd8\xff": "JPEG",
+    b"\x89PNG\r\n\x1a\n": "PNG",
+}
+# Photos are stored as <sha256><extension>
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png"}
+# Files younger than this are left alone by the garbage collector because
+# their upload may still be in progress.
+GC_GRACE_SECONDS = 60 * 60
+
+
+class InvalidImageError(ValueError):
+    """Raised when an uploaded file is not a JPEG or PNG image."""
+
+    pass
+
+
+@dataclass
+class Upload:
+    """An uploaded file spooled to disk.
+
+    Attributes:
+        path (Path): The temporary file holding the uploaded bytes.
+        sha256 (str): Hex digest of the uploaded bytes.
+        format (str): The PIL format name detected from the file header.
+    """
+
+    path: Path
+    sha256: str
+    format: str
+
+    @property
+    def filename(self) -> str:
+        """Content addressed filename for the processed photo."""
+        return f"{self.sha256}{EXTENSIONS[self.format]}"
+
+    def discard(self) -> None:
+        """Remove the temporary file."""
+        self.path.unlink(missing_ok=True)
+
+
+def sniff_format(header: bytes) -> str:
+    """Return the PIL format name for the file header.
+
+    Raises:
+        InvalidImageError: If the header does not match an allowed format.
+    """
+    for signature, format in SIGNATURES.items():
+        if header.startswith(signature):
+            return format
+    raise InvalidImageError("The file is not an image")
+
+
+def spool(stream: IO[bytes], directory: Path) -> Upload:
+    """Copy the upload stream to a temporary file in chunks.
+
+    The header is checked before anything is written so non-images are
+    rejected without touching the disk. The sha256 of the file is computed
+    while copying.
+
+    Args:
+        stream (IO[bytes]): The uploaded file stream.
+        directory (Path): Where to create the temporary file. Use the upload
+            directory so the file can be cheaply renamed into place.
+
+    Raises:
+        InvalidImageError: If the file is not a JPEG or PNG.
+    """
+    chunk = stream.read(CHUNK_SIZE)
+    format = sniff_format(chunk)
+    digest = hashlib.sha256()
+    fd, name = tempfile.mkstemp(prefix=".upload-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk:
+                digest.update(chunk)
+                f.write(chunk)
+                chunk = stream.read(CHUNK_SIZE)
+    except:  # noqa: E722
+        os.unlink(name)
+        raise
+    return Upload(Path(name), digest.hexdigest(), format)
+
+
+def save_reduced(upload: Upload, dest: Path) -> None:
+    """Decode the upload at reduced size and save it to *dest*.
+
+    JPEGs are decoded with `Image.draft` so the decoder does the downscaling
+    and the full resolution image is never allocated. PNGs have no draft mode
+    and are reduced after decoding.
+
+    Raises:
+        InvalidImageError: If PIL can't decode the file.
+    """
+    # PIL is only needed here, don't make every worker pay for importing it
+    from PIL import Image
+
+    try:
+        with Image.open(upload.path, formats=[upload.format]) as image:
+            width = image.width
+            if image.format == "JPEG":
+                image.draft(
+                    image.mode,
+                    (
+                        max(image.width // REDUCE_FACTOR, 1),
+                        max(image.height // REDUCE_FACTOR, 1),
+                    ),
+                )
+            # What is left to reduce after the decoder's own downscaling
+            factor = max(REDUCE_FACTOR // round(width / image.width), 1)
+            reduced = image.reduce(factor) if factor > 1 else image
+            try:
+                reduced.save(dest, format=upload.format)
+            finally:
+                # Free the pixel buffer now instead of whenever it's collected
+                reduced.close()
+    except (OSError, SyntaxError) as exc:
+        dest.unlink(missing_ok=True)
+        raise InvalidImageError("The file is not an image") from exc
+
+
+@dataclass
+class GCReport:
+    """What one pass of `collect_garbage` did.
+
+    Attributes:
+        files_checked (int): Files in the upload directory looked at.
+        rows_checked (int): Rows in the photo table looked at.
+        removed (List[str]): Files deleted from the upload directory.
+        missing (List[str]): Photos in the database without a file.
+        files_done (bool): The file cursor reached the end of the directory
+            and was reset.
+        rows_done (bool): The row cursor reached the end of the photo table
+            and was reset.
+    """
+
+    files_checked: int = 0
+    rows_checked: int = 0
+    removed: List[str] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    files_done: bool = False
+    rows_done: bool = False
+
+
+def remove_files(upload_path: Path, filenames: List[str]) -> List[str]:
+    """Delete photo files, returning the names that were actually removed."""
+    removed = []
+    for filename in filenames:
+        try:
+            (upload_path / filename).unlink()
+        except FileNotFoundError:
+            continue
+        removed.append(filename)
+    return removed
+
+
+def _collect_files(
+    upload_path: Path, batch_size: int, report: GCReport
+) -> bool:
+    """Remove files that have no row in the photo table.
+
+    Files are visited in name order starting after the saved cursor. Only the
+    names are read from the directory, files are only stat()ed when they are
+    candidates for deletion.
+
+    Returns:
+        bool: Whether the end of the directory was reached.
+    """
+    key = "photo_gc.file_cursor"
+    with db_conn() as conn:
+        cursor = Q.get_state(conn, key=key) or ""
+    with os.scandir(upload_path) as entries:
+        names = heapq.nsmallest(
+            batch_size, (e.name for e in entries if e.name > cursor and e.is_file())
+        )
+    report.files_checked += len(names)
+    with db_conn() as conn:
+        unknown = [
+            r[0] for r in Q.get_unknown_filenames(conn, filenames=json.dumps(names))
+        ]
+    cutoff = time.time() - GC_GRACE_SECONDS
+    orphans = []
+    for name in unknown:
+        try:
+            if (upload_path / name).stat().st_mtime < cutoff:
+                orphans.append(name)
+        except FileNotFoundError:
+            continue
+    report.removed += remove_files(upload_path, orphans)
+
+    finished = len(names) < batch_size
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.set_state(conn, key=key, value="" if finished else names[-1])
+    return finished
+
+
+def _collect_rows(upload_path: Path, batch_size: int, report: GCReport) -> bool:
+    """Remove photo rows (and their files) not used by any workday.
+
+    Rows are visited in id order starting after the saved cursor.
+
+    Returns:
+        bool: Whether the end of the photo table was reached.
+    """
+    key = "photo_gc.row_cursor"
+    with db_conn() as conn:
+        cursor = int(Q.get_state(conn, key=key) or 0)
+        rows = Q.get_photos_after(conn, cursor=cursor, limit=batch_size)
+    report.rows_checked += len(rows)
+    finished = len(rows) < batch_size
+    if not rows:
+        with db_conn() as conn:
+            with transaction(conn):
+                Q.set_state(conn, key=key, value="0")
+        return finished
+
+    start_id, end_id = rows[0][0], rows[-1][0]
+    with db_conn() as conn:
+        with transaction(conn):
+            deleted = [
+                r[0]
+                for r in Q.delete_unreferenced_photos(
+                    conn, start_id=start_id, end_id=end_id
+                )
+            ]
+            Q.set_state(conn, key=key, value="0" if finished else str(end_id))
+    report.removed += remove_files(upload_path, deleted)
+    deleted_names = set(deleted)
+    for _, filename in rows:
+        if filename not in deleted_names and not (upload_path / filename).exists():
+            report.missing.append(filename)
+    return finished
+
+
+def collect_garbage(upload_path: Path, batch_size: int = 500) -> GCReport:
+    """Reconcile the upload directory with the photo tables, one batch at a time.
+
+    Each call checks at most *batch_size* files and *batch_size* photo rows.
+    The position in both is saved in the maintenance_state table, so repeated
+    calls (e.g. from cron) work through large directories incrementally and
+    pick up where they left off after a crash.
+
+    Args:
+        upload_path (Path): The UPLOAD_PATH directory.
+        batch_size (int): Max number of files and of rows to check.
+
+    Returns:
+        GCReport: What was checked and removed.
+    """
+    report = GCReport()
+    report.files_done = _collect_files(upload_path, batch_size, report)
+    report.rows_done = _collect_rows(upload_path, batch_size, report)
+    return report
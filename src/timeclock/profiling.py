@@ -0,0 +1,229 @@
+"""Sampled request profiling, switched on by an OWNER or ADMIN.
+
+While profiling is on, a fraction of requests have their thread's stack
+sampled every few milliseconds by a background thread. The samples are added
+up per endpoint in the profile_sample table, so every worker process
+contributes to the same profile, and can be downloaded as collapsed stacks
+(flamegraph.pl, speedscope, etc.) or as a speedscope file.
+
+When profiling is off a request costs one clock read, the switch itself is
+only read from the database every CHECK_SECONDS.
+"""
+from __future__ import annotations
+
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import Flask, g, request
+
+from .db import Q, db_conn, get_db_file, transaction
+
+# How often each process re-reads the switch
+CHECK_SECONDS = 5.0
+# Time between stack samples of a profiled request
+INTERVAL = 0.005
+MAX_SECONDS = 60 * 60
+UNTIL_KEY = "profiling.until"
+RATE_KEY = "profiling.sample_rate"
+
+
+def enable(seconds: float, sample_rate: float) -> None:
+    """Profile *sample_rate* of all requests for the next *seconds*.
+
+    Samples from earlier profiling are thrown away.
+
+    Raises:
+        ValueError: If seconds isn't in (0, MAX_SECONDS] or sample_rate isn't
+            in (0, 1].
+    """
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {MAX_SECONDS}")
+    if not 0 < sample_rate <= 1:
+        raise ValueError("sample_rate must be between 0 and 1")
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.clear_profile_samples(conn)
+            Q.set_state(conn, key=UNTIL_KEY, value=str(time.time() + seconds))
+            Q.set_state(conn, key=RATE_KEY, value=str(sample_rate))
+    SWITCH.forget()
+
+
+def disable() -> None:
+    """Stop profiling, the samples are kept for download."""
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.set_state(conn, key=UNTIL_KEY, value="0")
+    SWITCH.forget()
+
+
+class _Switch:
+    """Per process cache of the profiling switch of each database."""
+
+    def __init__(self) -> None:
+        # db file -> (checked at, profile until, sample rate)
+        self._state: Dict[Path, Tuple[float, float, float]] = {}
+
+    def sample_rate(self) -> float:
+        """The fraction of requests to profile right now, 0 when off."""
+        db_file = get_db_file()
+        now = time.monotonic()
+        checked, until, rate = self._state.get(db_file, (-CHECK_SECONDS, 0, 0))
+        if now - checked >= CHECK_SECONDS:
+            with db_conn() as conn:
+                until = float(Q.get_state(conn, key=UNTIL_KEY) or 0)
+                rate = float(Q.get_state(conn, key=RATE_KEY) or 0)
+            self._state[db_file] = (now, until, rate)
+        return rate if until > time.time() else 0.0
+
+    def forget(self) -> None:
+        """Re-read the switch on the next request."""
+        self._state.clear()
+
+
+class _Sampler:
+    """Background thread sampling the stacks of registered threads."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active: Dict[int, Counter[str]] = {}
+        self._running = False
+
+    def add(self, thread_id: int) -> None:
+        """Start sampling the thread."""
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if not self._running:
+                self._running = True
+                threading.Thread(
+                    target=self._run, name="profiling-sampler", daemon=True
+                ).start()
+
+    def remove(self, thread_id: int) -> Counter[str]:
+        """Stop sampling the thread and return its samples."""
+        with self._lock:
+            return self._active.pop(thread_id, Counter())
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    # Nothing to sample, the next add() starts a new thread
+                    self._running = False
+                    return
+                frames = sys._current_frames()
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_stack(frame)] += 1
+
+
+@lru_cache(maxsize=4096)
+def _label(code: CodeType) -> str:
+    filename = Path(code.co_filename)
+    name = f"{code.co_name} ({filename.parent.name}/{filename.name}"
+    return f"{name}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _stack(frame: Optional[FrameType]) -> str:
+    """The frame's stack root first, in collapsed stack format."""
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+SWITCH = _Switch()
+SAMPLER = _Sampler(INTERVAL)
+
+
+def _start() -> None:
+    rate = SWITCH.sample_rate()
+    if rate and random.random() < rate:
+        g.profiling_thread = threading.get_ident()
+        SAMPLER.add(g.profiling_thread)
+
+
+def _stop(exc: Optional[BaseException]) -> None:
+    thread_id = g.pop("profiling_thread", None)
+    if thread_id is None:
+        return
+    samples = SAMPLER.remove(thread_id)
+    if not samples:
+        return
+    endpoint = request.endpoint or "<unknown>"
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.add_profile_samples(
+                conn,
+                [
+                    dict(endpoint=endpoint, stack=stack, samples=count)
+                    for stack, count in samples.items()
+                ],
+            )
+
+
+def init_app(app: Flask) -> None:
+    """Profile requests of *app* while profiling is on."""
+    app.before_request(_start)
+    app.teardown_request(_stop)
+
+
+def _samples(endpoint: Optional[str]) -> List[Tuple[str, str, int]]:
+    with db_conn() as conn:
+        return [tuple(r) for r in Q.get_profile_samples(conn, endpoint=endpoint)]
+
+
+def collapsed(endpoint: Optional[str] = None) -> str:
+    """All samples as collapsed stacks, the endpoint is the root frame."""
+    return "".join(
+        f"{ep};{stack} {count}\n" for ep, stack, count in _samples(endpoint)
+    )
+
+
+def speedscope(endpoint: Optional[str] = None) -> Dict[str, Any]:
+    """All samples as a speedscope file, one profile per endpoint.
+
+    See https://www.speedscope.app/file-format-schema.json
+    """
+    frames: List[Dict[str, str]] = []
+    frame_index: Dict[str, int] = {}
+    profiles: Dict[str, Dict[str, Any]] = {}
+    for ep, stack, count in _samples(endpoint):
+        profile = profiles.setdefault(
+            ep,
+            dict(
+                type="sampled",
+                name=ep,
+                unit="none",
+                startValue=0,
+                endValue=0,
+                samples=[],
+                weights=[],
+            ),
+        )
+        indexes = []
+        for label in stack.split(";"):
+            if label not in frame_index:
+                frame_index[label] = len(frames)
+                frames.append(dict(name=label))
+            indexes.append(frame_index[label])
+        profile["samples"].append(indexes)
+        profile["weights"].append(count)
+        profile["endValue"] += count
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": dict(frames=frames),
+        "profiles": list(profiles.values()),
+        "name": "timeclock",
+        "exporter": "timeclock",
+    }
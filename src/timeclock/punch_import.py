@@ -0,0 +1,208 @@
+"""Import historical workdays from another timeclock system's CSV export.
+
+The file is read one chunk of rows at a time, so memory use doesn't depend on
+its size. Each chunk's timestamps are parsed together and its workdays are
+inserted with one executemany in one transaction, along with how many rows
+of the file are done and a fingerprint of its first lines. After a crash the
+next import of the same file skips the rows that are already in. The
+checkpoint goes with the last chunk, and one saved for a file with other
+first lines is ignored, so a new export dropped at the same path is read
+from the top.
+
+The CSV header must have user (an email, username or badge code), clock_in
+and clock_out columns and may have notes. Timestamps are ISO 8601 or match
+*timestamp_format*, timestamps without an offset are in *tz*.
+"""
+from __future__ import annotations
+
+import csv
+import datetime
+import hashlib
+import itertools
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pendulum
+
+from . import rollups
+from .db import Q, db_conn, transaction
+
+CHUNK_SIZE = 5000
+# Only keep this many error messages, a bad export can have millions
+MAX_ERRORS = 100
+STATE_PREFIX = "punch_import."
+# The header and first row, what tells two exports apart
+FINGERPRINT_LINES = 2
+
+
+@dataclass
+class ImportReport:
+    """What an import did.
+
+    Attributes:
+        resumed_at (int): Rows skipped because an earlier import did them.
+        rows (int): Rows read by this import.
+        inserted (int): Workdays inserted.
+        conflicts (int): Rows whose user already has a workday clocked in at
+            the same time.
+        invalid (int): Rows that were skipped because of an error.
+        errors (List[Tuple[int, str]]): (row number, error) of the first
+            MAX_ERRORS invalid rows, the first row after the header is 1.
+    """
+
+    resumed_at: int = 0
+    rows: int = 0
+    inserted: int = 0
+    conflicts: int = 0
+    invalid: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+
+    def error(self, row: int, message: str) -> None:
+        """Count an invalid row."""
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((row, message))
+
+
+def parse_timestamps(
+    values: Sequence[str],
+    tz: datetime.tzinfo,
+    timestamp_format: Optional[str] = None,
+) -> List[Optional[datetime.datetime]]:
+    """Parse a batch of timestamps, None for the ones that don't parse.
+
+    Uses datetime's C parsers rather than pendulum.parse, which is much
+    slower per call.
+    """
+    if timestamp_format is None:
+        parse = datetime.datetime.fromisoformat
+    else:
+        def parse(value: str) -> datetime.datetime:
+            return datetime.datetime.strptime(value, timestamp_format)
+    parsed: List[Optional[datetime.datetime]] = []
+    for value in values:
+        try:
+            dt = parse(value.strip())
+        except ValueError:
+            parsed.append(None)
+            continue
+        parsed.append(dt if dt.tzinfo else dt.replace(tzinfo=tz))
+    return parsed
+
+
+def _chunks(rows: Iterator[Dict[str, str]], size: int) -> Iterator[List[Dict]]:
+    while chunk := list(itertools.islice(rows, size)):
+        yield chunk
+
+
+def fingerprint(path: Path) -> str:
+    """Hash of the first FINGERPRINT_LINES lines of the file at *path*."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for line in itertools.islice(f, FINGERPRINT_LINES):
+            digest.update(line)
+    return digest.hexdigest()
+
+
+def _resume_at(value: Optional[str], file_fingerprint: str) -> int:
+    """Rows done according to checkpoint *value*, 0 if it's another file's."""
+    done, _, saved = (value or "").partition(" ")
+    return int(done) if saved == file_fingerprint else 0
+
+
+def import_punches(
+    path: Path,
+    tz: Optional[str] = None,
+    timestamp_format: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    restart: bool = False,
+) -> ImportReport:
+    """Import the workdays in the CSV file at *path*.
+
+    Rows with an unknown user, a bad timestamp or a clock out before the
+    clock in are reported and skipped. A row whose user already has a
+    workday with the same clock in (e.g. from an earlier import) is counted
+    as a conflict and skipped. The hours rollups are rebuilt at the end.
+
+    Args:
+        path (Path): The CSV file. Don't change it between an interrupted
+            import and its resume, other first lines start over.
+        tz (Optional[str]): Timezone name of timestamps without an offset,
+            defaults to the local timezone.
+        timestamp_format (Optional[str]): strptime format, ISO 8601 if None.
+        chunk_size (int): Rows per transaction.
+        restart (bool): Ignore the checkpoint of an earlier import.
+
+    Returns:
+        ImportReport: What was imported.
+
+    Raises:
+        ValueError: If the file has fewer rows than the checkpoint says were
+            done, it isn't the file that was being imported.
+    """
+    key = f"{STATE_PREFIX}{path.resolve()}"
+    file_fingerprint = fingerprint(path)
+    zone = pendulum.timezone(tz) if tz else pendulum.tz.local_timezone()
+    with db_conn() as conn:
+        state = None if restart else Q.get_state(conn, key=key)
+        done = _resume_at(state, file_fingerprint)
+        user_ids = dict(Q.get_user_keys(conn))
+    report = ImportReport(resumed_at=done)
+
+    with open(path, newline="") as f:
+        rows = itertools.islice(csv.DictReader(f), done, None)
+        chunks = _chunks(rows, chunk_size)
+        chunk = next(chunks, None)
+        if chunk is None and done:
+            raise ValueError(
+                f"{path} has no rows after the checkpoint at row {done},"
+                " import it with restart"
+            )
+        while chunk is not None:
+            # Read ahead to clear the checkpoint with the last chunk
+            next_chunk = next(chunks, None)
+            clock_ins = parse_timestamps(
+                [r.get("clock_in") or "" for r in chunk], zone, timestamp_format
+            )
+            clock_outs = parse_timestamps(
+                [r.get("clock_out") or "" for r in chunk], zone, timestamp_format
+            )
+            workdays = []
+            for n, (row, clock_in, clock_out) in enumerate(
+                zip(chunk, clock_ins, clock_outs), start=done + 1
+            ):
+                user_id = user_ids.get((row.get("user") or "").strip())
+                if user_id is None:
+                    report.error(n, f"unknown user {row.get('user')!r}")
+                elif clock_in is None:
+                    report.error(n, f"bad clock_in {row.get('clock_in')!r}")
+                elif clock_out is None:
+                    report.error(n, f"bad clock_out {row.get('clock_out')!r}")
+                elif clock_out <= clock_in:
+                    report.error(n, "clock_out is not after clock_in")
+                else:
+                    workdays.append(
+                        dict(
+                            user_id=user_id,
+                            # The same text pendulum.DateTime is stored as
+                            clock_in=clock_in.isoformat(" "),
+                            clock_out=clock_out.isoformat(" "),
+                            notes=row.get("notes") or None,
+                        )
+                    )
+            done += len(chunk)
+            with db_conn() as conn:
+                with transaction(conn):
+                    inserted = Q.import_workdays(conn, workdays) if workdays else 0
+                    if next_chunk is None:
+                        Q.delete_state(conn, key=key)
+                    else:
+                        Q.set_state(conn, key=key, value=f"{done} {file_fingerprint}")
+            report.rows += len(chunk)
+            report.inserted += inserted
+            report.conflicts += len(workdays) - inserted
+            chunk = next_chunk
+
+    rollups.rebuild()
+    return report
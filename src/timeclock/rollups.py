@@ -0,0 +1,127 @@
+"""Per user hours rolled up by day and by week.
+
+The hours_daily and hours_weekly tables are kept up to date by whatever
+closes or edits a workday calling `refresh` in the same transaction, so
+reports over any date range read a few rows per user instead of every
+workday. `rebuild` recomputes everything, for databases created before the
+rollups existed or after editing workdays by hand.
+"""
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import pendulum
+
+from .db import Q, class_row, db_conn, transaction
+
+PERIODS = ("day", "week", "month", "year")
+
+
+@dataclass
+class Rollup:
+    """Hours one user worked in one period.
+
+    Attributes:
+        period (str): The day or the week's Monday (YYYY-MM-DD), the month
+            (YYYY-MM) or the year (YYYY).
+        user_id (int): The user.
+        username (str): The user's username.
+        hours (float): Hours worked, each workday rounded to the quarter hour.
+        workdays (int): Number of closed workdays.
+    """
+
+    period: str
+    user_id: int
+    username: str
+    hours: float
+    workdays: int
+
+
+def refresh(
+    conn: sqlite3.Connection, user_id: int, days: Iterable[pendulum.Date]
+) -> None:
+    """Recompute the user's rollups of *days* and their weeks.
+
+    Call inside the transaction that changed the user's workdays, with the
+    clock in days of the workdays before and after the change.
+    """
+    days = sorted(set(days))
+    for day in days:
+        Q.delete_daily_hours(conn, user_id=user_id, day=day)
+        Q.insert_daily_hours(
+            conn, user_id=user_id, day=day, next_day=day.add(days=1)
+        )
+    for week in sorted({day.start_of("week") for day in days}):
+        Q.delete_weekly_hours(conn, user_id=user_id, week=week)
+        Q.insert_weekly_hours(
+            conn, user_id=user_id, week=week, next_week=week.add(weeks=1)
+        )
+
+
+def rebuild() -> None:
+    """Recompute every rollup from the workdays."""
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.clear_weekly_hours(conn)
+            Q.clear_daily_hours(conn)
+            Q.rebuild_daily_hours(conn)
+            Q.rebuild_weekly_hours(conn)
+
+
+def parse_range(
+    start: Optional[str], end: Optional[str], weeks: int = 12
+) -> Tuple[pendulum.Date, pendulum.Date]:
+    """Parse YYYY-MM-DD *start* and *end*, by default the last *weeks* weeks.
+
+    Raises:
+        ValueError: If a date doesn't parse or *end* is before *start*.
+    """
+    end_date = _parse_date(end) if end else pendulum.today().date()
+    start_date = (
+        _parse_date(start)
+        if start
+        else end_date.start_of("week").subtract(weeks=weeks - 1)
+    )
+    if end_date < start_date:
+        raise ValueError("end is before start")
+    return start_date, end_date
+
+
+def _parse_date(value: str) -> pendulum.Date:
+    parsed = pendulum.parse(value, exact=True)
+    if not isinstance(parsed, pendulum.Date) or isinstance(
+        parsed, pendulum.DateTime
+    ):
+        raise ValueError(f"Not a date {value!r}")
+    return parsed
+
+
+def hours(
+    start: pendulum.Date,
+    end: pendulum.Date,
+    period: str = "week",
+    user_id: Optional[int] = None,
+) -> List[Rollup]:
+    """Hours per user per period from *start* to *end*.
+
+    Weeks are whole weeks, from the Monday on or before *start* to the Sunday
+    on or after *end*. Days, months and years only count the days in range.
+
+    Raises:
+        ValueError: If *period* isn't one of PERIODS.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {PERIODS}")
+    with db_conn(row_factory=class_row(Rollup)) as conn:
+        if period == "week":
+            return Q.get_weekly_rollup(
+                conn,
+                start=start.start_of("week"),
+                end=end.start_of("week"),
+                user_id=user_id,
+            )
+        return Q.get_daily_rollup(
+            conn, start=start, end=end, period=period, user_id=user_id
+        )
@@ -0,0 +1,378 @@
+"""Planned shifts and how the punches measured up to them.
+
+Owners plan weekly shifts with templates (every Tuesday 09:00 for 8 hours
+from a day on) and add one-off shifts on top. `get_shifts` expands both
+into concrete shifts for a date range in local time.
+
+`reconcile` joins the shifts to the workdays like a merge join: both are
+sorted by user and start, the workdays are streamed from SQLite once and
+only the user's workdays that can still overlap a shift are kept, so a
+range costs one query whatever the number of shifts. `coverage` sums the
+results per user into lateness and coverage for the overview page.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pendulum
+
+from .db import Q, class_row, db_conn, transaction
+
+# Clocking in this long after a shift starts is still on time
+GRACE_MINUTES = 5
+UPCOMING = "upcoming"
+ON_TIME = "on_time"
+LATE = "late"
+NO_SHOW = "no_show"
+STATUSES = (UPCOMING, ON_TIME, LATE, NO_SHOW)
+
+# id, user_id, clock in and clock out as unix times
+Punch = Tuple[int, int, int, Optional[int]]
+
+
+@dataclass
+class ShiftTemplate:
+    """A shift worked every week.
+
+    Attributes:
+        id (int): The template id.
+        user_id (int): Who works it.
+        username (str): Their username.
+        weekday (int): 0 is Monday.
+        start (str): HH:MM local time.
+        minutes (int): How long it is.
+        valid_from (str): First day it's worked (YYYY-MM-DD).
+        valid_until (Optional[str]): Last day it's worked, None for no end.
+    """
+
+    id: int
+    user_id: int
+    username: str
+    weekday: int
+    start: str
+    minutes: int
+    valid_from: str
+    valid_until: Optional[str] = None
+
+    @property
+    def weekday_name(self) -> str:
+        """Monday to Sunday."""
+        return pendulum.WeekDay(self.weekday).name.capitalize()
+
+    def days(
+        self, start: pendulum.Date, end: pendulum.Date
+    ) -> Iterator[pendulum.Date]:
+        """The days between *start* and *end* (inclusive) it's worked."""
+        first = max(start, pendulum.Date.fromisoformat(self.valid_from))
+        if self.valid_until:
+            end = min(end, pendulum.Date.fromisoformat(self.valid_until))
+        day = first.add(days=(self.weekday - first.weekday()) % 7)
+        while day <= end:
+            yield day
+            day = day.add(weeks=1)
+
+
+@dataclass
+class Shift:
+    """One planned shift.
+
+    Attributes:
+        user_id (int): Who works it.
+        username (str): Their username.
+        start (int): When it starts, unix time.
+        end (int): When it ends, unix time.
+        template_id (Optional[int]): The template it's from.
+        id (Optional[int]): The one-off shift's id.
+    """
+
+    user_id: int
+    username: str
+    start: int
+    end: int
+    template_id: Optional[int] = None
+    id: Optional[int] = None
+
+    @property
+    def starts_at(self) -> pendulum.DateTime:
+        """When it starts, local time."""
+        local = pendulum.tz.local_timezone()
+        return pendulum.from_timestamp(self.start).in_timezone(local)
+
+
+@dataclass
+class ShiftResult:
+    """How a shift was worked.
+
+    Attributes:
+        shift (Shift): The shift.
+        status (str): One of STATUSES.
+        clock_in (Optional[int]): The first clock in during the shift, or of
+            the workday it started in, unix time.
+        due (int): Seconds of the shift up to now.
+        covered (int): Seconds of those the user was clocked in.
+    """
+
+    shift: Shift
+    status: str
+    clock_in: Optional[int] = None
+    due: int = 0
+    covered: int = 0
+
+    @property
+    def late_minutes(self) -> int:
+        """Minutes after the shift started the user clocked in."""
+        if self.clock_in is None:
+            return 0
+        return max(self.clock_in - self.shift.start, 0) // 60
+
+
+@dataclass
+class Coverage:
+    """How one user worked their shifts, upcoming shifts not counted.
+
+    Attributes:
+        user_id (int): The user.
+        username (str): Their username.
+        shifts (int): Shifts started so far.
+        on_time (int): Shifts clocked in on time.
+        late (int): Shifts clocked in late.
+        no_shows (int): Shifts without a clock in.
+        late_minutes (int): Minutes late in total.
+        scheduled (int): Seconds scheduled up to now.
+        covered (int): Seconds of those clocked in.
+        results (List[ShiftResult]): Every shift, upcoming ones included.
+    """
+
+    user_id: int
+    username: str
+    shifts: int = 0
+    on_time: int = 0
+    late: int = 0
+    no_shows: int = 0
+    late_minutes: int = 0
+    scheduled: int = 0
+    covered: int = 0
+    results: List[ShiftResult] = field(default_factory=list, repr=False)
+
+    @property
+    def percent(self) -> Optional[int]:
+        """Percentage of the scheduled time clocked in, None if nothing was."""
+        if not self.scheduled:
+            return None
+        return round(100 * self.covered / self.scheduled)
+
+
+def add_template(
+    user_id: int,
+    weekday: int,
+    start: str,
+    minutes: int,
+    valid_from: pendulum.Date,
+    valid_until: Optional[pendulum.Date] = None,
+) -> int:
+    """Add a weekly shift, returns its id.
+
+    Raises:
+        ValueError: If *start* isn't HH:MM or the shift is empty.
+    """
+    start = pendulum.Time.fromisoformat(start).strftime("%H:%M")
+    if not 0 <= weekday <= 6 or minutes <= 0:
+        raise ValueError("Not a shift")
+    if valid_until and valid_until < valid_from:
+        raise ValueError("valid_until is before valid_from")
+    with db_conn() as conn:
+        with transaction(conn):
+            return Q.insert_shift_template(
+                conn,
+                user_id=user_id,
+                weekday=weekday,
+                start=start,
+                minutes=minutes,
+                valid_from=valid_from,
+                valid_until=valid_until,
+            )
+
+
+def end_template(template_id: int, today: Optional[pendulum.Date] = None) -> None:
+    """Stop a weekly shift after today, or delete it if it hasn't started."""
+    today = today or pendulum.today().date()
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.delete_shift_template(conn, template_id=template_id, day=today)
+            Q.end_shift_template(conn, template_id=template_id, day=today)
+
+
+def add_shift(user_id: int, start: pendulum.DateTime, end: pendulum.DateTime) -> int:
+    """Add a one-off shift, returns its id.
+
+    Raises:
+        ValueError: If *end* isn't after *start*.
+    """
+    if end <= start:
+        raise ValueError("Shift ends before it starts")
+    with db_conn() as conn:
+        with transaction(conn):
+            return Q.insert_shift(conn, user_id=user_id, start=start, end=end)
+
+
+def get_employees() -> List[Tuple[int, str]]:
+    """(id, username) of the EMPLOYEEs to plan shifts for."""
+    with db_conn() as conn:
+        return Q.get_employee_names(conn)
+
+
+def get_templates(
+    start: pendulum.Date, end: pendulum.Date, user_id: Optional[int] = None
+) -> List[ShiftTemplate]:
+    """Weekly shifts worked on any day between *start* and *end*."""
+    with db_conn(row_factory=class_row(ShiftTemplate)) as conn:
+        return Q.get_shift_templates(conn, start=start, end=end, user_id=user_id)
+
+
+def get_shifts(
+    start: pendulum.Date, end: pendulum.Date, user_id: Optional[int] = None
+) -> List[Shift]:
+    """Shifts starting between *start* and *end* (inclusive).
+
+    Returns:
+        List[Shift]: Template and one-off shifts sorted by user and start.
+    """
+    local = pendulum.tz.local_timezone()
+    shifts = []
+    for template in get_templates(start, end, user_id):
+        hour, minute = map(int, template.start.split(":"))
+        for day in template.days(start, end):
+            begin = pendulum.datetime(
+                day.year, day.month, day.day, hour, minute, tz=local
+            )
+            shifts.append(
+                Shift(
+                    template.user_id,
+                    template.username,
+                    begin.int_timestamp,
+                    begin.add(minutes=template.minutes).int_timestamp,
+                    template_id=template.id,
+                )
+            )
+    with db_conn() as conn:
+        rows = Q.get_shifts(
+            conn,
+            after=start.subtract(days=1).to_date_string(),
+            before=end.add(days=2).to_date_string(),
+            user_id=user_id,
+        )
+    first = pendulum.datetime(start.year, start.month, start.day, tz=local)
+    last = pendulum.datetime(end.year, end.month, end.day, tz=local).add(days=1)
+    for id, shift_user_id, username, shift_start, shift_end in rows:
+        if first.int_timestamp <= shift_start < last.int_timestamp:
+            shifts.append(Shift(shift_user_id, username, shift_start, shift_end, id=id))
+    shifts.sort(key=lambda s: (s.user_id, s.start))
+    return shifts
+
+
+def reconcile(
+    shifts: Iterable[Shift], punches: Iterable[Punch], now: Optional[float] = None
+) -> Iterator[ShiftResult]:
+    """Yield how each shift was worked.
+
+    Both inputs must be sorted by user_id then start. Each punch is read
+    once, only the current user's punches that can still overlap a shift
+    are kept.
+
+    Args:
+        shifts (Iterable[Shift]): The shifts.
+        punches (Iterable[Punch]): (id, user_id, clock in, clock out) tuples
+            with unix times, clock out None for open workdays.
+        now (Optional[float]): Unix time open workdays last until, shifts
+            starting after it are upcoming.
+    """
+    now = int(time.time() if now is None else now)
+    grace = GRACE_MINUTES * 60
+    stream = iter(punches)
+    pending = next(stream, None)
+    user = None
+    # (clock in, clock out) of the user's punches that may overlap a shift
+    active: List[Tuple[int, int]] = []
+    for shift in shifts:
+        if shift.user_id != user:
+            user, active = shift.user_id, []
+        while pending is not None and (pending[1], pending[2]) < (
+            shift.user_id,
+            shift.end,
+        ):
+            _, user_id, start, end = pending
+            if user_id == shift.user_id:
+                active.append((start, now if end is None else end))
+            pending = next(stream, None)
+        active = [p for p in active if p[1] > shift.start]
+        worked = [p for p in active if p[0] < shift.end]
+        covered = sum(
+            max(min(end, shift.end, now) - max(start, shift.start), 0)
+            for start, end in worked
+        )
+        clock_in = min((start for start, _ in worked), default=None)
+        if clock_in is not None:
+            status = ON_TIME if clock_in <= shift.start + grace else LATE
+        elif now < shift.start + grace:
+            status = UPCOMING
+        else:
+            status = NO_SHOW
+        due = max(min(shift.end, now) - shift.start, 0)
+        yield ShiftResult(shift, status, clock_in, due, min(covered, due))
+
+
+def results(
+    start: pendulum.Date,
+    end: pendulum.Date,
+    user_id: Optional[int] = None,
+    now: Optional[float] = None,
+) -> List[ShiftResult]:
+    """How the shifts between *start* and *end* (inclusive) were worked."""
+    shifts = get_shifts(start, end, user_id)
+    if not shifts:
+        return []
+    first = min(s.start for s in shifts)
+    last = max(s.end for s in shifts)
+    with db_conn() as conn:
+        with Q.get_punch_spans_cursor(
+            conn,
+            after=pendulum.from_timestamp(first).subtract(days=1).to_date_string(),
+            before=pendulum.from_timestamp(last).add(days=1).to_date_string(),
+            start=first,
+            end=last,
+            user_id=user_id,
+        ) as cursor:
+            return list(reconcile(shifts, cursor, now))
+
+
+def coverage(shift_results: Iterable[ShiftResult]) -> Dict[int, Coverage]:
+    """Sum up shift results per user_id."""
+    users: Dict[int, Coverage] = {}
+    for result in shift_results:
+        shift = result.shift
+        cov = users.setdefault(shift.user_id, Coverage(shift.user_id, shift.username))
+        cov.results.append(result)
+        if result.status == UPCOMING:
+            continue
+        cov.shifts += 1
+        cov.scheduled += result.due
+        cov.covered += result.covered
+        if result.status == ON_TIME:
+            cov.on_time += 1
+        elif result.status == LATE:
+            cov.late += 1
+            cov.late_minutes += result.late_minutes
+        else:
+            cov.no_shows += 1
+    return users
+
+
+def this_week(
+    user_id: Optional[int] = None, now: Optional[float] = None
+) -> Dict[int, Coverage]:
+    """Coverage of the current week so far, for the overview."""
+    today = pendulum.today().date()
+    start = today.start_of("week")
+    return coverage(results(start, start.add(days=6), user_id, now))
@@ -0,0 +1,44 @@
+-- name: get_workday_spans
+/* Every workday as unix times, ordered for the anomaly sweep.
+
+clock_in is stored with its UTC offset, strftime converts it to UTC so
+workdays on either side of a DST change sort right. The rows come from the
+user_id, clock_in index and only each user's workdays are sorted again.
+
+Returns:
+    Iterable[Tuple[int, int, int, Optional[int]]]: id, user_id, clock in and
+        clock out (NULL while open) ordered by user_id then clock in.
+*/
+SELECT id, user_id,
+       CAST(strftime('%s', clock_in) AS INTEGER) AS start,
+       CAST(strftime('%s', clock_out) AS INTEGER) AS end
+  FROM workday
+ ORDER BY user_id, start;
+
+-- name: get_user_workday_spans
+/* A user's closed workdays that may overlap a span, as unix times.
+
+Args:
+    user_id (int): The user.
+    workday_id (int): Leave out this workday, the one being checked.
+    after (str): Only workdays clocked in on or after this day (YYYY-MM-DD),
+        compared as text so the user_id, clock_in index is used.
+    before (str): Only workdays clocked in before this day.
+    start (int): Unix time the span starts.
+    end (int): Unix time the span ends.
+
+Returns:
+    List[Tuple[int, int, int, int]]: id, user_id, clock in and clock out of
+        the workdays overlapping the span, ordered by clock in.
+*/
+SELECT id, user_id, start, end
+  FROM (SELECT id, user_id,
+               CAST(strftime('%s', clock_in) AS INTEGER) AS start,
+               CAST(strftime('%s', clock_out) AS INTEGER) AS end
+          FROM workday
+         WHERE user_id = :user_id
+           AND clock_in >= :after AND clock_in < :before
+           AND clock_out IS NOT NULL
+           AND id != :workday_id)
+ WHERE start < :end AND end > :start
+ ORDER BY start;
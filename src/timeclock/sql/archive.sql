@@ -0,0 +1,209 @@
+-- name: create_archive_schema#
+/* Tables of the archive database attached as `archive`.
+
+Same columns as their main database counterparts. Foreign keys to tables in
+the main database (user, photo) can't cross files and are left out.
+*/
+CREATE TABLE IF NOT EXISTS archive.workday (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    clock_in TIMESTAMP NOT NULL,
+    clock_out TIMESTAMP,
+    notes TEXT
+);
+
+CREATE INDEX IF NOT EXISTS archive.workday_user_id ON workday (user_id);
+
+-- Workday history by date, main has UNIQUE (user_id, clock_in)
+CREATE INDEX IF NOT EXISTS archive.workday_user_id_clock_in
+    ON workday (user_id, clock_in);
+
+CREATE TABLE IF NOT EXISTS archive.workday_photo (
+    photo_id INTEGER,
+    workday_id INTEGER,
+    PRIMARY KEY (photo_id, workday_id),
+    FOREIGN KEY (workday_id) REFERENCES workday(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS archive.workday_photo_workday_id
+    ON workday_photo (workday_id);
+
+CREATE TABLE IF NOT EXISTS archive.timesheet (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    notes TEXT
+);
+
+CREATE INDEX IF NOT EXISTS archive.timesheet_user_id ON timesheet (user_id);
+
+CREATE TABLE IF NOT EXISTS archive.timesheet_workday (
+    timesheet_id INTEGER,
+    workday_id INTEGER,
+    PRIMARY KEY (timesheet_id, workday_id),
+    FOREIGN KEY (timesheet_id) REFERENCES timesheet(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+    FOREIGN KEY (workday_id) REFERENCES workday(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS archive.timesheet_workday_workday_id
+    ON timesheet_workday (workday_id);
+
+-- name: create_archive_views#
+/* Per connection views reading the main and archive databases as one.
+
+Rows are copied to the archive before they're deleted from main, so for a
+moment (or after a crash in between) a row can be in both. The main
+database copy wins.
+*/
+CREATE TEMP VIEW IF NOT EXISTS all_workday AS
+SELECT id, user_id, clock_in, clock_out, notes FROM main.workday
+UNION ALL
+SELECT id, user_id, clock_in, clock_out, notes FROM archive.workday
+ WHERE id NOT IN (SELECT id FROM main.workday);
+
+CREATE TEMP VIEW IF NOT EXISTS all_workday_photo AS
+SELECT photo_id, workday_id FROM main.workday_photo
+UNION ALL
+SELECT photo_id, workday_id FROM archive.workday_photo
+ WHERE workday_id NOT IN (SELECT id FROM main.workday);
+
+CREATE TEMP VIEW IF NOT EXISTS all_timesheet AS
+SELECT id, user_id, notes FROM main.timesheet
+UNION ALL
+SELECT id, user_id, notes FROM archive.timesheet
+ WHERE id NOT IN (SELECT id FROM main.timesheet);
+
+CREATE TEMP VIEW IF NOT EXISTS all_timesheet_workday AS
+SELECT timesheet_id, workday_id FROM main.timesheet_workday
+UNION ALL
+SELECT timesheet_id, workday_id FROM archive.timesheet_workday
+ WHERE timesheet_id NOT IN (SELECT id FROM main.timesheet);
+
+-- name: get_archivable_timesheets
+/* Get a batch of saved timesheets whose last workday clocked in before the cutoff.
+
+Ids are AUTOINCREMENT, a new row never gets the id of an archived one.
+
+Args:
+    cutoff (int): Unix timestamp.
+    limit (int): Size of the batch.
+
+Returns:
+    Iterable of (timesheet.id, number of workdays) tuples.
+*/
+SELECT ts.id, count(*)
+  FROM main.timesheet ts
+  JOIN main.timesheet_workday tw ON tw.timesheet_id = ts.id
+  JOIN main.workday wd ON wd.id = tw.workday_id
+ GROUP BY ts.id
+HAVING max(CAST(strftime('%s', wd.clock_in) AS INTEGER)) < :cutoff
+ ORDER BY ts.id
+ LIMIT :limit;
+
+-- name: copy_timesheets_to_archive!
+/* Copy timesheets to the archive.
+
+Args:
+    ids (str): JSON array of timesheet ids.
+
+Returns:
+    None
+*/
+INSERT OR IGNORE INTO archive.timesheet (id, user_id, notes)
+SELECT id, user_id, notes FROM main.timesheet
+ WHERE id IN (SELECT value FROM json_each(:ids));
+
+-- name: copy_workdays_to_archive!
+/* Copy the workdays of timesheets to the archive.
+
+Args:
+    ids (str): JSON array of timesheet ids.
+
+Returns:
+    None
+*/
+INSERT OR IGNORE INTO archive.workday (id, user_id, clock_in, clock_out, notes)
+SELECT id, user_id, clock_in, clock_out, notes FROM main.workday
+ WHERE id IN (
+     SELECT workday_id FROM main.timesheet_workday
+      WHERE timesheet_id IN (SELECT value FROM json_each(:ids)));
+
+-- name: copy_timesheet_workdays_to_archive!
+/* Copy the timesheet_workday rows of timesheets to the archive.
+
+Args:
+    ids (str): JSON array of timesheet ids.
+
+Returns:
+    None
+*/
+INSERT OR IGNORE INTO archive.timesheet_workday (timesheet_id, workday_id)
+SELECT timesheet_id, workday_id FROM main.timesheet_workday
+ WHERE timesheet_id IN (SELECT value FROM json_each(:ids));
+
+-- name: copy_workday_photos_to_archive!
+/* Copy the workday_photo rows of the workdays of timesheets to the archive.
+
+Args:
+    ids (str): JSON array of timesheet ids.
+
+Returns:
+    None
+*/
+INSERT OR IGNORE INTO archive.workday_photo (photo_id, workday_id)
+SELECT photo_id, workday_id FROM main.workday_photo
+ WHERE workday_id IN (
+     SELECT workday_id FROM main.timesheet_workday
+      WHERE timesheet_id IN (SELECT value FROM json_each(:ids)));
+
+-- name: delete_archived_workdays!
+/* Delete the workdays of timesheets from main, cascading to their links.
+
+Args:
+    ids (str): JSON array of timesheet ids.
+
+Returns:
+    None
+*/
+DELETE FROM main.workday
+ WHERE id IN (
+     SELECT workday_id FROM main.timesheet_workday
+      WHERE timesheet_id IN (SELECT value FROM json_each(:ids)));
+
+-- name: delete_archived_timesheets!
+/* Delete timesheets from main.
+
+Args:
+    ids (str): JSON array of timesheet ids.
+
+Returns:
+    None
+*/
+DELETE FROM main.timesheet WHERE id IN (SELECT value FROM json_each(:ids));
+
+-- name: delete_archived_user_workdays!
+/* Delete a user's workdays from the archive, cascading to their links.
+
+Args:
+    user_id (int): The primary key id of the user.
+
+Returns:
+    None
+*/
+DELETE FROM archive.workday WHERE user_id = :user_id;
+
+-- name: delete_archived_user_timesheets!
+/* Delete a user's timesheets from the archive, cascading to their links.
+
+Args:
+    user_id (int): The primary key id of the user.
+
+Returns:
+    None
+*/
+DELETE FROM archive.timesheet WHERE user_id = :user_id;
@@ -0,0 +1,64 @@
+-- name: get_workday_history
+/* A page of a user's workdays that clocked in between two days.
+
+Keyset paginated: the page starts after the clock in and id of the last
+workday of the previous page, so deleting or editing that workday doesn't
+move the page. The range and the cursor are compared as text so the
+(user_id, clock_in) indexes of both databases are used, a day is the local
+day the workday clocked in.
+
+Hours are rounded to the quarter hour like WorkDay.hours, NULL while the
+workday is open. running_hours adds up the closed workdays of the page.
+
+Args:
+    user_id (int): The user.
+    start (pendulum.Date): First day.
+    next_day (pendulum.Date): The day after the last day.
+    after_clock_in (pendulum.DateTime): Clock in of the last workday of the
+        previous page, '' for the first page.
+    after_id (int): Its id, 0 for the first page.
+    limit (int): Size of the page.
+
+Returns:
+    List[Tuple[int, pendulum.DateTime, Optional[pendulum.DateTime], str,
+        Optional[float], float]]: id, clock_in, clock_out, notes, hours and
+        running_hours ordered by clock_in.
+*/
+SELECT id, clock_in AS "clock_in [TIMESTAMP]",
+       clock_out AS "clock_out [TIMESTAMP]", notes, hours,
+       coalesce(sum(hours) OVER (ORDER BY clock_in, id), 0) AS running_hours
+  FROM (SELECT id, clock_in, clock_out, notes,
+               round(
+                   ((strftime('%s', clock_out) - strftime('%s', clock_in)) / 60)
+                   / 15.0
+               ) / 4 AS hours
+          FROM all_workday
+         WHERE user_id = :user_id
+           AND clock_in >= :start AND clock_in < :next_day
+           AND clock_in >= :after_clock_in
+           AND (clock_in > :after_clock_in OR id > :after_id)
+         ORDER BY clock_in, id
+         LIMIT :limit)
+ ORDER BY clock_in, id;
+
+-- name: get_workday_history_totals^
+/* Closed workdays and their hours of a user between two days.
+
+Same rounding and day bounds as get_workday_history.
+
+Args:
+    user_id (int): The user.
+    start (pendulum.Date): First day.
+    next_day (pendulum.Date): The day after the last day.
+
+Returns:
+    Tuple[int, float]: Number of workdays and their hours.
+*/
+SELECT count(*),
+       coalesce(sum(round(
+           ((strftime('%s', clock_out) - strftime('%s', clock_in)) / 60) / 15.0
+       ) / 4), 0)
+  FROM all_workday
+ WHERE user_id = :user_id
+   AND clock_in >= :start AND clock_in < :next_day
+   AND clock_out IS NOT NULL;
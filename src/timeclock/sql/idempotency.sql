@@ -0,0 +1,74 @@
+-- name: reserve_idempotency_key$
+/* Claim a key for a request that is about to run.
+
+A key that is free, expired or whose request was abandoned while running is
+claimed, a key in use isn't.
+
+Args:
+    user_id (int): The user sending the key.
+    key (str): The Idempotency-Key header.
+    request (str): Method and path of the request.
+    now (float): Unix time.
+    expired (float): Keys created before this are free again.
+    abandoned (float): Keys still running since before this are free again.
+
+Returns:
+    Optional[int]: 1 if the key was claimed, None if it's in use.
+*/
+INSERT INTO idempotency_key (user_id, key, request, created)
+VALUES (:user_id, :key, :request, :now)
+    ON CONFLICT (user_id, key) DO UPDATE
+   SET request = excluded.request,
+       created = excluded.created,
+       status = NULL,
+       headers = NULL,
+       body = NULL
+ WHERE created < :expired OR (status IS NULL AND created < :abandoned)
+RETURNING 1;
+
+-- name: get_idempotency_key^
+/* Get the request and response saved for a key.
+
+Args:
+    user_id (int): The user sending the key.
+    key (str): The Idempotency-Key header.
+
+Returns:
+    Optional[Tuple[str, Optional[int], Optional[str], Optional[bytes]]]:
+        request, status, headers as JSON and body. status is NULL while the
+        request is running.
+*/
+SELECT request, status, headers, body
+  FROM idempotency_key
+ WHERE user_id = :user_id AND key = :key;
+
+-- name: save_idempotent_response!
+/* Save the response of a request sent with a key.
+
+Args:
+    user_id (int): The user sending the key.
+    key (str): The Idempotency-Key header.
+    status (int): Response status code.
+    headers (str): JSON list of [name, value] response headers.
+    body (bytes): Response body.
+*/
+UPDATE idempotency_key
+   SET status = :status, headers = :headers, body = :body
+ WHERE user_id = :user_id AND key = :key;
+
+-- name: release_idempotency_key!
+/* Free a key whose request failed so it can be retried.
+
+Args:
+    user_id (int): The user sending the key.
+    key (str): The Idempotency-Key header.
+*/
+DELETE FROM idempotency_key WHERE user_id = :user_id AND key = :key;
+
+-- name: prune_idempotency_keys!
+/* Delete expired keys.
+
+Args:
+    expired (float): Keys created before this are deleted.
+*/
+DELETE FROM idempotency_key WHERE created < :expired;
@@ -0,0 +1,59 @@
+-- name: get_maintenance_runs
+/* The last run of every maintenance job.
+
+Returns:
+    List[Tuple[str, float, float, str, Optional[str]]]: job, started,
+        seconds, result and error ordered by job.
+*/
+SELECT job, started, seconds, result, error FROM maintenance_run ORDER BY job;
+
+-- name: record_maintenance_run!
+/* Keep a job's run as its last one.
+
+Args:
+    job (str): The job's name.
+    started (float): When it started, unix time.
+    seconds (float): How long it took.
+    result (str): What it did.
+    error (Optional[str]): Why it failed, NULL if it didn't.
+*/
+INSERT INTO maintenance_run (job, started, seconds, result, error)
+VALUES (:job, :started, :seconds, :result, :error)
+ON CONFLICT (job) DO UPDATE
+   SET started = excluded.started,
+       seconds = excluded.seconds,
+       result = excluded.result,
+       error = excluded.error;
+
+-- name: get_forgotten_workdays
+/* Workdays still open after clocking in before a time, oldest first.
+
+Args:
+    before (int): Unix time.
+    limit (int): Max number of workdays.
+
+Returns:
+    List[Tuple[int, int, pendulum.DateTime]]: id, user_id and clock_in.
+*/
+SELECT id, user_id, clock_in
+  FROM workday
+ WHERE clock_out IS NULL
+   AND CAST(strftime('%s', clock_in) AS INTEGER) < :before
+ ORDER BY clock_in
+ LIMIT :limit;
+
+-- name: auto_clock_out_workday!
+/* Clock out a forgotten workday and say so in its notes.
+
+Args:
+    workday_id (int): The workday.
+    clock_out (pendulum.DateTime): Clock out timestamp.
+    note (str): Appended to the notes.
+
+Returns:
+    int: 1, or 0 if it was clocked out in the meantime.
+*/
+UPDATE workday
+   SET clock_out = :clock_out,
+       notes = trim(coalesce(notes, '') || ' ' || :note)
+ WHERE id = :workday_id AND clock_out IS NULL;
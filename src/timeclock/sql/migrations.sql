@@ -0,0 +1,228 @@
+-- name: migrate_photo_hashes#
+/* Version 1: photos deduplicated by content hash, photo garbage collection.
+
+SQLite can't add a UNIQUE column, the unique index does the same job for
+the ON CONFLICT (sha256) upsert. Photos uploaded before have no hash.
+*/
+ALTER TABLE photo ADD COLUMN sha256 TEXT;
+
+CREATE UNIQUE INDEX photo_sha256 ON photo (sha256);
+
+CREATE INDEX workday_photo_photo_id ON workday_photo (photo_id);
+
+CREATE TABLE maintenance_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+-- name: migrate_events#
+/* Version 2: clock in and out events for the overview's event stream. */
+CREATE TABLE event (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    workday_id INTEGER,
+    created TIMESTAMP NOT NULL
+);
+
+-- name: migrate_autoincrement#
+/* Version 3: workday and timesheet ids are never reused.
+
+Archived rows are looked up by id through the all_* views, a new row must
+not get the id of one moved to the archive. The tables are rebuilt with
+AUTOINCREMENT (foreign keys are off while migrating) and their sequences
+start after the highest id in either database.
+*/
+CREATE TABLE new_workday (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    clock_in TIMESTAMP NOT NULL,
+    clock_out TIMESTAMP,
+    notes TEXT,
+    UNIQUE (user_id, clock_in),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+INSERT INTO new_workday (id, user_id, clock_in, clock_out, notes)
+SELECT id, user_id, clock_in, clock_out, notes FROM main.workday;
+
+DROP TABLE main.workday;
+
+ALTER TABLE new_workday RENAME TO workday;
+
+CREATE TABLE new_timesheet (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    notes TEXT,
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+INSERT INTO new_timesheet (id, user_id, notes)
+SELECT id, user_id, notes FROM main.timesheet;
+
+DROP TABLE main.timesheet;
+
+ALTER TABLE new_timesheet RENAME TO timesheet;
+
+DELETE FROM main.sqlite_sequence WHERE name IN ('workday', 'timesheet');
+
+INSERT INTO main.sqlite_sequence (name, seq)
+VALUES
+    ('workday', max(
+        (SELECT coalesce(max(id), 0) FROM main.workday),
+        (SELECT coalesce(max(id), 0) FROM archive.workday)
+    )),
+    ('timesheet', max(
+        (SELECT coalesce(max(id), 0) FROM main.timesheet),
+        (SELECT coalesce(max(id), 0) FROM archive.timesheet)
+    ));
+
+-- name: migrate_kiosks#
+/* Version 4: shared kiosk devices and the badges users punch in with. */
+CREATE TABLE kiosk (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    token_sha256 TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE badge (
+    code TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX badge_user_id ON badge (user_id);
+
+-- name: migrate_profiling#
+/* Version 5: sampled request profiles. */
+CREATE TABLE profile_sample (
+    endpoint TEXT NOT NULL,
+    stack TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    PRIMARY KEY (endpoint, stack)
+);
+
+-- name: migrate_hours_rollups#
+/* Version 6: hours per user per day and per week, filled by db.py. */
+CREATE TABLE hours_daily (
+    day TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    hours REAL NOT NULL,
+    workdays INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE hours_weekly (
+    week TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    hours REAL NOT NULL,
+    workdays INTEGER NOT NULL,
+    PRIMARY KEY (week, user_id),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- name: migrate_throttle#
+/* Version 7: login throttling buckets and counters. */
+CREATE TABLE rate_limit (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE throttle_counter (
+    name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- name: migrate_idempotency#
+/* Version 8: responses kept for retried Idempotency-Key requests. */
+CREATE TABLE idempotency_key (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    request TEXT NOT NULL,
+    created REAL NOT NULL,
+    status INTEGER,
+    headers TEXT,
+    body BLOB,
+    PRIMARY KEY (user_id, key),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX idempotency_key_created ON idempotency_key (created);
+
+-- name: migrate_pdf_jobs#
+/* Version 9: background rendered timesheet PDFs.
+
+Timesheets saved before get their PDF when it's first downloaded, or all at
+once with `timeclock-cli render-pdfs --missing`.
+*/
+CREATE TABLE pdf_job (
+    timesheet_id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'queued',
+    queued REAL NOT NULL,
+    started REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    sha256 TEXT,
+    error TEXT
+);
+
+CREATE INDEX pdf_job_status ON pdf_job (status, queued);
+
+-- name: migrate_shifts#
+/* Version 10: planned shifts. */
+CREATE TABLE shift_template (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,
+    start TEXT NOT NULL,
+    minutes INTEGER NOT NULL,
+    valid_from TEXT NOT NULL,
+    valid_until TEXT,
+    CHECK (weekday BETWEEN 0 AND 6),
+    CHECK (minutes > 0),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX shift_template_user_id ON shift_template (user_id);
+
+CREATE TABLE shift (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    start TIMESTAMP NOT NULL,
+    end TIMESTAMP NOT NULL,
+    CHECK (end > start),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX shift_start ON shift (start);
+
+CREATE INDEX workday_clock_in ON workday (clock_in);
+
+-- name: migrate_maintenance_runs#
+/* Version 11: scheduled maintenance runs, open workdays for auto clock-out. */
+CREATE TABLE maintenance_run (
+    job TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    seconds REAL NOT NULL,
+    result TEXT NOT NULL DEFAULT '',
+    error TEXT
+);
+
+CREATE INDEX workday_open ON workday (clock_in) WHERE clock_out IS NULL;
@@ -0,0 +1,154 @@
+-- name: queue_pdf!
+/* Queue rendering a timesheet's PDF.
+
+A timesheet already queued or running is left alone, a done one is queued
+again with *force* and a failed one, with its attempts reset, with *retry*.
+The PDF file isn't checked, callers decide whether a done one is needed.
+
+Args:
+    timesheet_id (int): The saved timesheet.
+    now (float): Unix time.
+    force (bool): Queue a done job again.
+    retry (bool): Queue a failed job again.
+*/
+INSERT INTO pdf_job (timesheet_id, queued)
+VALUES (:timesheet_id, :now)
+    ON CONFLICT (timesheet_id) DO UPDATE
+   SET status = 'queued',
+       queued = excluded.queued,
+       started = NULL,
+       attempts = 0,
+       error = NULL
+ WHERE (status = 'failed' AND :retry) OR (status = 'done' AND :force);
+
+-- name: retry_failed_pdfs!
+/* Queue every failed job again with its attempts reset.
+
+Args:
+    now (float): Unix time.
+*/
+UPDATE pdf_job
+   SET status = 'queued', queued = :now, started = NULL, attempts = 0, error = NULL
+ WHERE status = 'failed';
+
+-- name: queue_missing_pdfs!
+/* Queue every saved timesheet, main and archived, that has no PDF job.
+
+Args:
+    now (float): Unix time.
+*/
+INSERT INTO pdf_job (timesheet_id, queued)
+SELECT id, :now
+  FROM all_timesheet
+ WHERE id NOT IN (SELECT timesheet_id FROM pdf_job)
+ ORDER BY id;
+
+-- name: claim_pdf_job$
+/* Mark the oldest queued job running and return it.
+
+A job still running since before *stale* belongs to a worker that died and
+is claimed again, unless it already used up its attempts.
+
+Args:
+    now (float): Unix time.
+    stale (float): Running jobs started before this are claimed again.
+    max_attempts (int): Give up on a job after this many attempts.
+
+Returns:
+    Optional[int]: The claimed timesheet id, None if no job is waiting.
+*/
+UPDATE pdf_job
+   SET status = 'running', started = :now, attempts = attempts + 1
+ WHERE timesheet_id = (
+       SELECT timesheet_id
+         FROM pdf_job
+        WHERE status = 'queued'
+           OR (status = 'running' AND started < :stale
+               AND attempts < :max_attempts)
+        ORDER BY queued
+        LIMIT 1)
+RETURNING timesheet_id;
+
+-- name: finish_pdf_job!
+/* Record the PDF of a job that succeeded.
+
+Args:
+    timesheet_id (int): The job's timesheet.
+    sha256 (str): Hex digest of the PDF, its file is <sha256>.pdf.
+*/
+UPDATE pdf_job
+   SET status = 'done', sha256 = :sha256, error = NULL
+ WHERE timesheet_id = :timesheet_id;
+
+-- name: fail_pdf_job!
+/* Record the error of a job, it's queued again until it used up its attempts.
+
+Args:
+    timesheet_id (int): The job's timesheet.
+    error (str): What went wrong.
+    now (float): Unix time, a retried job goes to the back of the queue.
+    max_attempts (int): Give up on a job after this many attempts.
+*/
+UPDATE pdf_job
+   SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'queued' END,
+       queued = :now,
+       error = :error
+ WHERE timesheet_id = :timesheet_id;
+
+-- name: get_pdf_job^
+/* Get the state of a timesheet's PDF job.
+
+Args:
+    timesheet_id (int): The saved timesheet.
+
+Returns:
+    Optional[Tuple[str, Optional[str], Optional[str]]]: status, sha256 and
+        error.
+*/
+SELECT status, sha256, error FROM pdf_job WHERE timesheet_id = :timesheet_id;
+
+-- name: count_pdf_jobs
+/* Number of PDF jobs per status.
+
+Returns:
+    List[Tuple[str, int]]: status, count.
+*/
+SELECT status, count(*) FROM pdf_job GROUP BY status ORDER BY status;
+
+-- name: get_timesheet_user^
+/* Get the user a saved timesheet, main or archived, belongs to.
+
+Args:
+    timesheet_id (int): The saved timesheet.
+
+Returns:
+    Optional[Tuple[int, str]]: user id and username.
+*/
+SELECT u.id, u.username
+  FROM all_timesheet AS t
+  JOIN user AS u ON u.id = t.user_id
+ WHERE t.id = :timesheet_id;
+
+-- name: get_pay_period_pdfs
+/* Saved timesheets, main and archived, whose last workday is in a period.
+
+Args:
+    start (pendulum.Date): First day of the period.
+    end (pendulum.Date): Last day of the period.
+
+Returns:
+    List[Tuple[int, str, str, str, Optional[str], Optional[str],
+        Optional[str]]]: timesheet id, username, first and last day, PDF job
+        status, sha256 and error ordered by username then first day.
+*/
+SELECT t.id, u.username,
+       min(substr(wd.clock_in, 1, 10)), max(substr(wd.clock_in, 1, 10)),
+       j.status, j.sha256, j.error
+  FROM all_timesheet AS t
+  JOIN user AS u ON u.id = t.user_id
+  JOIN all_timesheet_workday AS tw ON tw.timesheet_id = t.id
+  JOIN all_workday AS wd ON wd.id = tw.workday_id
+  LEFT JOIN pdf_job AS j ON j.timesheet_id = t.id
+ GROUP BY t.id
+HAVING max(substr(wd.clock_in, 1, 10)) BETWEEN :start AND :end
+ ORDER BY 2, 3;
@@ -1,13 +1,30 @@
 -- name: insert_photo$
 /* Add a new photo and return the new photo id.
 
+If a photo with the same sha256 exists its filename is replaced, this
+happens when a deduplicated photo's file went missing and was saved again.
+
 Args:
     filename (str): The filename of the new photo.
+    sha256 (Optional[str]): Hex digest of the uploaded file.
 
 Returns:
     int: The newly created photo's id.
 */
-INSERT INTO photo (filename) VALUES (:filename) RETURNING id;
+INSERT INTO photo (filename, sha256) VALUES (:filename, :sha256)
+    ON CONFLICT (sha256) DO UPDATE SET filename = excluded.filename
+RETURNING id;
+
+-- name: get_photo_by_sha256^
+/* Get the photo with the given content hash.
+
+Args:
+    sha256 (str): Hex digest of the uploaded file.
+
+Returns:
+    Optional[Tuple[int, str, str]]: (id, filename, sha256)
+*/
+SELECT id, filename, sha256 FROM photo WHERE sha256 = :sha256;
 
 -- name: delete_photo!
 /* Delete the photo with the given photo id.
@@ -20,6 +37,46 @@ Returns:
 */
 DELETE FROM photo WHERE id = :photo_id;
 
+-- name: delete_unreferenced_photos
+/* Delete photos in the id range that no workday uses anymore.
+
+Args:
+    start_id (int): Smallest photo id to consider.
+    end_id (int): Largest photo id to consider.
+
+Returns:
+    Iterable of (photo.filename,) tuples for the deleted rows.
+*/
+DELETE FROM photo
+ WHERE id BETWEEN :start_id AND :end_id
+   AND NOT EXISTS (SELECT 1 FROM all_workday_photo WHERE photo_id = photo.id)
+RETURNING filename;
+
+-- name: get_photos_after
+/* Get a batch of photos ordered by id.
+
+Args:
+    cursor (int): Only photos with a greater id are returned.
+    limit (int): Size of the batch.
+
+Returns:
+    Iterable of (photo.id, photo.filename) tuples.
+*/
+SELECT id, filename FROM photo WHERE id > :cursor ORDER BY id LIMIT :limit;
+
+-- name: get_unknown_filenames
+/* Get the filenames that don't belong to any photo.
+
+Args:
+    filenames (str): JSON array of filenames.
+
+Returns:
+    Iterable of (filename,) tuples.
+*/
+SELECT value
+  FROM json_each(:filenames)
+ WHERE value NOT IN (SELECT filename FROM photo);
+
 -- name: get_workday_photos
 /* Get all photos for the given workday id.
 
@@ -27,13 +84,14 @@ Args:
     workday_id (int): The primary key id of the workday.
 
 Returns:
-    Iterable of (photo.id, photo.filename) tuples.
+    Iterable of (photo.id, photo.filename, photo.sha256) tuples.
 */
-SELECT p.id, p.filename
+SELECT p.id, p.filename, p.sha256
   FROM photo p
-  JOIN workday_photo wp
+  JOIN all_workday_photo wp
     ON p.id = wp.photo_id
-WHERE wp.workday_id = :workday_id;
+WHERE wp.workday_id = :workday_id
+ORDER BY p.id;
 
 -- name: insert_workday_photo!
 /* Add a new row to the workday_photo table.
@@ -48,6 +106,19 @@ Returns:
 INSERT INTO workday_photo (photo_id, workday_id)
 VALUES (:photo_id, :workday_id);
 
+-- name: delete_workday_photo!
+/* Remove a photo from a workday.
+
+Args:
+    photo_id (int): The primary key id of the photo.
+    workday_id (int): The primary key id of the workday.
+
+Returns:
+    None
+*/
+DELETE FROM workday_photo
+ WHERE photo_id = :photo_id AND workday_id = :workday_id;
+
 -- name: get_user_current_workday^
 /* Get the latest workday for the given user id.
 
@@ -69,9 +140,15 @@ Args:
     workday_id (int): The primary key id of the workday.
 
 Returns:
-    Tuple[pendulum.DateTime, pendulum.DateTime, str]
+    Tuple[pendulum.DateTime, pendulum.DateTime, str, int, bool]: clock_in,
+        clock_out, notes, user_id and whether it's on a saved timesheet.
 */
-SELECT clock_in, clock_out, notes FROM workday WHERE id = :workday_id
+SELECT clock_in, clock_out, notes, user_id,
+       EXISTS (
+           SELECT 1 FROM all_timesheet_workday WHERE workday_id = :workday_id
+       ) AS archived
+  FROM all_workday
+ WHERE id = :workday_id;
 
 -- name: get_workday_user_id$
 /* Get the user_id associated with the given workday id.
@@ -82,7 +159,7 @@ Args:
 Returns:
     int
 */
-SELECT user_id FROM workday WHERE id = :workday_id;
+SELECT user_id FROM all_workday WHERE id = :workday_id;
 
 -- name: get_workday_archived$
 /* Get whether the workday id has been written to the timesheet_workday table.
@@ -93,7 +170,7 @@ Args:
 Returns:
     bool
 */
-SELECT EXISTS (SELECT 1 FROM timesheet_workday WHERE workday_id = :workday_id);
+SELECT EXISTS (SELECT 1 FROM all_timesheet_workday WHERE workday_id = :workday_id);
 
 -- name: update_workday!
 /* Update the workday row for the given workday id.
@@ -112,3 +189,351 @@ UPDATE workday SET
     clock_out = :clock_out,
     notes = :notes
 WHERE id = :workday_id;
+
+-- name: get_state$
+/* Get a value saved by a maintenance job.
+
+Args:
+    key (str): Name of the value.
+
+Returns:
+    Optional[str]
+*/
+SELECT value FROM maintenance_state WHERE key = :key;
+
+-- name: set_state!
+/* Save a value for a maintenance job, e.g. a resumable cursor.
+
+Args:
+    key (str): Name of the value.
+    value (str): The value.
+
+Returns:
+    None
+*/
+INSERT INTO maintenance_state (key, value) VALUES (:key, :value)
+    ON CONFLICT (key) DO UPDATE SET value = excluded.value;
+
+-- name: delete_state!
+/* Forget a value saved by a maintenance job, e.g. when it's finished.
+
+Args:
+    key (str): Name of the value.
+
+Returns:
+    None
+*/
+DELETE FROM maintenance_state WHERE key = :key;
+
+-- name: insert_workday_event$
+/* Add a row to the event log for a change to the given workday.
+
+Args:
+    name (str): What happened, e.g. clock_in.
+    workday_id (int): The primary key id of the workday.
+    created (pendulum.DateTime): When it happened.
+
+Returns:
+    int: The new event id.
+*/
+INSERT INTO event (name, user_id, workday_id, created)
+SELECT :name, user_id, id, :created FROM workday WHERE id = :workday_id
+RETURNING id;
+
+-- name: prune_events!
+/* Delete all but the newest `keep` events.
+
+Args:
+    keep (int): How many events to keep.
+
+Returns:
+    None
+*/
+DELETE FROM event WHERE id <= (SELECT max(id) FROM event) - :keep;
+
+-- name: get_latest_event_id$
+/* Get the id of the newest event or 0 if there are none.
+
+Returns:
+    int
+*/
+SELECT coalesce(max(id), 0) FROM event;
+
+-- name: get_events_after
+/* Get the events newer than the given event id.
+
+Args:
+    last_id (int): The id of the last event seen.
+
+Returns:
+    Iterable of (id, name, user_id, workday_id, created) tuples.
+*/
+SELECT id, name, user_id, workday_id, created
+  FROM event
+ WHERE id > :last_id
+ ORDER BY id;
+
+-- name: insert_kiosk$
+/* Add a kiosk device.
+
+Args:
+    name (str): Where the kiosk is, e.g. the job site.
+    token_sha256 (str): Hex digest of the kiosk's bearer token.
+
+Returns:
+    int: The new kiosk id.
+*/
+INSERT INTO kiosk (name, token_sha256) VALUES (:name, :token_sha256)
+RETURNING id;
+
+-- name: get_kiosk_by_token$
+/* Get the id of the kiosk with the given token digest.
+
+Args:
+    token_sha256 (str): Hex digest of the kiosk's bearer token.
+
+Returns:
+    Optional[int]
+*/
+SELECT id FROM kiosk WHERE token_sha256 = :token_sha256;
+
+-- name: set_badge!
+/* Give a user a badge code or PIN, moving it from whoever had it before.
+
+Args:
+    code (str): The badge code or PIN.
+    user_id (int): The primary key id of the user.
+
+Returns:
+    None
+*/
+INSERT INTO badge (code, user_id) VALUES (:code, :user_id)
+    ON CONFLICT (code) DO UPDATE SET user_id = excluded.user_id;
+
+-- name: get_badge_users
+/* Look up the users of many badge codes at once.
+
+Args:
+    codes (str): JSON array of badge codes.
+
+Returns:
+    Iterable of (badge.code, badge.user_id) tuples for the known codes.
+*/
+SELECT code, user_id
+  FROM badge
+ WHERE code IN (SELECT value FROM json_each(:codes));
+
+-- name: get_user_workday_clocked_in_at$
+/* Get the user's workday that clocked in at the given time.
+
+Args:
+    user_id (int): The primary key id of the user.
+    at (pendulum.DateTime): Clock in timestamp.
+
+Returns:
+    Optional[int]: The workday id.
+*/
+SELECT id FROM workday WHERE user_id = :user_id AND clock_in = :at;
+
+-- name: get_user_workday_clocked_out_at$
+/* Get the user's workday that clocked out at the given time.
+
+Args:
+    user_id (int): The primary key id of the user.
+    at (pendulum.DateTime): Clock out timestamp.
+
+Returns:
+    Optional[int]: The workday id.
+*/
+SELECT id FROM workday WHERE user_id = :user_id AND clock_out = :at;
+
+-- name: insert_punch_workday$
+/* Start a workday for the user at the given time.
+
+Args:
+    user_id (int): The primary key id of the user.
+    clock_in (pendulum.DateTime): Clock in timestamp.
+
+Returns:
+    int: The new workday id.
+*/
+INSERT INTO workday (user_id, clock_in) VALUES (:user_id, :clock_in)
+RETURNING id;
+
+-- name: clock_out_workday!
+/* Set the clock out time of an open workday.
+
+Args:
+    workday_id (int): The primary key id of the workday.
+    clock_out (pendulum.DateTime): Clock out timestamp.
+
+Returns:
+    None
+*/
+UPDATE workday SET clock_out = :clock_out
+ WHERE id = :workday_id AND clock_out IS NULL;
+
+-- name: get_user_timesheet_ids
+/* Get a page of the user's saved timesheet ids, newest first.
+
+Args:
+    user_id (int): The primary key id of the user.
+    cursor (Optional[int]): Only timesheets with a smaller id, None for the
+        first page.
+    limit (int): Size of the page.
+
+Returns:
+    Iterable of (timesheet.id,) tuples.
+*/
+SELECT id
+  FROM all_timesheet
+ WHERE user_id = :user_id
+   AND (:cursor IS NULL OR id < :cursor)
+ ORDER BY id DESC
+ LIMIT :limit;
+
+-- name: get_employees_after
+/* Get a page of EMPLOYEE users ordered by id.
+
+Args:
+    cursor (int): Only users with a greater id.
+    limit (int): Size of the page.
+
+Returns:
+    Iterable of (id, username, role, email) tuples.
+*/
+SELECT id, username, role, email
+  FROM user
+ WHERE role = 'EMPLOYEE' AND id > :cursor
+ ORDER BY id
+ LIMIT :limit;
+
+-- name: add_profile_samples*!
+/* Add stack samples of a profiled request.
+
+Args:
+    endpoint (str): The request's flask endpoint.
+    stack (str): Frames root first, separated by ;.
+    samples (int): How many times the stack was sampled.
+
+Returns:
+    None
+*/
+INSERT INTO profile_sample (endpoint, stack, samples)
+VALUES (:endpoint, :stack, :samples)
+    ON CONFLICT (endpoint, stack) DO UPDATE
+   SET samples = samples + excluded.samples;
+
+-- name: get_profile_samples
+/* Get the profile samples of one or all endpoints.
+
+Args:
+    endpoint (Optional[str]): Only this endpoint, None for all.
+
+Returns:
+    Iterable of (endpoint, stack, samples) tuples.
+*/
+SELECT endpoint, stack, samples
+  FROM profile_sample
+ WHERE :endpoint IS NULL OR endpoint = :endpoint
+ ORDER BY endpoint, stack;
+
+-- name: clear_profile_samples!
+/* Delete all profile samples.
+
+Returns:
+    None
+*/
+DELETE FROM profile_sample;
+
+-- name: insert_users*!
+/* Insert many users at once.
+
+Args:
+    email (str): Login email.
+    password_hash (str): bcrypt hash of the password.
+    role (str): ADMIN, OWNER or EMPLOYEE.
+    username (str): Display name.
+
+Returns:
+    None
+*/
+INSERT INTO user (email, password_hash, role, username)
+VALUES (:email, :password_hash, :role, :username);
+
+-- name: get_taken_logins
+/* Get the users that already have one of the emails or usernames.
+
+Args:
+    emails (str): JSON array of emails.
+    usernames (str): JSON array of usernames.
+
+Returns:
+    Iterable of (email, username) tuples.
+*/
+SELECT email, username
+  FROM user
+ WHERE email IN (SELECT value FROM json_each(:emails))
+    OR username IN (SELECT value FROM json_each(:usernames));
+
+-- name: find_user^
+/* Get the user whose email or username is *login*, or else whose id is *user_id*.
+
+A username of digits is another user's id too, the user it names comes
+first.
+
+Args:
+    login (str): An email or username.
+    user_id (Optional[int]): An id, None if *login* can't be one.
+
+Returns:
+    Tuple[int, str, str]: id, email and username.
+*/
+SELECT id, email, username
+  FROM user
+ WHERE email = :login OR username = :login OR id = :user_id
+ ORDER BY email = :login OR username = :login DESC
+ LIMIT 1;
+
+-- name: get_user_keys
+/* Get every email, username and badge code with the user it belongs to.
+
+Returns:
+    Iterable of (key, user_id) tuples.
+*/
+SELECT email, id FROM user
+UNION ALL
+SELECT username, id FROM user
+UNION ALL
+SELECT code, user_id FROM badge;
+
+-- name: import_workdays*!
+/* Insert closed workdays, skipping any the user already clocked in at.
+
+Args:
+    user_id (int): The user.
+    clock_in (str): Clock in timestamp, formatted like the app stores them.
+    clock_out (str): Clock out timestamp.
+    notes (Optional[str]): Any notes.
+
+Returns:
+    int: Number of workdays inserted.
+*/
+INSERT INTO workday (user_id, clock_in, clock_out, notes)
+VALUES (:user_id, :clock_in, :clock_out, :notes)
+    ON CONFLICT (user_id, clock_in) DO NOTHING;
+
+-- name: get_photo_user_ids
+/* Get the users whose workdays have the photo.
+
+Args:
+    filename (str): The photo's filename.
+
+Returns:
+    Iterable of (user_id,) tuples, none if no workday has the photo.
+*/
+SELECT DISTINCT wd.user_id
+  FROM photo AS p
+  JOIN all_workday_photo AS wp ON wp.photo_id = p.id
+  JOIN all_workday AS wd ON wd.id = wp.workday_id
+ WHERE p.filename = :filename;
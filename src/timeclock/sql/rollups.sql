@@ -0,0 +1,130 @@
+-- name: delete_daily_hours!
+/* Delete one user's hours rollup of one day.
+
+Args:
+    user_id (int): The user.
+    day (pendulum.Date): The day.
+*/
+DELETE FROM hours_daily WHERE day = :day AND user_id = :user_id;
+
+-- name: insert_daily_hours!
+/* Sum one user's closed workdays that started on a day into hours_daily.
+
+Each workday's hours are rounded to the quarter hour like WorkDay.hours
+before they're added up. Nothing is inserted if there are no such workdays.
+
+Args:
+    user_id (int): The user.
+    day (pendulum.Date): The day.
+    next_day (pendulum.Date): The day after, clock_in is compared as text.
+*/
+INSERT INTO hours_daily (day, user_id, hours, workdays)
+SELECT :day, user_id,
+       sum(round(
+           ((strftime('%s', clock_out) - strftime('%s', clock_in)) / 60) / 15.0
+       ) / 4),
+       count(*)
+  FROM all_workday
+ WHERE user_id = :user_id
+   AND clock_in >= :day AND clock_in < :next_day
+   AND clock_out IS NOT NULL
+ GROUP BY user_id;
+
+-- name: delete_weekly_hours!
+/* Delete one user's hours rollup of one week.
+
+Args:
+    user_id (int): The user.
+    week (pendulum.Date): Monday of the week.
+*/
+DELETE FROM hours_weekly WHERE week = :week AND user_id = :user_id;
+
+-- name: insert_weekly_hours!
+/* Sum one user's daily rollups of a week into hours_weekly.
+
+Args:
+    user_id (int): The user.
+    week (pendulum.Date): Monday of the week.
+    next_week (pendulum.Date): Monday of the week after.
+*/
+INSERT INTO hours_weekly (week, user_id, hours, workdays)
+SELECT :week, user_id, sum(hours), sum(workdays)
+  FROM hours_daily
+ WHERE user_id = :user_id AND day >= :week AND day < :next_week
+ GROUP BY user_id;
+
+-- name: clear_daily_hours!
+/* Delete every daily hours rollup, see rebuild_daily_hours. */
+DELETE FROM hours_daily;
+
+-- name: clear_weekly_hours!
+/* Delete every weekly hours rollup, see rebuild_weekly_hours. */
+DELETE FROM hours_weekly;
+
+-- name: rebuild_daily_hours!
+/* Compute hours_daily from every closed workday, main and archived.
+
+The day is the date part of clock_in as it was stored, in the timezone of
+whoever clocked in. Same rounding as insert_daily_hours.
+*/
+INSERT INTO hours_daily (day, user_id, hours, workdays)
+SELECT substr(clock_in, 1, 10), user_id,
+       sum(round(
+           ((strftime('%s', clock_out) - strftime('%s', clock_in)) / 60) / 15.0
+       ) / 4),
+       count(*)
+  FROM all_workday
+ WHERE clock_out IS NOT NULL
+ GROUP BY 1, 2;
+
+-- name: rebuild_weekly_hours!
+/* Compute hours_weekly from hours_daily, weeks start on Monday. */
+INSERT INTO hours_weekly (week, user_id, hours, workdays)
+SELECT date(day, 'weekday 0', '-6 days'), user_id, sum(hours), sum(workdays)
+  FROM hours_daily
+ GROUP BY 1, 2;
+
+-- name: get_daily_rollup
+/* Hours per user per day, month or year between two days.
+
+Args:
+    start (pendulum.Date): First day, inclusive.
+    end (pendulum.Date): Last day, inclusive.
+    period (str): day, month or year.
+    user_id (Optional[int]): Only this user, every user if NULL.
+
+Returns:
+    List[Tuple[str, int, str, float, int]]: period, user_id, username, hours,
+        workdays ordered by period then username.
+*/
+SELECT CASE :period
+           WHEN 'year' THEN substr(h.day, 1, 4)
+           WHEN 'month' THEN substr(h.day, 1, 7)
+           ELSE h.day
+       END AS period,
+       h.user_id, u.username, sum(h.hours) AS hours, sum(h.workdays) AS workdays
+  FROM hours_daily AS h
+  JOIN user AS u ON u.id = h.user_id
+ WHERE h.day BETWEEN :start AND :end
+   AND (:user_id IS NULL OR h.user_id = :user_id)
+ GROUP BY 1, 2
+ ORDER BY 1, 3;
+
+-- name: get_weekly_rollup
+/* Hours per user per week for the weeks starting between two days.
+
+Args:
+    start (pendulum.Date): Monday of the first week.
+    end (pendulum.Date): Monday of the last week.
+    user_id (Optional[int]): Only this user, every user if NULL.
+
+Returns:
+    List[Tuple[str, int, str, float, int]]: week, user_id, username, hours,
+        workdays ordered by week then username.
+*/
+SELECT h.week AS period, h.user_id, u.username, h.hours, h.workdays
+  FROM hours_weekly AS h
+  JOIN user AS u ON u.id = h.user_id
+ WHERE h.week BETWEEN :start AND :end
+   AND (:user_id IS NULL OR h.user_id = :user_id)
+ ORDER BY 1, 3;
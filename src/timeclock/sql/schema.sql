@@ -15,8 +15,9 @@ CREATE TABLE user (
     )
 );
 
+-- AUTOINCREMENT, ids of archived rows (see archive.py) are never reused
 CREATE TABLE workday (
-    id INTEGER PRIMARY KEY,
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
     clock_in TIMESTAMP NOT NULL,
     clock_out TIMESTAMP,
@@ -29,7 +30,8 @@ CREATE TABLE workday (
 
 CREATE TABLE photo (
     id INTEGER PRIMARY KEY,
-    filename TEXT NOT NULL UNIQUE
+    filename TEXT NOT NULL UNIQUE,
+    sha256 TEXT UNIQUE
 );
 
 CREATE TABLE workday_photo (
@@ -45,7 +47,7 @@ CREATE TABLE workday_photo (
 );
 
 CREATE TABLE timesheet (
-    id INTEGER PRIMARY KEY,
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
     notes TEXT,
     FOREIGN KEY (user_id) REFERENCES user(id)
@@ -63,4 +65,158 @@ CREATE TABLE timesheet_workday (
     FOREIGN KEY (workday_id) REFERENCES workday(id)
         ON UPDATE CASCADE
         ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+CREATE INDEX workday_photo_photo_id ON workday_photo (photo_id);
+
+CREATE TABLE maintenance_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE event (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    workday_id INTEGER,
+    created TIMESTAMP NOT NULL
+);
+
+CREATE TABLE kiosk (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    token_sha256 TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE badge (
+    code TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX badge_user_id ON badge (user_id);
+
+CREATE TABLE profile_sample (
+    endpoint TEXT NOT NULL,
+    stack TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    PRIMARY KEY (endpoint, stack)
+);
+
+-- Hours per user per day and per week, see rollups.py
+CREATE TABLE hours_daily (
+    day TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    hours REAL NOT NULL,
+    workdays INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE hours_weekly (
+    week TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    hours REAL NOT NULL,
+    workdays INTEGER NOT NULL,
+    PRIMARY KEY (week, user_id),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Login throttling, see throttle.py
+CREATE TABLE rate_limit (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE throttle_counter (
+    name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- Responses of requests with an Idempotency-Key header, see idempotency.py
+CREATE TABLE idempotency_key (
+    user_id INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    request TEXT NOT NULL,
+    created REAL NOT NULL,
+    status INTEGER,
+    headers TEXT,
+    body BLOB,
+    PRIMARY KEY (user_id, key),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX idempotency_key_created ON idempotency_key (created);
+
+-- PDFs of saved timesheets rendered in the background, see pdfs.py. No
+-- foreign key, archived timesheets move to the archive database.
+CREATE TABLE pdf_job (
+    timesheet_id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'queued',
+    queued REAL NOT NULL,
+    started REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    sha256 TEXT,
+    error TEXT
+);
+
+CREATE INDEX pdf_job_status ON pdf_job (status, queued);
+
+-- Planned shifts, see shifts.py. A template repeats every week on weekday
+-- (0 is Monday) at start (HH:MM local time) from valid_from to valid_until
+-- (YYYY-MM-DD, inclusive, NULL for no end).
+CREATE TABLE shift_template (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    weekday INTEGER NOT NULL,
+    start TEXT NOT NULL,
+    minutes INTEGER NOT NULL,
+    valid_from TEXT NOT NULL,
+    valid_until TEXT,
+    CHECK (weekday BETWEEN 0 AND 6),
+    CHECK (minutes > 0),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX shift_template_user_id ON shift_template (user_id);
+
+-- One-off shifts, on top of the templates'
+CREATE TABLE shift (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    start TIMESTAMP NOT NULL,
+    end TIMESTAMP NOT NULL,
+    CHECK (end > start),
+    FOREIGN KEY (user_id) REFERENCES user(id)
+        ON UPDATE CASCADE
+        ON DELETE CASCADE
+);
+
+CREATE INDEX shift_start ON shift (start);
+
+-- Punches of every user in a date range, for reconciling with shifts
+CREATE INDEX workday_clock_in ON workday (clock_in);
+
+-- Last run of each scheduled maintenance job, see maintenance.py. Times are
+-- unix times.
+CREATE TABLE maintenance_run (
+    job TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    seconds REAL NOT NULL,
+    result TEXT NOT NULL DEFAULT '',
+    error TEXT
+);
+
+-- Workdays still clocked in, for auto clock-out
+CREATE INDEX workday_open ON workday (clock_in) WHERE clock_out IS NULL;
@@ -0,0 +1,138 @@
+-- name: insert_shift_template$
+/* Add a weekly shift.
+
+Args:
+    user_id (int): Who works it.
+    weekday (int): 0 is Monday.
+    start (str): HH:MM local time.
+    minutes (int): How long it is.
+    valid_from (pendulum.Date): First day it's worked.
+    valid_until (Optional[pendulum.Date]): Last day it's worked, NULL for no
+        end.
+
+Returns:
+    int: The new template id.
+*/
+INSERT INTO shift_template (
+    user_id, weekday, start, minutes, valid_from, valid_until
+)
+VALUES (:user_id, :weekday, :start, :minutes, :valid_from, :valid_until)
+RETURNING id;
+
+-- name: end_shift_template!
+/* Stop a weekly shift after a day, keeping the shifts before for reports.
+
+Args:
+    template_id (int): The template.
+    day (pendulum.Date): Its last day.
+*/
+UPDATE shift_template
+   SET valid_until = :day
+ WHERE id = :template_id AND (valid_until IS NULL OR valid_until > :day);
+
+-- name: delete_shift_template!
+/* Delete a weekly shift that never started.
+
+Args:
+    template_id (int): The template.
+    day (pendulum.Date): Only if valid_from is after this day.
+*/
+DELETE FROM shift_template WHERE id = :template_id AND valid_from > :day;
+
+-- name: get_employee_names
+/* EMPLOYEEs to plan shifts for.
+
+Returns:
+    List[Tuple[int, str]]: id and username ordered by username.
+*/
+SELECT id, username FROM user WHERE role = 'EMPLOYEE' ORDER BY username;
+
+-- name: get_shift_templates
+/* Weekly shifts worked on any day of a range.
+
+Args:
+    start (pendulum.Date): First day.
+    end (pendulum.Date): Last day.
+    user_id (Optional[int]): Only this user's, every user's if NULL.
+
+Returns:
+    List[Tuple[int, int, str, int, int, str, Optional[str]]]: id, user_id,
+        username, weekday, start, minutes, valid_from and valid_until ordered
+        by username, weekday and start.
+*/
+SELECT t.id, t.user_id, u.username, t.weekday, t.start, t.minutes,
+       t.valid_from, t.valid_until
+  FROM shift_template AS t
+  JOIN user AS u ON u.id = t.user_id
+ WHERE t.valid_from <= :end
+   AND (t.valid_until IS NULL OR t.valid_until >= :start)
+   AND (:user_id IS NULL OR t.user_id = :user_id)
+ ORDER BY u.username, t.weekday, t.start;
+
+-- name: insert_shift$
+/* Add a one-off shift.
+
+Args:
+    user_id (int): Who works it.
+    start (pendulum.DateTime): When it starts.
+    end (pendulum.DateTime): When it ends.
+
+Returns:
+    int: The new shift id.
+*/
+INSERT INTO shift (user_id, start, end)
+VALUES (:user_id, :start, :end)
+RETURNING id;
+
+-- name: delete_shift!
+/* Delete a one-off shift.
+
+Args:
+    shift_id (int): The shift.
+*/
+DELETE FROM shift WHERE id = :shift_id;
+
+-- name: get_shifts
+/* One-off shifts starting in a range, as unix times.
+
+Args:
+    after (str): Only shifts starting on or after this day (YYYY-MM-DD).
+    before (str): Only shifts starting before this day.
+    user_id (Optional[int]): Only this user's, every user's if NULL.
+
+Returns:
+    List[Tuple[int, int, str, int, int]]: id, user_id, username, start and
+        end.
+*/
+SELECT s.id, s.user_id, u.username,
+       CAST(strftime('%s', s.start) AS INTEGER),
+       CAST(strftime('%s', s.end) AS INTEGER)
+  FROM shift AS s
+  JOIN user AS u ON u.id = s.user_id
+ WHERE s.start >= :after AND s.start < :before
+   AND (:user_id IS NULL OR s.user_id = :user_id);
+
+-- name: get_punch_spans
+/* Workdays overlapping a span, as unix times, ordered for reconciling.
+
+Args:
+    after (str): Only workdays clocked in on or after this day (YYYY-MM-DD),
+        compared as text so the clock_in index is used.
+    before (str): Only workdays clocked in before this day.
+    start (int): Unix time the span starts.
+    end (int): Unix time the span ends.
+    user_id (Optional[int]): Only this user's, every user's if NULL.
+
+Returns:
+    Iterable[Tuple[int, int, int, Optional[int]]]: id, user_id, clock in and
+        clock out (NULL while open) ordered by user_id then clock in.
+*/
+SELECT id, user_id, start, end
+  FROM (SELECT id, user_id,
+               CAST(strftime('%s', clock_in) AS INTEGER) AS start,
+               CAST(strftime('%s', clock_out) AS INTEGER) AS end
+          FROM workday
+         WHERE clock_in >= :after AND clock_in < :before
+           AND (:user_id IS NULL OR user_id = :user_id))
+ WHERE start < :end AND (end IS NULL OR end > :start)
+ ORDER BY user_id, start;
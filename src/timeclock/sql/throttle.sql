@@ -0,0 +1,68 @@
+-- name: take_token$
+/* Take a token from a bucket if it has one.
+
+The bucket is refilled for the time since it was last touched first. A key
+without a row is a full bucket.
+
+Args:
+    key (str): Bucket name and whose bucket, e.g. ip:10.0.0.1.
+    capacity (float): Most tokens the bucket holds.
+    per_second (float): Tokens added per second.
+    now (float): Unix time.
+
+Returns:
+    Optional[float]: Tokens left, None if the bucket was empty.
+*/
+INSERT INTO rate_limit (key, tokens, updated)
+VALUES (:key, :capacity - 1, :now)
+    ON CONFLICT (key) DO UPDATE
+   SET tokens = min(:capacity, tokens + (:now - updated) * :per_second) - 1,
+       updated = :now
+ WHERE min(:capacity, tokens + (:now - updated) * :per_second) >= 1
+RETURNING tokens;
+
+-- name: get_tokens^
+/* Get a bucket's tokens and when they were last counted.
+
+Args:
+    key (str): Bucket name and whose bucket.
+
+Returns:
+    Optional[Tuple[float, float]]: tokens and unix time updated.
+*/
+SELECT tokens, updated FROM rate_limit WHERE key = :key;
+
+-- name: delete_bucket!
+/* Refill a bucket by forgetting it.
+
+Args:
+    key (str): Bucket name and whose bucket.
+*/
+DELETE FROM rate_limit WHERE key = :key;
+
+-- name: prune_buckets!
+/* Forget buckets that have been full for a while.
+
+Args:
+    prefix (str): Bucket name followed by ':'.
+    before (float): Unix time the buckets were full by.
+*/
+DELETE FROM rate_limit
+ WHERE substr(key, 1, length(:prefix)) = :prefix AND updated < :before;
+
+-- name: increment_counter!
+/* Add one to a throttling counter.
+
+Args:
+    name (str): The counter.
+*/
+INSERT INTO throttle_counter (name, count) VALUES (:name, 1)
+    ON CONFLICT (name) DO UPDATE SET count = count + 1;
+
+-- name: get_counters
+/* Get every throttling counter.
+
+Returns:
+    Iterable of (name, count) tuples.
+*/
+SELECT name, count FROM throttle_counter ORDER BY name;
@@ -0,0 +1,65 @@
+/*
+Server Sent Events Extension
+============================
+A trimmed down version of the htmx sse extension. Supports `sse-connect` to
+open an EventSource and `sse-swap` on descendants to swap the data of the
+named event into the element. The browser reconnects on its own and sends the
+Last-Event-ID header so no events are missed.
+*/
+(function () {
+    var api;
+
+    htmx.defineExtension('sse', {
+        init: function (apiRef) {
+            api = apiRef;
+        },
+
+        onEvent: function (name, evt) {
+            if (name === "htmx:beforeCleanupElement") {
+                var internalData = api.getInternalData(evt.target);
+                if (internalData.sseEventSource) {
+                    internalData.sseEventSource.close();
+                }
+            } else if (name === "htmx:afterProcessNode") {
+                connect(evt.target);
+            }
+        }
+    });
+
+    function connect(elt) {
+        if (!elt.getAttribute || !elt.getAttribute("sse-connect")) {
+            return;
+        }
+        var internalData = api.getInternalData(elt);
+        if (internalData.sseEventSource) {
+            return;
+        }
+        var source = new EventSource(elt.getAttribute("sse-connect"));
+        internalData.sseEventSource = source;
+        source.onerror = function (err) {
+            api.triggerErrorEvent(elt, "htmx:sseError", {error: err, source: source});
+        };
+        // Listeners are added on the connecting element so rows swapped in
+        // later (which have their own sse-swap attribute) are still handled.
+        elt.querySelectorAll("[sse-swap]").forEach(function (child) {
+            listen(source, child.getAttribute("sse-swap"));
+        });
+    }
+
+    function listen(source, eventName) {
+        source.addEventListener(eventName, function (event) {
+            var target = document.querySelector('[sse-swap="' + eventName + '"]');
+            if (!target) {
+                return;
+            }
+            var swapSpec = api.getSwapSpecification(target);
+            var settleInfo = api.makeSettleInfo(target);
+            api.selectAndSwap(swapSpec.swapStyle, target, target, event.data, settleInfo);
+            settleInfo.elts.forEach(function (elt) {
+                htmx.process(elt);
+            });
+            api.settleImmediately(settleInfo.tasks);
+            api.triggerEvent(target, "htmx:sseMessage", event);
+        });
+    }
+})();
\ No newline at end of file
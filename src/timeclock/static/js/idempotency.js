@@ -0,0 +1,18 @@
+// Send data-idempotency-key as the Idempotency-Key header so a retried
+// clock in/out or photo upload is replayed instead of done twice, and take
+// a new key once a request went through (see idempotency.py).
+document.body.addEventListener("htmx:configRequest", function (evt) {
+  var key = evt.detail.elt.dataset.idempotencyKey;
+  if (key) {
+    evt.detail.headers["Idempotency-Key"] = key;
+  }
+});
+
+document.body.addEventListener("htmx:afterRequest", function (evt) {
+  var elt = evt.detail.elt;
+  if (evt.detail.successful && elt.dataset.idempotencyKey) {
+    // randomUUID needs https, without it requests just aren't deduplicated
+    elt.dataset.idempotencyKey = window.crypto && crypto.randomUUID
+      ? crypto.randomUUID() : "";
+  }
+});
@@ -0,0 +1,156 @@
+"""Serve several companies from one process, one database file each.
+
+Set TIMECLOCK_TENANT_ROUTING to pick how the tenant is found:
+
+- "prefix": the first path segment, /acme/timeclock/... uses acme.db.
+- "host": the first label of the host name, acme.example.com uses acme.db.
+
+Databases live in TIMECLOCK_TENANTS_DIR as <tenant>.db and are never created
+by a request, unknown tenants get a 404. Create them with
+`timeclock-cli create-tenant`. They're all migrated when the app starts.
+"""
+import re
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional
+
+from flask import Flask, abort, current_app, g, request
+
+from .db import create_db, migrate, reset_db_file, set_db_file
+
+TENANT_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+ENVIRON_KEY = "timeclock.tenant"
+ROUTING_MODES = ("prefix", "host")
+
+
+class PrefixMiddleware:
+    """Move the tenant path segment from PATH_INFO to SCRIPT_NAME.
+
+    Flask then routes and builds urls (url_for) as if the app was mounted at
+    /<tenant>, so no view or template needs to know about tenants.
+    """
+
+    def __init__(self, wsgi_app: Callable) -> None:
+        """Init PrefixMiddleware."""
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        """Strip the tenant from the path."""
+        _, tenant, *rest = environ.get("PATH_INFO", "").split("/", 2)
+        if TENANT_RE.match(tenant):
+            environ[ENVIRON_KEY] = tenant
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + "/" + tenant
+            environ["PATH_INFO"] = "/" + (rest[0] if rest else "")
+        return self.wsgi_app(environ, start_response)
+
+
+def db_path(tenants_dir: Path, tenant: str) -> Path:
+    """Return the database file for *tenant*.
+
+    Raises:
+        ValueError: If *tenant* isn't a valid tenant name.
+    """
+    if not TENANT_RE.match(tenant):
+        raise ValueError(f"Invalid tenant name {tenant!r}")
+    return tenants_dir / f"{tenant}.db"
+
+
+def create_tenant(tenants_dir: Path, tenant: str) -> Path:
+    """Create the database for a new tenant.
+
+    Raises:
+        ValueError: If the name is invalid or the tenant already exists.
+    """
+    db_file = db_path(tenants_dir, tenant)
+    if db_file.exists():
+        raise ValueError(f"Tenant {tenant!r} already exists")
+    tenants_dir.mkdir(parents=True, exist_ok=True)
+    create_db(db_file)
+    return db_file
+
+
+def db_files(tenants_dir: Path) -> List[Path]:
+    """Return the database files of every tenant."""
+    return sorted(
+        path
+        for path in tenants_dir.glob("*.db")
+        if TENANT_RE.match(path.stem)
+    )
+
+
+def current() -> Optional[str]:
+    """Return the tenant of the current request, None when not multi-tenant."""
+    return g.get("tenant")
+
+
+def upload_path() -> Path:
+    """Return the UPLOAD_PATH for the current tenant.
+
+    Every tenant gets its own directory so photo garbage collection in one
+    tenant never sees another tenant's files.
+    """
+    path: Path = current_app.config["UPLOAD_PATH"]
+    tenant = current()
+    return path / tenant if tenant else path
+
+
+def pdf_path() -> Path:
+    """Return the PDF_PATH for the current tenant, see `upload_path`."""
+    path: Path = current_app.config["PDF_PATH"]
+    tenant = current()
+    return path / tenant if tenant else path
+
+
+def _tenant_from_request() -> str:
+    if current_app.config["TENANT_ROUTING"] == "prefix":
+        return request.environ.get(ENVIRON_KEY, "")
+    return request.host.split(":", 1)[0].split(".", 1)[0].lower()
+
+
+def _select_tenant() -> None:
+    tenant = _tenant_from_request()
+    try:
+        db_file = db_path(current_app.config["TENANTS_DIR"], tenant)
+    except ValueError:
+        abort(404)
+    if not db_file.exists():
+        abort(404)
+    g.tenant = tenant
+    g.tenant_token = set_db_file(db_file)
+
+
+def _reset_tenant(exc: Optional[BaseException]) -> None:
+    token = g.pop("tenant_token", None)
+    if token is not None:
+        try:
+            reset_db_file(token)
+        except ValueError:
+            # Torn down in a different context than it was set up in, the
+            # next request sets its own tenant anyways.
+            pass
+
+
+def init_app(app: Flask, routing: str, tenants_dir: Path) -> None:
+    """Route every request of *app* to its tenant's database.
+
+    Raises:
+        ValueError: If *routing* isn't one of ROUTING_MODES.
+    """
+    if routing not in ROUTING_MODES:
+        raise ValueError(f"TIMECLOCK_TENANT_ROUTING must be one of {ROUTING_MODES}")
+    app.config["TENANT_ROUTING"] = routing
+    app.config["TENANTS_DIR"] = tenants_dir
+    for db_file in db_files(tenants_dir):
+        migrate(db_file)
+    if routing == "prefix":
+        app.wsgi_app = PrefixMiddleware(app.wsgi_app)  # type: ignore
+    app.before_request(_select_tenant)
+    app.teardown_request(_reset_tenant)
+
+
+def session_matches(session: Any) -> bool:
+    """Whether a login session belongs to the current tenant.
+
+    User ids are only unique within a tenant so a session cookie from one
+    tenant must never load a user in another.
+    """
+    return session.get("tenant") == current()
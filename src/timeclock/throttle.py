@@ -0,0 +1,121 @@
+"""Login throttling with token buckets.
+
+Every login attempt takes a token from the bucket of the client's IP and
+from the bucket of the email it tries. Buckets refill at a steady rate, an
+attempt that finds either empty is turned away with 429 before the password
+is checked, so a burst of bad logins can't keep the workers busy hashing.
+The buckets live in the rate_limit table so every worker process shares
+them.
+"""
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from .db import Q, db_conn, transaction
+
+# Prune full buckets every this many checks in a process
+PRUNE_EVERY = 100
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """A kind of token bucket.
+
+    Attributes:
+        name (str): Prefix of the bucket keys and of its counter.
+        capacity (float): Attempts allowed in a burst.
+        per_second (float): Attempts allowed per second after a burst.
+    """
+
+    name: str
+    capacity: float
+    per_second: float
+
+    def key(self, who: str) -> str:
+        """The rate_limit key of *who*'s bucket."""
+        return f"{self.name}:{who}"
+
+    @property
+    def full_after(self) -> float:
+        """Seconds an empty bucket takes to fill up."""
+        return self.capacity / self.per_second
+
+
+# A NAT'd office shares an IP, allow a few people mistyping at once
+IP = Bucket("ip", capacity=20, per_second=1 / 3)
+ACCOUNT = Bucket("account", capacity=5, per_second=1 / 30)
+
+
+class _Pruner:
+    def __init__(self) -> None:
+        self.checks = 0
+
+    def maybe_prune(self, now: float) -> None:
+        self.checks += 1
+        if self.checks % PRUNE_EVERY:
+            return
+        with db_conn() as conn:
+            with transaction(conn):
+                for bucket in (IP, ACCOUNT):
+                    Q.prune_buckets(
+                        conn, prefix=bucket.key(""), before=now - bucket.full_after
+                    )
+
+
+PRUNER = _Pruner()
+
+
+def _retry_after(tokens: Optional[float], bucket: Bucket) -> int:
+    missing = 1 - (tokens or 0)
+    return max(1, math.ceil(missing / bucket.per_second))
+
+
+def check_login(ip: str, email: str) -> Optional[int]:
+    """Take a token for a login attempt from *ip* for *email*.
+
+    Returns:
+        Optional[int]: None if the attempt may go ahead, otherwise seconds
+            until it may be retried.
+    """
+    now = time.time()
+    PRUNER.maybe_prune(now)
+    with db_conn() as conn:
+        with transaction(conn):
+            for bucket, who in ((IP, ip), (ACCOUNT, email.strip().lower())):
+                key = bucket.key(who)
+                if Q.take_token(
+                    conn,
+                    key=key,
+                    capacity=bucket.capacity,
+                    per_second=bucket.per_second,
+                    now=now,
+                ) is not None:
+                    continue
+                Q.increment_counter(conn, name=f"{bucket.name}_rejected")
+                tokens, updated = Q.get_tokens(conn, key=key)
+                tokens += (now - updated) * bucket.per_second
+                return _retry_after(tokens, bucket)
+    return None
+
+
+def login_succeeded(email: str) -> None:
+    """Refill the account's bucket, its owner knows the password."""
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.delete_bucket(conn, key=ACCOUNT.key(email.strip().lower()))
+
+
+def login_failed() -> None:
+    """Count a login with a wrong email or password."""
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.increment_counter(conn, name="login_failed")
+
+
+def counters() -> Dict[str, int]:
+    """How many login attempts were rejected per bucket, or failed."""
+    with db_conn() as conn:
+        return dict(Q.get_counters(conn))
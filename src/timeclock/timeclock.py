@@ -1,17 +1,13 @@
 """Business logic for managing the timeclock."""
 from __future__ import annotations
 
-import os
-from pathlib import Path
-
 import pendulum
 
+from . import events, rollups
 from .db import db_conn, transaction
 from .users import User
 from .workday import WorkDay
 
-DB_FILE = Path(os.getenv("TIMECLOCK_DB", "test.db"))
-
 
 class AlreadyClockedInError(Exception):
     """Raised when try to clock in user who is already clocked in."""
@@ -34,7 +30,7 @@ def clocked_in(user: User) -> bool:
     Returns:
         bool: Whether the user is logged in.
     """
-    with db_conn(DB_FILE) as conn:
+    with db_conn() as conn:
         cursor = conn.execute(
             """--sql
                 SELECT id, clock_in, clock_out
@@ -67,7 +63,7 @@ def clock_in(user: User) -> WorkDay:
         raise AlreadyClockedInError(f"{user}")
 
     now = pendulum.now()
-    with db_conn(DB_FILE) as conn:
+    with db_conn() as conn:
         with transaction(conn):
             cursor = conn.execute(
                 """--sql
@@ -77,6 +73,7 @@ def clock_in(user: User) -> WorkDay:
                 dict(now=now, user_id=user.id),
             )
             id = cursor.fetchone()[0]
+            events.publish(conn, "clock_in", id)
     return WorkDay(id=id, clock_in=now)
 
 
@@ -97,7 +94,7 @@ def clock_out(user: User) -> int:
 
     workday = WorkDay.current(user)
     now = pendulum.now()
-    with db_conn(DB_FILE) as conn:
+    with db_conn() as conn:
         with transaction(conn):
             conn.execute(
                 """--sql
@@ -105,4 +102,6 @@ def clock_out(user: User) -> int:
                 WHERE id = :id;""",
                 dict(now=now, id=workday.id),
             )
+            rollups.refresh(conn, user.user_id, [workday.clock_in.date()])
+            events.publish(conn, "clock_out", workday.id)
     return workday.id
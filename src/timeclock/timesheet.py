@@ -1,17 +1,18 @@
 """TimeSheet class."""
 from __future__ import annotations
 
-import os
-from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, Iterator, List, Optional, Set
 
 import pendulum
 
-from .db import class_row, db_conn, transaction
+from . import pdfs, shifts
+from .db import Q, class_row, db_conn, transaction
+from .timeclock import clocked_in
 from .users import User
 from .workday import WorkDay
 
-DB_FILE = Path(os.getenv("TIMECLOCK_DB", "test.db"))
+# Saved timesheet ids read at a time by iter_past_timesheets
+PAST_PAGE_SIZE = 50
 
 
 class TimeSheet:
@@ -35,16 +36,20 @@ class TimeSheet:
 
     @classmethod
     def from_id(cls, id: int) -> TimeSheet:
-        """Load a saved (archived) timesheet."""
+        """Load a saved (archived) timesheet.
+
+        Reads through the all_* views so timesheets moved to the archive
+        database load the same as the rest.
+        """
         work_days = []
-        with db_conn(DB_FILE) as conn:
+        with db_conn() as conn:
             cursor = conn.execute(
                 """--sql
                 SELECT wd.id
-                FROM workday wd
+                FROM all_workday wd
                 WHERE wd.id IN (
                     SELECT workday_id
-                    FROM timesheet_workday
+                    FROM all_timesheet_workday
                     WHERE timesheet_id = :id);""",
                 dict(id=id),
             )
@@ -52,7 +57,7 @@ class TimeSheet:
             cursor.execute(
                 """--sql
                 SELECT notes
-                FROM timesheet
+                FROM all_timesheet
                 WHERE id = :id;""",
                 dict(id=id),
             )
@@ -65,7 +70,7 @@ class TimeSheet:
     def current(cls, user: User) -> TimeSheet:
         """Get the current timesheet for the user."""
         work_days = []
-        with db_conn(DB_FILE) as conn:
+        with db_conn() as conn:
             cursor = conn.execute(
                 """--sql
                 SELECT wd.id
@@ -81,8 +86,11 @@ class TimeSheet:
         return cls(work_days)
 
     def save(self, user: User, notes: str, workday_ids: Set[int]) -> None:
-        """OWNER role can archive (save) a timesheet."""
-        with db_conn(DB_FILE) as conn:
+        """OWNER role can archive (save) a timesheet.
+
+        Its PDF is rendered in the background, see pdfs.py.
+        """
+        with db_conn() as conn:
             with transaction(conn):
                 cursor = conn.execute(
                     """--sql
@@ -99,6 +107,11 @@ class TimeSheet:
                         VALUES (:ts_id, :wd_id);""",
                         dict(ts_id=ts_id, wd_id=wd_id),
                     )
+                pdfs.queue(conn, ts_id)
+        pdfs.wake()
+        for wd in self.work_days:
+            if wd.id in workday_ids:
+                wd.forget()
 
     @property
     def start_id(self) -> int:
@@ -146,8 +159,7 @@ class TimeSheet:
 
 def get_overview() -> List[Dict]:
     """OWNER role can view a summary/overview of all EMPLOYEE timesheets."""
-    overview = []
-    with db_conn(DB_FILE, class_row(User)) as conn:
+    with db_conn(row_factory=class_row(User)) as conn:
         cursor = conn.execute(
             """--sql
             SELECT id, username, role, email
@@ -155,31 +167,58 @@ def get_overview() -> List[Dict]:
             WHERE role = 'EMPLOYEE';"""
         )
         user_rows = cursor.fetchall()
-    for user in user_rows:
-        overview.append(
-            dict(
-                id=user.id,
-                username=user.username,
-                email=user.email,
-                hours=TimeSheet.current(user).hours,
-            )
-        )
-    return overview
+    week = shifts.this_week()
+    return [get_overview_row(user, week) for user in user_rows]
+
+
+def get_overview_row(
+    user: User, week: Optional[Dict[int, shifts.Coverage]] = None
+) -> Dict:
+    """A single EMPLOYEE's row of the overview.
+
+    Args:
+        user (User): The EMPLOYEE.
+        week (Optional[Dict[int, shifts.Coverage]]): This week's shift
+            coverage per user_id, only the user's is computed if None.
+    """
+    if week is None:
+        week = shifts.this_week(user.user_id)
+    coverage = week.get(user.user_id)
+    return dict(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        hours=TimeSheet.current(user).hours,
+        clocked_in=clocked_in(user),
+        coverage=coverage.percent if coverage else None,
+        late=coverage.late if coverage else 0,
+        no_shows=coverage.no_shows if coverage else 0,
+    )
+
+
+def iter_past_timesheets(user: User) -> Iterator[TimeSheet]:
+    """Yield every saved timesheet of the user, newest first.
+
+    Timesheets are loaded as they're reached and ids are read a page at a
+    time, no cursor is left open between them, so a streamed page can send
+    the first rows before the rest are read.
+    """
+    cursor = None
+    while True:
+        with db_conn() as conn:
+            ts_ids = [
+                row[0]
+                for row in Q.get_user_timesheet_ids(
+                    conn, user_id=user.user_id, cursor=cursor, limit=PAST_PAGE_SIZE
+                )
+            ]
+        for ts_id in ts_ids:
+            yield TimeSheet.from_id(ts_id)
+        if len(ts_ids) < PAST_PAGE_SIZE:
+            return
+        cursor = ts_ids[-1]
 
 
 def get_past_timesheets(user: User) -> List[TimeSheet]:
     """Return every archived timesheet for the user."""
-    past_timesheets = []
-    with db_conn(DB_FILE) as conn:
-        cursor = conn.execute(
-            """--sql
-            SELECT id
-            FROM timesheet
-            WHERE user_id = :user_id
-            ORDER BY id DESC;""",
-            dict(user_id=user.user_id),
-        )
-        ts_ids = [r[0] for r in cursor.fetchall()]
-        for ts_id in ts_ids:
-            past_timesheets.append(TimeSheet.from_id(ts_id))
-    return past_timesheets
+    return list(iter_past_timesheets(user))
@@ -2,17 +2,17 @@
 
 from __future__ import annotations
 
-import os
+import json
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
-from pathlib import Path
+from functools import cache
+from typing import Dict, Iterable, List, Optional
 
 import bcrypt
 from flask_login import UserMixin
 
-from .db import db_conn, transaction
-
-DB_FILE = Path(os.getenv("TIMECLOCK_DB", "test.db"))
+from .db import Q, db_conn, transaction
 
 
 class Role(Enum):
@@ -40,7 +40,7 @@ class User(UserMixin):
     @classmethod
     def get(cls, user_id: str) -> User:
         """Load User from database."""
-        with db_conn(DB_FILE) as conn:
+        with db_conn() as conn:
             cursor = conn.execute(
                 """--sql
                 SELECT id, email, role, username
@@ -59,6 +59,16 @@ class User(UserMixin):
         return int(self.id)
 
 
+def hash_password(unhashed_password: str) -> str:
+    """Return the bcrypt hash of the password."""
+    return bcrypt.hashpw(unhashed_password.encode(), bcrypt.gensalt()).decode()
+
+
+@cache
+def _dummy_hash() -> bytes:
+    return hash_password("").encode()
+
+
 def register_user(
     email: str, unhashed_password: str, role: Role, username: str
 ) -> User:
@@ -67,10 +77,9 @@ def register_user(
     Raises:
         sqlite3.IntegrityError: If email already registered
     """
-    hash = bcrypt.hashpw(unhashed_password.encode(), bcrypt.gensalt())
-    password_hash = hash.decode()
+    password_hash = hash_password(unhashed_password)
 
-    with db_conn(DB_FILE) as conn:
+    with db_conn() as conn:
         with transaction(conn):
             cursor = conn.execute(
                 """--sql
@@ -91,25 +100,132 @@ def register_user(
 
 def delete_user(user_id: int) -> bool:
     """Remove user from database."""
-    with db_conn(DB_FILE) as conn:
+    with db_conn() as conn:
         with transaction(conn):
-            conn.execute(
+            cursor = conn.execute(
                 """--sql
                 DELETE FROM user
                  WHERE id = :user_id;""",
                 dict(user_id=user_id),
             )
-        ret = bool(conn.total_changes)
+            # No foreign keys across database files to cascade these
+            Q.delete_archived_user_workdays(conn, user_id=user_id)
+            Q.delete_archived_user_timesheets(conn, user_id=user_id)
+        ret = bool(cursor.rowcount)
     return ret
 
 
+def find_user(login: str) -> Optional[User]:
+    """Return the user whose email, username or else id is *login*."""
+    user_id = int(login) if login.isdigit() else None
+    with db_conn() as conn:
+        row = Q.find_user(conn, login=login, user_id=user_id)
+    return User.get(row[0]) if row else None
+
+
+@dataclass
+class ImportRow:
+    """One user of an import and what happened to it.
+
+    Attributes:
+        line (int): Line number in the CSV file, the header is line 1.
+        email (str): The user's email.
+        username (str): The user's username.
+        error (Optional[str]): Why the user wasn't imported, None if it was.
+    """
+
+    line: int
+    email: str
+    username: str
+    error: Optional[str] = None
+
+
+def import_users(
+    rows: Iterable[Dict[str, str]],
+    default_role: Role = Role.EMPLOYEE,
+    workers: Optional[int] = None,
+) -> List[ImportRow]:
+    """Create many users at once, e.g. from a csv.DictReader.
+
+    Each row has email, username, password and optionally role. Rows are
+    checked before anything is written: a row with a missing field, an
+    unknown role or an email or username that is taken (in the database or
+    by an earlier row) is reported and skipped. The passwords of the other
+    rows are hashed in *workers* processes (all cores by default) and the
+    users inserted in one transaction.
+
+    Returns:
+        List[ImportRow]: One per row, in order.
+    """
+    report: List[ImportRow] = []
+    valid: List[Dict[str, str]] = []
+    emails, usernames = set(), set()
+    for line, row in enumerate(rows, start=2):
+        email = (row.get("email") or "").strip()
+        username = (row.get("username") or "").strip()
+        password = row.get("password") or ""
+        role = (row.get("role") or default_role.name).strip().upper()
+        result = ImportRow(line, email, username)
+        report.append(result)
+        if not email or "@" not in email:
+            result.error = "invalid email"
+        elif not username:
+            result.error = "missing username"
+        elif not password:
+            result.error = "missing password"
+        elif role not in Role.__members__:
+            result.error = f"unknown role {role}"
+        elif email in emails:
+            result.error = "duplicate email"
+        elif username in usernames:
+            result.error = "duplicate username"
+        else:
+            emails.add(email)
+            usernames.add(username)
+            valid.append(
+                dict(email=email, username=username, password=password, role=role)
+            )
+
+    with db_conn() as conn:
+        taken = Q.get_taken_logins(
+            conn,
+            emails=json.dumps(sorted(emails)),
+            usernames=json.dumps(sorted(usernames)),
+        )
+    taken_emails = {email for email, _ in taken}
+    taken_usernames = {username for _, username in taken}
+    by_email = {r.email: r for r in report if r.error is None}
+    for user in valid:
+        if user["email"] in taken_emails:
+            by_email[user["email"]].error = "email already registered"
+        elif user["username"] in taken_usernames:
+            by_email[user["email"]].error = "username already registered"
+    valid = [u for u in valid if by_email[u["email"]].error is None]
+    if not valid:
+        return report
+
+    passwords = [u.pop("password") for u in valid]
+    if len(valid) == 1:
+        hashes = [hash_password(passwords[0])]
+    else:
+        # bcrypt is slow on purpose, hash on every core
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            hashes = list(pool.map(hash_password, passwords, chunksize=8))
+    for user, password_hash in zip(valid, hashes):
+        user["password_hash"] = password_hash
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.insert_users(conn, valid)
+    return report
+
+
 def verify_user(email: str, unhashed_password: str) -> User:
     """Check that password matches for user.
 
     Raises:
         ValueError: If email doesn't exist or password does not match
     """
-    with db_conn(DB_FILE) as conn:
+    with db_conn() as conn:
         with transaction(conn):
             cursor = conn.execute(
                 """--sql
@@ -121,6 +237,9 @@ def verify_user(email: str, unhashed_password: str) -> User:
             row = cursor.fetchone()
 
     if not row:
+        # Same bcrypt work as a wrong password so timing doesn't tell
+        # whether the email is registered
+        bcrypt.checkpw(unhashed_password.encode(), _dummy_hash())
         raise ValueError("No user with that email")
     id, email, role, username, password_hash = row
 
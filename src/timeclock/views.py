@@ -1,28 +1,55 @@
 """View functions."""
+import json
+import mimetypes
+import os
 import sqlite3
+import tempfile
+import tracemalloc
+from dataclasses import asdict
 from pathlib import Path
-from typing import Tuple
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
 
 import pendulum
 from flask import (
     abort,
     current_app,
+    jsonify,
     make_response,
     redirect,
     render_template,
     request,
     send_file,
+    send_from_directory,
+    session,
+    stream_template,
+    stream_with_context,
     url_for,
 )
 from flask_login import current_user, login_required, login_user, logout_user
-from PIL import Image, UnidentifiedImageError
 from werkzeug import Response
 from werkzeug.utils import secure_filename
 
-from . import timeclock
-from .timesheet import TimeSheet, get_overview, get_past_timesheets
+from . import (
+    anomalies,
+    events,
+    history,
+    idempotency,
+    kiosk,
+    maintenance,
+    memory,
+    pdfs,
+    photos,
+    profiling,
+    rollups,
+    shifts,
+    tenants,
+    throttle,
+    timeclock,
+)
+from .timesheet import TimeSheet, get_overview, get_overview_row, iter_past_timesheets
 from .users import Role, User, verify_user
-from .workday import WorkDay
+from .workday import Photo, WorkDay, get_photo_user_ids
 
 # returning a html string and status code
 PartialResponse = Tuple[str, int]
@@ -60,6 +87,7 @@ def index() -> Response:
 
 
 @login_required
+@idempotency.idempotent
 def clock_in() -> PartialResponse:
     """Clock the current_user in if not already clocked in.
 
@@ -77,6 +105,7 @@ def clock_in() -> PartialResponse:
 
 
 @login_required
+@idempotency.idempotent
 def clock_out() -> PartialResponse:
     """Clock the current_user out if clocked in.
 
@@ -88,17 +117,45 @@ def clock_out() -> PartialResponse:
     except timeclock.NotClockedInError:
         abort(400)
     clock_in_url = url_for("timeclock.clock_in")
+    key = idempotency.idempotency_key()
     return (
         f"""
     <button
       hx-swap="innerHTML"
       hx-target="#current_clock_state"
+      data-idempotency-key="{key}"
       hx-put="{clock_in_url}">CLOCK IN</button>
     """,
         200,
     )
 
 
+def kiosk_punches() -> Tuple[Response, int]:
+    """Apply a batch of punches from a kiosk device.
+
+    Notes:
+        - Authenticated with the kiosk's bearer token, not a login session.
+        - Body is {"punches": [{"code", "direction", "timestamp"}, ...]}.
+
+    Returns:
+        JSON {"results": [{"status", "workday_id"}, ...]} in punch order, 200 OK
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or kiosk.get_kiosk_id(token) is None:
+        abort(401)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("punches"), list):
+        abort(400)
+    if len(data["punches"]) > kiosk.MAX_PUNCHES:
+        abort(413)
+    try:
+        punches = [kiosk.Punch.from_json(p) for p in data["punches"]]
+    except ValueError:
+        abort(400)
+    results = kiosk.apply_punches(punches)
+    return jsonify(results=[asdict(r) for r in results]), 200
+
+
 @login_required
 def current_timesheet() -> Response:
     """Show the current timesheet for the user.
@@ -112,33 +169,134 @@ def current_timesheet() -> Response:
     except (KeyError, ValueError):
         abort(400)
 
-    ts = TimeSheet.current(user)
-    past_timesheets = get_past_timesheets(user)
-    if current_user.role == Role.OWNER:
-        return make_response(
-            render_template(
-                "owner_current_timesheet.html",
-                timesheet=ts,
-                user=user,
-                past_timesheets=past_timesheets,
-            )
-        )
     # Trying to view a user don't have permission for
-    if current_user.id != user_id:
+    if current_user.role != Role.OWNER and current_user.id != user_id:
         abort(403)
-    return make_response(
-        render_template(
-            "current_timesheet.html", timesheet=ts, past_timesheets=past_timesheets
+    ts = TimeSheet.current(user)
+    past_timesheets = iter_past_timesheets(user)
+    if current_user.role == Role.OWNER:
+        return _stream(
+            "owner_current_timesheet.html",
+            timesheet=ts,
+            user=user,
+            past_timesheets=past_timesheets,
         )
+    return _stream(
+        "current_timesheet.html", timesheet=ts, past_timesheets=past_timesheets
     )
 
 
 @login_required
 def timesheet(id: int) -> Response:
-    """Show an archived timesheet."""
+    """Show a saved timesheet to its user or an OWNER.
+
+    Its workdays' photos are read as they're sent.
+    """
+    user_id = pdfs.timesheet_user_id(id)
+    if user_id is None:
+        abort(404)
+    if current_user.user_id != user_id and current_user.role != Role.OWNER:
+        abort(403)
     ts = TimeSheet.from_id(id)
-    # FIXME check current_user has permission to view
-    return make_response(render_template("timesheet.html", timesheet=ts))
+    return _stream("timesheet.html", timesheet=ts)
+
+
+def _stream(template: str, **context: Any) -> Response:
+    """Send *template* to the browser while it renders.
+
+    What comes before a loop over a generator in *context* goes out before
+    the generator is read, long pages show their top right away.
+    """
+    return Response(stream_template(template, **context), mimetype="text/html")
+
+
+@login_required
+def timesheet_pdf(id: int) -> Response:
+    """Download a saved timesheet as a PDF, for its user or an OWNER.
+
+    Notes:
+        - PDFs are rendered in the background when the timesheet is saved.
+          One that isn't ready (or whose file is gone) is queued and the
+          client gets a 202 to try again.
+        - One that failed for good gets a 500 with its error until
+          `timeclock-cli render-pdfs --retry-failed`.
+    """
+    user_id = pdfs.timesheet_user_id(id)
+    if user_id is None:
+        abort(404)
+    if current_user.user_id != user_id and current_user.role != Role.OWNER:
+        abort(403)
+    job = pdfs.get_job(id)
+    pdf_path = tenants.pdf_path()
+    if job and job.ready(pdf_path):
+        return send_from_directory(
+            pdf_path,
+            job.filename,
+            mimetype="application/pdf",
+            download_name=f"timesheet-{id}.pdf",
+        )
+    if job and job.status == "failed":
+        return _pdfs_failed([f"timesheet-{id}.pdf: {job.error}"])
+    pdfs.request_pdfs([id], pdf_path)
+    return _pdfs_pending("The PDF is being made, try again in a moment.")
+
+
+@login_required
+def pay_period_pdfs() -> Response:
+    """Download the PDFs of a pay period's saved timesheets as one zip file.
+
+    A timesheet is in the pay period from ?start= to ?end= (YYYY-MM-DD, the
+    last two weeks by default) when its last workday is. Missing PDFs are
+    queued and the client gets a 202, failed ones a 500 with their errors.
+    """
+    if current_user.role != Role.OWNER:
+        abort(403)
+    try:
+        start, end = rollups.parse_range(
+            request.args.get("start"), request.args.get("end"), weeks=2
+        )
+    except ValueError:
+        abort(400)
+    timesheets = pdfs.pay_period(start, end)
+    if not timesheets:
+        msg = f"Error: No saved timesheets from {start} to {end}."
+        return make_response(
+            render_template("alert.html", msg=msg, style_class="error"), 404
+        )
+    failed = [ts for ts in timesheets if ts.status == "failed"]
+    if failed:
+        return _pdfs_failed([f"{ts.archive_name}: {ts.error}" for ts in failed])
+    pdf_path = tenants.pdf_path()
+    pending = [ts.id for ts in timesheets if not ts.ready(pdf_path)]
+    if pending:
+        pdfs.request_pdfs(pending, pdf_path)
+        return _pdfs_pending(
+            f"{len(pending)} of {len(timesheets)} PDFs are being made, "
+            "try again in a moment."
+        )
+    f = tempfile.TemporaryFile()
+    pdfs.write_zip(f, pdf_path, timesheets)
+    f.seek(0)
+    return send_file(
+        f,
+        mimetype="application/zip",
+        as_attachment=True,
+        download_name=f"timesheets-{start}-{end}.zip",
+    )
+
+
+def _pdfs_pending(msg: str) -> Response:
+    resp = make_response(render_template("alert.html", msg=msg, style_class="alert"))
+    resp.status_code = 202
+    resp.headers["Retry-After"] = "5"
+    return resp
+
+
+def _pdfs_failed(errors: List[str]) -> Response:
+    msg = f"Error: PDFs that could not be made: {'; '.join(errors)}."
+    return make_response(
+        render_template("alert.html", msg=msg, style_class="error"), 500
+    )
 
 
 @login_required
@@ -150,6 +308,193 @@ def overview() -> Response:
     return make_response(render_template("overview.html", employees=employees))
 
 
+@login_required
+def hours_dashboard() -> Response:
+    """Show the OWNER hours per employee per day, week, month or year."""
+    if current_user.role != Role.OWNER:
+        abort(403)
+    period = request.args.get("period", "week")
+    try:
+        start, end = rollups.parse_range(
+            request.args.get("start"), request.args.get("end")
+        )
+        rows = rollups.hours(start, end, period)
+    except ValueError:
+        abort(400)
+    employees: Dict[str, Dict[str, float]] = {}
+    for row in rows:
+        employees.setdefault(row.username, {})[row.period] = row.hours
+    return make_response(
+        render_template(
+            "hours_dashboard.html",
+            start=start,
+            end=end,
+            period=period,
+            period_choices=rollups.PERIODS,
+            periods=sorted({row.period for row in rows}),
+            employees=employees,
+            max_hours=max((row.hours for row in rows), default=0) or 1,
+        )
+    )
+
+
+@login_required
+def workday_history() -> Response:
+    """Show a user's workdays between two days, a page at a time.
+
+    Notes:
+        - Defaults to the current user and the current month.
+        - OWNERs may pass any `user_id`.
+    """
+    user_id = request.args.get("user_id", current_user.id)
+    if current_user.role != Role.OWNER and current_user.id != user_id:
+        abort(403)
+    try:
+        user = User.get(user_id)
+    except ValueError:
+        abort(404)
+    cursor = request.args.get("cursor")
+    try:
+        start, end = history.parse_range(
+            request.args.get("start"), request.args.get("end")
+        )
+        page = history.get_history(user.user_id, start, end, cursor)
+    except ValueError:
+        abort(400)
+    return make_response(
+        render_template(
+            "history.html", user=user, history=page, first_page=cursor is None
+        )
+    )
+
+
+@login_required
+def schedule() -> Response:
+    """Show the OWNER the shift schedule and how it was worked.
+
+    Notes:
+        - Shows the current week unless `start` and `end` are given.
+    """
+    if current_user.role != Role.OWNER:
+        abort(403)
+    try:
+        if "start" in request.args or "end" in request.args:
+            start, end = rollups.parse_range(
+                request.args.get("start"), request.args.get("end"), weeks=1
+            )
+        else:
+            start = pendulum.today().date().start_of("week")
+            end = start.add(days=6)
+    except ValueError:
+        abort(400)
+    results = shifts.results(start, end)
+    return make_response(
+        render_template(
+            "schedule.html",
+            start=start,
+            end=end,
+            templates=shifts.get_templates(start, end),
+            results=results,
+            coverage=shifts.coverage(results),
+            employees=shifts.get_employees(),
+            grace=shifts.GRACE_MINUTES,
+            weekdays=list(pendulum.WeekDay),
+        )
+    )
+
+
+@login_required
+def add_shift() -> Response:
+    """Add a weekly or a one-off shift from the schedule page's forms."""
+    if current_user.role != Role.OWNER:
+        abort(403)
+    form = request.form
+    try:
+        user_id = int(form["user_id"])
+        if "weekday" in form:
+            valid_until = form.get("valid_until")
+            shifts.add_template(
+                user_id,
+                int(form["weekday"]),
+                form["start"],
+                round(float(form["hours"]) * 60),
+                pendulum.Date.fromisoformat(form["valid_from"]),
+                pendulum.Date.fromisoformat(valid_until) if valid_until else None,
+            )
+        else:
+            day = pendulum.Date.fromisoformat(form["day"])
+            start, end = (
+                pendulum.local(day.year, day.month, day.day, t.hour, t.minute)
+                for t in map(pendulum.Time.fromisoformat, (form["start"], form["end"]))
+            )
+            if end <= start:
+                # ends after midnight
+                end = end.add(days=1)
+            shifts.add_shift(user_id, start, end)
+    except (KeyError, ValueError, sqlite3.IntegrityError):
+        abort(400)
+    # back to the range the forms were on
+    return redirect(
+        url_for(
+            "timeclock.schedule",
+            start=request.args.get("start"),
+            end=request.args.get("end"),
+        )
+    )
+
+
+@login_required
+def end_shift_template(id: int) -> PartialResponse:
+    """Stop a weekly shift after today, the schedule row is removed."""
+    if current_user.role != Role.OWNER:
+        abort(403)
+    shifts.end_template(id)
+    return "", 200
+
+
+@login_required
+def overview_events() -> Response:
+    """Stream server-sent events with updated overview rows.
+
+    Notes:
+        - The stream ends after SSE_STREAM_SECONDS, the browser reconnects
+          with the Last-Event-ID header and continues where it left off.
+        - An open stream occupies a worker thread for its whole lifetime.
+    """
+    if current_user.role != Role.OWNER:
+        abort(403)
+    try:
+        last_id = int(request.headers["Last-Event-ID"])
+    except (KeyError, ValueError):
+        last_id = events.latest_id()
+    timeout = current_app.config["SSE_STREAM_SECONDS"]
+
+    def stream() -> Iterator[str]:
+        yield "retry: 1000\n\n"
+        for batch in events.listen(last_id, timeout):
+            if not batch:
+                yield ": keepalive\n\n"
+                continue
+            # Only the newest event per employee matters, the row is rendered
+            # from the current state anyways.
+            latest = {event.user_id: event.id for event in batch}
+            for user_id, event_id in sorted(latest.items(), key=lambda i: i[1]):
+                user = User.get(str(user_id))
+                if user.role != Role.EMPLOYEE:
+                    continue
+                row = render_template(
+                    "overview_row.html", employee=get_overview_row(user)
+                )
+                data = "".join(f"data: {line}\n" for line in row.splitlines())
+                yield f"id: {event_id}\nevent: employee-{user_id}\n{data}\n"
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @login_required
 def get_workday(id: int) -> Response:
     """Show either an editable view of the workday or archived view."""
@@ -191,7 +536,11 @@ def update_workday(id: int) -> PartialResponse:
         clock_out=clock_out,
         notes=request.json["notes"],
     )
-    new_wd.update()
+    try:
+        new_wd.update()
+    except anomalies.InvalidWorkDay as exc:
+        msg = f"Error: {exc}"
+        return render_template("alert.html", msg=msg, style_class="error"), 200
     return render_template("alert.html", msg="Success", style_class="alert"), 200
 
 
@@ -266,8 +615,14 @@ def save_timesheet() -> Response:
 
 
 @login_required
+@idempotency.idempotent
 def upload_photo(id: int) -> Response:
-    """TODO."""
+    """Save an uploaded photo for the workday.
+
+    Notes:
+        - The upload is copied to disk in chunks and rejected from its header
+          bytes before PIL decodes anything.
+    """
     wd = WorkDay.from_id(id)
     # check that user has permission to edit
     if wd.user_id != current_user.user_id and current_user.role != Role.OWNER:
@@ -276,22 +631,13 @@ def upload_photo(id: int) -> Response:
     if wd.archived:
         abort(403)
     msg = None
-    uploaded_file = request.files["photo"]
-    print(uploaded_file)
-    if uploaded_file.filename:
+    uploaded_file = request.files.get("photo")
+    if uploaded_file and uploaded_file.filename:
         filename = Path(secure_filename(uploaded_file.filename))
-        if filename.suffix not in current_app.config["UPLOAD_EXTENSIONS"]:
-            msg = "Error: Files of type {file_ext} are not allowed"
-        try:
-            image = Image.open(uploaded_file.stream, formats=["JPEG", "PNG"])
-        except UnidentifiedImageError:
-            msg = "Error: The file is not an image"
-
-        image.reduce(4).save(current_app.config["UPLOAD_PATH"] / filename)
-        try:
-            wd.add_photo(filename)
-        except sqlite3.IntegrityError:
-            msg = "Error: That image has already been uploaded."
+        if filename.suffix.lower() not in current_app.config["UPLOAD_EXTENSIONS"]:
+            msg = f"Error: Files of type {filename.suffix} are not allowed"
+        else:
+            msg = _save_photo(wd, uploaded_file.stream)
     else:
         msg = "Error: No file part"
 
@@ -300,18 +646,94 @@ def upload_photo(id: int) -> Response:
             render_template("alert.html", msg=msg, style_class="error")
         )
 
-    return make_response(render_template("photos.html", photos=wd.photos))
+    return make_response(
+        render_template("photos.html", photos=wd.photos, workday_id=wd.id)
+    )
+
+
+def _save_photo(wd: WorkDay, stream: IO[bytes]) -> Optional[str]:
+    """Process the uploaded stream and add it to the workday.
+
+    Photos are stored under the hash of the uploaded file, an image that is
+    already stored is only linked to the workday and never decoded again.
+
+    Returns:
+        Optional[str]: An error message.
+    """
+    upload_path = tenants.upload_path()
+    upload_path.mkdir(parents=True, exist_ok=True)
+    try:
+        upload = photos.spool(stream, upload_path)
+    except photos.InvalidImageError:
+        return "Error: The file is not an image"
+    try:
+        existing = Photo.from_sha256(upload.sha256)
+        if existing and (upload_path / existing.filename).exists():
+            wd.link_photo(existing)
+        else:
+            photos.save_reduced(upload, upload_path / upload.filename)
+            wd.add_photo(upload.filename, upload.sha256)
+    except photos.InvalidImageError:
+        return "Error: The file is not an image"
+    except sqlite3.IntegrityError:
+        return "Error: That image has already been uploaded."
+    finally:
+        upload.discard()
+    return None
 
 
 @login_required
 def photo(filename: str) -> Response:
-    return send_file(current_app.config["UPLOAD_PATH"] / filename)
+    """Serve an uploaded photo to the user whose workday has it or an OWNER.
+
+    Notes:
+        - With PHOTO_OFFLOAD set only the permission check happens here, the
+          front proxy sends the file (with ranges and conditional requests)
+          so the worker isn't busy copying bytes to slow clients.
+    """
+    user_ids = get_photo_user_ids(filename)
+    if not user_ids:
+        abort(404)
+    if current_user.user_id not in user_ids and current_user.role != Role.OWNER:
+        abort(403)
+    if current_app.config["PHOTO_OFFLOAD"] == "x-accel-redirect":
+        path = tenants.upload_path() / filename
+        internal = path.relative_to(current_app.config["UPLOAD_PATH"]).as_posix()
+        prefix = current_app.config["PHOTO_ACCEL_PREFIX"]
+        resp = make_response("")
+        resp.headers["X-Accel-Redirect"] = prefix + quote(internal)
+        resp.mimetype = mimetypes.guess_type(filename)[0] or "image/jpeg"
+        return resp
+    # Sends X-Sendfile instead of the file when USE_X_SENDFILE is on
+    return send_from_directory(tenants.upload_path(), filename)
 
 
 @login_required
-def delete_photo() -> Response:
-    """TODO."""
-    abort(400)
+def delete_photo(id: int) -> Response:
+    """Remove a photo from the workday.
+
+    Notes:
+        - The file is deleted once no other workday uses the photo.
+    """
+    wd = WorkDay.from_id(id)
+    # check that user has permission to edit
+    if wd.user_id != current_user.user_id and current_user.role != Role.OWNER:
+        abort(403)
+    # check that id is not in timesheet_workday (archived)
+    if wd.archived:
+        abort(403)
+    if not request.json:
+        abort(400)
+    try:
+        photo_id = int(request.json["photo_id"])
+    except (KeyError, TypeError, ValueError):
+        abort(400)
+
+    filenames = wd.remove_photo(photo_id)
+    photos.remove_files(tenants.upload_path(), filenames)
+    return make_response(
+        render_template("photos.html", photos=wd.photos, workday_id=wd.id)
+    )
 
 
 def login() -> Response:
@@ -326,12 +748,21 @@ def login() -> Response:
     if not email or not unhashed_password:
         abort(400)
 
+    retry_after = throttle.check_login(request.remote_addr or "", email)
+    if retry_after is not None:
+        resp = make_response("Too many login attempts, try again later", 429)
+        resp.headers["Retry-After"] = str(retry_after)
+        return resp
+
     try:
         user = verify_user(email, unhashed_password)
     except ValueError:
+        throttle.login_failed()
         abort(401)
 
+    throttle.login_succeeded(email)
     login_user(user)
+    session["tenant"] = tenants.current()
     return redirect(url_for("timeclock.index"))
 
 
@@ -340,3 +771,122 @@ def logout() -> Response:
     """TODO what happens when current_user is anonymous?"""
     logout_user()
     return redirect(url_for("timeclock.auth.login"))
+
+
+@login_required
+def profiling_switch() -> Tuple[Response, int]:
+    """Turn request profiling on (POST) or off (DELETE), OWNER and ADMIN only.
+
+    Notes:
+        - POST takes JSON {"seconds": 300, "sample_rate": 0.1}.
+    """
+    if current_user.role not in (Role.OWNER, Role.ADMIN):
+        abort(403)
+    if request.method == "DELETE":
+        profiling.disable()
+        return jsonify(enabled=False), 200
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get("seconds", 300))
+        sample_rate = float(data.get("sample_rate", 0.1))
+        profiling.enable(seconds, sample_rate)
+    except (TypeError, ValueError):
+        abort(400)
+    return jsonify(enabled=True, seconds=seconds, sample_rate=sample_rate), 200
+
+
+@login_required
+def profiling_download(format: str) -> Response:
+    """Download the profile as collapsed stacks or a speedscope file.
+
+    Notes:
+        - Pass ?endpoint=timeclock.current_timesheet for a single endpoint.
+    """
+    if current_user.role not in (Role.OWNER, Role.ADMIN):
+        abort(403)
+    endpoint = request.args.get("endpoint")
+    if format == "collapsed":
+        body = profiling.collapsed(endpoint)
+        filename, mimetype = "profile.collapsed.txt", "text/plain"
+    elif format == "speedscope":
+        body = json.dumps(profiling.speedscope(endpoint))
+        filename, mimetype = "profile.speedscope.json", "application/json"
+    else:
+        abort(404)
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@login_required
+def memory_status() -> Response:
+    """Memory use of the worker handling the request, OWNER and ADMIN only."""
+    if current_user.role not in (Role.OWNER, Role.ADMIN):
+        abort(403)
+    return jsonify(
+        pid=os.getpid(),
+        rss_mb=memory.rss_mb(),
+        max_rss_mb=current_app.config["MAX_RSS_MB"],
+        tracing=tracemalloc.is_tracing(),
+        snapshots=memory.list_snapshots(current_app.config["MEMORY_SNAPSHOT_DIR"]),
+    )
+
+
+@login_required
+def throttle_counters() -> Response:
+    """Counts of throttled and failed logins, OWNER and ADMIN only."""
+    if current_user.role not in (Role.OWNER, Role.ADMIN):
+        abort(403)
+    return jsonify(throttle.counters())
+
+
+@login_required
+def maintenance_runs() -> Response:
+    """The last run of each maintenance job, OWNER and ADMIN only."""
+    if current_user.role not in (Role.OWNER, Role.ADMIN):
+        abort(403)
+    return jsonify(
+        enabled=current_app.config["MAINTENANCE"],
+        runs=[asdict(run) for run in maintenance.get_runs()],
+    )
+
+
+@login_required
+def memory_snapshots() -> Tuple[Response, int]:
+    """List saved snapshots (GET) or snapshot this worker (POST).
+
+    Notes:
+        - POST returns the top allocation sites, ?limit=20.
+        - Only works when started with PYTHONTRACEMALLOC set.
+    """
+    if current_user.role not in (Role.OWNER, Role.ADMIN):
+        abort(403)
+    snapshot_dir = current_app.config["MEMORY_SNAPSHOT_DIR"]
+    if request.method == "GET":
+        return jsonify(snapshots=memory.list_snapshots(snapshot_dir)), 200
+    try:
+        name = memory.take_snapshot(snapshot_dir)
+    except RuntimeError as exc:
+        return jsonify(error=str(exc)), 409
+    limit = request.args.get("limit", 20, type=int)
+    top = memory.top(memory.snapshot_path(snapshot_dir, name), limit)
+    return jsonify(name=name, pid=os.getpid(), rss_mb=memory.rss_mb(), top=top), 201
+
+
+@login_required
+def memory_diff() -> Response:
+    """Allocation sites that grew the most between snapshots ?old= and ?new=."""
+    if current_user.role not in (Role.OWNER, Role.ADMIN):
+        abort(403)
+    snapshot_dir = current_app.config["MEMORY_SNAPSHOT_DIR"]
+    try:
+        old = memory.snapshot_path(snapshot_dir, request.args["old"])
+        new = memory.snapshot_path(snapshot_dir, request.args["new"])
+    except (KeyError, ValueError):
+        abort(400)
+    if not (old.exists() and new.exists()):
+        abort(404)
+    limit = request.args.get("limit", 20, type=int)
+    return jsonify(diff=memory.diff(old, new, limit))
@@ -1,19 +1,16 @@
 """WorkDay class."""
 from __future__ import annotations
 
-import os
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import List, Optional, Set, Union
 
 import pendulum
 
-from .db import class_row, db_conn, get_queries, transaction
+from . import anomalies, events, rollups
+from .db import Q, class_row, db_conn, transaction
 from .users import User
 
-DB_FILE = Path(os.getenv("TIMECLOCK_DB", "test.db"))
-Q = get_queries()
-
 
 @dataclass
 class Photo:
@@ -22,34 +19,51 @@ class Photo:
     Attributes:
         id (int): photo id primary key.
         filename (str): filename of the photo.
+        sha256 (Optional[str]): hex digest of the uploaded file. Photos with the
+            same digest are stored once and shared between workdays.
     """
 
     id: int
     filename: str
+    sha256: Optional[str] = None
 
     @classmethod
-    def new(cls, filename: Union[str, Path]) -> Photo:
+    def new(cls, filename: Union[str, Path], sha256: Optional[str] = None) -> Photo:
+        """Insert a new photo."""
         filename = Path(filename)
-        with db_conn(DB_FILE) as conn:
+        with db_conn() as conn:
             with transaction(conn):
-                photo_id = Q.insert_photo(conn, filename=filename.name)
-        return cls(photo_id, filename.name)
+                photo_id = Q.insert_photo(conn, filename=filename.name, sha256=sha256)
+        return cls(photo_id, filename.name, sha256)
+
+    @classmethod
+    def from_sha256(cls, sha256: str) -> Optional[Photo]:
+        """Return the photo with the given content hash if one exists."""
+        with db_conn() as conn:
+            row = Q.get_photo_by_sha256(conn, sha256=sha256)
+        return cls(*row) if row else None
 
     def delete(self) -> bool:
-        with db_conn(DB_FILE) as conn:
+        """Delete the photo row, removing it from every workday."""
+        with db_conn() as conn:
             with transaction(conn):
-                Q.delete_photo(conn, photo_id=self.id)
-            ret = bool(conn.total_changes)
+                ret = bool(Q.delete_photo(conn, photo_id=self.id))
         return ret
 
 
 def get_photos(workday_id: int) -> List[Photo]:
     """Return all photos for a given workday."""
-    with db_conn(DB_FILE, class_row(Photo)) as conn:
+    with db_conn(row_factory=class_row(Photo)) as conn:
         photos = Q.get_workday_photos(conn, workday_id=workday_id)
     return photos
 
 
+def get_photo_user_ids(filename: str) -> Set[int]:
+    """Return the ids of the users whose workdays have the photo."""
+    with db_conn() as conn:
+        return {r[0] for r in Q.get_photo_user_ids(conn, filename=filename)}
+
+
 class WorkDay:
     """Represents a single day of work.
 
@@ -61,8 +75,13 @@ class WorkDay:
         id (int): Primary key on the workday table. Defaults to 0 if not created
             by one of the constructors (current(), from_id()). This means that
             there is no primary key yet.
-        photos: (Optional[List[Photo]]): List of photos associated with the
-            the workday. Default is None.
+        photos: (List[Photo]): List of photos associated with the workday.
+        user_id (int): The user the workday belongs to.
+        archived (bool): Whether the workday is on a saved timesheet.
+
+    photos, user_id and archived are read from the database the first time
+    they're used, unless the constructor was given them, and then kept until
+    `forget()`.
     """
 
     def __init__(
@@ -72,13 +91,17 @@ class WorkDay:
         notes: Optional[str] = None,
         id: int = 0,
         photos: Optional[List[Photo]] = None,
+        user_id: Optional[int] = None,
+        archived: Optional[bool] = None,
     ):
         """Init WorkDay."""
         self.clock_in = clock_in
         self.clock_out = clock_out
         self.notes = notes
         self.id = id
-        self.photos = photos
+        self._photos = photos
+        self._user_id = user_id
+        self._archived = archived
 
     @classmethod
     def current(cls, user: User) -> WorkDay:
@@ -87,36 +110,59 @@ class WorkDay:
         Notes:
             - Does no checking for whether user is clocked in.
         """
-        with db_conn(DB_FILE) as conn:
+        with db_conn() as conn:
             id, clock_in, clock_out, notes = Q.get_user_current_workday(
                 conn, user_id=user.user_id
             )
         # if clock_out: raise what?
-        photos = get_photos(workday_id=id)
         notes = notes if notes else ""
         return cls(
-            clock_in=clock_in, clock_out=clock_out, notes=notes, id=id, photos=photos
+            clock_in=clock_in,
+            clock_out=clock_out,
+            notes=notes,
+            id=id,
+            user_id=user.user_id,
         )
 
     @classmethod
     def from_id(cls, id: int) -> WorkDay:
         """Return the workday with the given id."""
-        with db_conn(DB_FILE) as conn:
-            clock_in, clock_out, notes = Q.get_workday(conn, workday_id=id)
-        photos = get_photos(workday_id=id)
+        with db_conn() as conn:
+            clock_in, clock_out, notes, user_id, archived = Q.get_workday(
+                conn, workday_id=id
+            )
         notes = notes if notes else ""
         return cls(
-            clock_in=clock_in, clock_out=clock_out, notes=notes, id=id, photos=photos
+            clock_in=clock_in,
+            clock_out=clock_out,
+            notes=notes,
+            id=id,
+            user_id=user_id,
+            archived=bool(archived),
         )
 
+    def forget(self) -> None:
+        """Read photos, user_id and archived from the database again."""
+        self._photos = None
+        self._user_id = None
+        self._archived = None
+
+    @property
+    def photos(self) -> List[Photo]:
+        """Return the photos of the workday."""
+        if self._photos is None:
+            self._photos = get_photos(workday_id=self.id) if self.id else []
+        return self._photos
+
     @property
     def user_id(self) -> int:
         """Return the user_id associated with the workday."""
         if not self.id:
             raise Exception("WorkDay has no id.")
-        with db_conn(DB_FILE) as conn:
-            _user_id = Q.get_workday_user_id(conn, workday_id=self.id)
-        return _user_id
+        if self._user_id is None:
+            with db_conn() as conn:
+                self._user_id = Q.get_workday_user_id(conn, workday_id=self.id)
+        return self._user_id
 
     @property
     def date(self) -> pendulum.Date:
@@ -144,9 +190,11 @@ class WorkDay:
     @property
     def archived(self) -> bool:
         """Returns whether or not the workday is able to be edited."""
-        with db_conn(DB_FILE) as conn:
-            exists = Q.get_workday_archived(conn, workday_id=self.id)
-        return bool(exists)
+        if self._archived is None:
+            with db_conn() as conn:
+                exists = Q.get_workday_archived(conn, workday_id=self.id)
+            self._archived = bool(exists)
+        return self._archived
 
     def __repr__(self) -> str:
         """Print attributes/properties of the WorkDay instance."""
@@ -172,7 +220,7 @@ class WorkDay:
         Notes:
             - Ideally get rid of this function and use the more general update()
         """
-        with db_conn(DB_FILE) as conn:
+        with db_conn() as conn:
             with transaction(conn):
                 conn.execute(
                     """--sql
@@ -182,28 +230,76 @@ class WorkDay:
                 )
         self.notes = notes
 
-    def add_photo(self, filename: Union[str, Path]) -> Photo:
+    def add_photo(
+        self, filename: Union[str, Path], sha256: Optional[str] = None
+    ) -> Photo:
         """New photo for the workday.
 
         Raises:
             sqlite3.IntegrityError: If photo already uploaded.
         """
-        photo = Photo.new(filename)
-        try:
-            self.photos.append(photo)  # type: ignore
-        except AttributeError:
-            self.photos = [photo]
+        filename = Path(filename)
+        with db_conn() as conn:
+            with transaction(conn):
+                photo_id = Q.insert_photo(conn, filename=filename.name, sha256=sha256)
+                Q.insert_workday_photo(conn, photo_id=photo_id, workday_id=self.id)
+        photo = Photo(photo_id, filename.name, sha256)
+        self._append_photo(photo)
+        return photo
+
+    def link_photo(self, photo: Photo) -> None:
+        """Add an already stored photo to the workday.
 
-        with db_conn(DB_FILE) as conn:
+        Raises:
+            sqlite3.IntegrityError: If the photo is already on the workday or
+                has been deleted.
+        """
+        with db_conn() as conn:
             with transaction(conn):
                 Q.insert_workday_photo(conn, photo_id=photo.id, workday_id=self.id)
+        self._append_photo(photo)
 
-        return photo
+    def remove_photo(self, photo_id: int) -> List[str]:
+        """Remove a photo from the workday.
+
+        The photo row is deleted too once no other workday uses it.
+
+        Returns:
+            List[str]: Filenames of deleted photos, the caller should remove
+                the files.
+        """
+        with db_conn() as conn:
+            with transaction(conn):
+                Q.delete_workday_photo(conn, photo_id=photo_id, workday_id=self.id)
+                rows = Q.delete_unreferenced_photos(
+                    conn, start_id=photo_id, end_id=photo_id
+                )
+        if self._photos is not None:
+            self._photos = [p for p in self._photos if p.id != photo_id]
+        return [r[0] for r in rows]
+
+    def _append_photo(self, photo: Photo) -> None:
+        # Not loaded yet, the photo will be when they are
+        if self._photos is not None:
+            self._photos.append(photo)
 
     def update(self) -> None:
-        """Do an update transaction in the database."""
-        with db_conn(DB_FILE) as conn:
+        """Do an update transaction in the database.
+
+        Raises:
+            InvalidWorkDay: If the workday would clock out before it clocks
+                in, be longer than MAX_SHIFT_HOURS or overlap another one of
+                the user's workdays, see anomalies.py.
+        """
+        with db_conn() as conn:
             with transaction(conn):
+                old_clock_in = Q.get_workday(conn, workday_id=self.id)[0]
+                user_id = Q.get_workday_user_id(conn, workday_id=self.id)
+                found = anomalies.check(
+                    conn, self.id, user_id, self.clock_in, self.clock_out
+                )
+                if found:
+                    raise anomalies.InvalidWorkDay(found)
                 Q.update_workday(
                     conn,
                     workday_id=self.id,
@@ -211,9 +307,14 @@ class WorkDay:
                     clock_out=self.clock_out,
                     notes=self.notes
                 )
+                rollups.refresh(
+                    conn, user_id, [old_clock_in.date(), self.clock_in.date()]
+                )
+                events.publish(conn, "workday_update", self.id)
+        self.forget()
 
     def _insert(self, user: User) -> None:
-        with db_conn(DB_FILE) as conn:
+        with db_conn() as conn:
             with transaction(conn):
                 cursor = conn.execute(
                     """--sql
@@ -228,12 +329,17 @@ class WorkDay:
                     ),
                 )
                 self.id = cursor.fetchone()[0]
+                if self.clock_out:
+                    rollups.refresh(conn, user.user_id, [self.clock_in.date()])
 
 
 def _manual_delete_workday(workday_id: int) -> None:
-    with db_conn(DB_FILE) as conn:
+    with db_conn() as conn:
         with transaction(conn):
+            clock_in = Q.get_workday(conn, workday_id=workday_id)[0]
+            user_id = Q.get_workday_user_id(conn, workday_id=workday_id)
             conn.execute(
                 "DELETE FROM workday WHERE id = :workday_id",
                 dict(workday_id=workday_id),
             )
+            rollups.refresh(conn, user_id, [clock_in.date()])
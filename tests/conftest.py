@@ -8,7 +8,7 @@ import pytest
 from flask_login import FlaskLoginClient
 
 from timeclock import create_app, timeclock, timesheet, users, workday
-from timeclock.db import create_db
+from timeclock.db import CONNECTIONS, archive_path, create_db, use_db
 
 
 @pytest.fixture(scope="session")
@@ -16,7 +16,22 @@ def DB():
     db_file = Path(os.getenv("TIMECLOCK_DB", "test.db"))
     create_db(db_file)
     yield
-    db_file.unlink()
+    # Close the cached connections first, the last one to close checkpoints
+    # the WAL and then the files can go
+    CONNECTIONS.clear()
+    for path in (db_file, archive_path(db_file)):
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+@pytest.fixture
+def tenant_db(tmp_path):
+    """A fresh database of the test's own, in use until the test ends."""
+    db_file = tmp_path / "tenant.db"
+    create_db(db_file)
+    with use_db(db_file):
+        yield db_file
+    CONNECTIONS.clear()
 
 
 @pytest.fixture(scope="session")
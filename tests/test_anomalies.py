@@ -0,0 +1,118 @@
+import pendulum
+import pytest
+
+from timeclock import anomalies, users
+from timeclock.db import db_conn
+from timeclock.workday import WorkDay
+
+HOUR = 3600
+
+
+def kinds(found):
+    return [(a.kind, a.workday_id, a.other_id) for a in found]
+
+
+def test_sweep():
+    spans = [
+        (1, 1, 0, 8 * HOUR),
+        # starts before 1 ends
+        (2, 1, 7 * HOUR, 9 * HOUR),
+        (3, 1, 24 * HOUR, 23 * HOUR),
+        (4, 1, 48 * HOUR, 68 * HOUR),
+        # open, 6 clocked in after it
+        (5, 1, 72 * HOUR, None),
+        (6, 1, 96 * HOUR, 100 * HOUR),
+        (7, 2, 0, 8 * HOUR),
+        # open for longer than MAX_SHIFT_HOURS
+        (8, 2, 24 * HOUR, None),
+        (9, 3, 0, 8 * HOUR),
+        # still working
+        (10, 3, 110 * HOUR, None),
+    ]
+    found = anomalies.sweep(spans, now=120 * HOUR)
+    assert kinds(found) == [
+        ("overlap", 2, 1),
+        ("negative", 3, None),
+        ("long", 4, None),
+        ("open", 5, 6),
+        ("open", 8, None),
+    ]
+
+
+def test_sweep_overlap_with_long_workday():
+    spans = [
+        (1, 1, 0, 40 * HOUR),
+        (2, 1, 8 * HOUR, 9 * HOUR),
+        (3, 1, 24 * HOUR, 32 * HOUR),
+        (4, 1, 48 * HOUR, 56 * HOUR),
+    ]
+    assert kinds(anomalies.sweep(spans, now=0)) == [
+        ("long", 1, None),
+        ("overlap", 2, 1),
+        ("overlap", 3, 1),
+    ]
+
+
+@pytest.fixture
+def week(tenant_db):
+    user = users.register_user("sweep@test.com", "pass", users.Role.EMPLOYEE, "s")
+    start = pendulum.local(2022, 1, 3, 8)
+    work_days = []
+    for n in range(5):
+        wd = WorkDay(clock_in=start.add(days=n), clock_out=start.add(days=n, hours=8))
+        wd._insert(user)
+        work_days.append(wd)
+    return user, work_days
+
+
+def test_scan(week):
+    user, work_days = week
+    assert list(anomalies.scan()) == []
+    with db_conn() as conn:
+        conn.execute(
+            "UPDATE workday SET clock_out = NULL WHERE id = ?", (work_days[1].id,)
+        )
+    found = list(anomalies.scan())
+    assert kinds(found) == [("open", work_days[1].id, work_days[2].id)]
+    assert found[0].user_id == user.user_id
+    assert "never clocked out" in found[0].describe()
+
+
+def test_update_rejects_overlap(week):
+    _, work_days = week
+    wd = WorkDay.from_id(work_days[1].id)
+    wd.clock_in = work_days[0].clock_out.subtract(minutes=30)
+    wd.clock_out = wd.clock_in.add(hours=8)
+    with pytest.raises(anomalies.InvalidWorkDay) as exc:
+        wd.update()
+    assert kinds(exc.value.anomalies) == [("overlap", wd.id, work_days[0].id)]
+    assert WorkDay.from_id(wd.id).clock_in == work_days[1].clock_in
+
+
+def test_update_rejects_overlapping_a_later_workday(week):
+    _, work_days = week
+    wd = WorkDay.from_id(work_days[0].id)
+    wd.clock_out = work_days[1].clock_in.add(hours=1)
+    with pytest.raises(anomalies.InvalidWorkDay) as exc:
+        wd.update()
+    assert kinds(exc.value.anomalies) == [
+        ("long", wd.id, None),
+        ("overlap", work_days[1].id, wd.id),
+    ]
+
+
+def test_update_rejects_negative(week):
+    _, work_days = week
+    wd = WorkDay.from_id(work_days[2].id)
+    wd.clock_out = wd.clock_in.subtract(hours=1)
+    with pytest.raises(anomalies.InvalidWorkDay, match="Clocked out before"):
+        wd.update()
+
+
+def test_update_allows_valid_edit(week):
+    _, work_days = week
+    wd = WorkDay.from_id(work_days[2].id)
+    wd.clock_in = wd.clock_in.subtract(hours=2)
+    wd.clock_out = wd.clock_out.add(hours=2)
+    wd.update()
+    assert WorkDay.from_id(wd.id).hours == 12
@@ -0,0 +1,163 @@
+import json
+
+import pendulum
+
+from timeclock import api, shifts, users
+from timeclock.db import db_conn
+from timeclock.timesheet import TimeSheet
+from timeclock.workday import WorkDay
+
+
+def test_dumps_is_compact():
+    assert api.dumps(dict(a=[1, 2], b=None)) == b'{"a":[1,2],"b":null}'
+
+
+def test_status(app, employee_user, employee_workday):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get("/timeclock/api/v1/status")
+    assert resp.status_code == 200
+    assert resp.json == dict(clocked_in=True, workday_id=employee_workday.id)
+
+
+def test_current_workday_fields(app, employee_user, employee_workday):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get(
+            "/timeclock/api/v1/workday/current", query_string={"fields": "id,hours"}
+        )
+    assert resp.json == dict(id=employee_workday.id, hours=0.0)
+
+
+def test_current_workday_not_clocked_in(app, employee_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get("/timeclock/api/v1/workday/current")
+    assert resp.status_code == 404
+
+
+def test_past_timesheets(app, tenant_db):
+    user = users.register_user("api@test.com", "pass", users.Role.EMPLOYEE, "api")
+    start = pendulum.local(2022, 1, 3, 8)
+    for week in range(3):
+        wd = WorkDay(clock_in=start.add(weeks=week))
+        wd.clock_out = wd.clock_in.add(hours=8)
+        wd._insert(user)
+        TimeSheet([wd]).save(user, notes=str(week), workday_ids={wd.id})
+
+    pages = []
+    cursor = None
+    with app.test_client(user=user) as client:
+        while True:
+            query = dict(limit=2, fields="notes,hours")
+            if cursor:
+                query["cursor"] = cursor
+            resp = client.get("/timeclock/api/v1/timesheets", query_string=query)
+            assert resp.status_code == 200
+            pages.append(resp.json["items"])
+            cursor = resp.json["next_cursor"]
+            if cursor is None:
+                break
+    assert pages == [
+        [dict(notes="2", hours=8.0), dict(notes="1", hours=8.0)],
+        [dict(notes="0", hours=8.0)],
+    ]
+
+
+def test_other_users_timesheets_forbidden(app, employee_user, owner_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get(
+            "/timeclock/api/v1/timesheets", query_string={"user_id": owner_user.id}
+        )
+    assert resp.status_code == 403
+
+
+def test_overview_pagination(app, owner_user, employee_user, admin_user):
+    with app.test_client(user=owner_user) as client:
+        resp = client.get("/timeclock/api/v1/overview", query_string={"limit": 1})
+        first = json.loads(resp.data)
+        assert first["items"][0]["id"] == employee_user.user_id
+        resp = client.get(
+            "/timeclock/api/v1/overview",
+            query_string={"limit": 1, "cursor": employee_user.id},
+        )
+    assert resp.json["items"] == []
+    assert resp.json["next_cursor"] is None
+
+
+def test_overview_employee_forbidden(app, employee_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get("/timeclock/api/v1/overview")
+    assert resp.status_code == 403
+
+
+def test_hours(app, owner_user, employee_user, fake_timesheet, fake_timesheet_db):
+    query = dict(start="2022-01-01", end="2022-01-31", period="month")
+    with app.test_client(user=owner_user) as client:
+        resp = client.get("/timeclock/api/v1/hours", query_string=query)
+    assert resp.status_code == 200
+    assert resp.json["items"] == [
+        dict(
+            period="2022-01",
+            user_id=employee_user.user_id,
+            username=employee_user.username,
+            hours=fake_timesheet.hours,
+            workdays=len(fake_timesheet.work_days),
+        )
+    ]
+
+
+def test_coverage(app, owner_user, employee_user, fake_timesheet_db):
+    shifts.add_template(
+        employee_user.user_id,
+        4,
+        "08:00",
+        8 * 60,
+        pendulum.date(2022, 1, 3),
+        pendulum.date(2022, 1, 16),
+    )
+    query = dict(start="2022-01-01", end="2022-01-31", fields="late,percent")
+    with app.test_client(user=owner_user) as client:
+        resp = client.get("/timeclock/api/v1/coverage", query_string=query)
+    with db_conn() as conn:
+        conn.execute("DELETE FROM shift_template")
+    assert resp.status_code == 200
+    # clocked in at 08:14 and 08:21, out at 15:00
+    assert resp.json["items"] == [dict(late=2, percent=84)]
+
+
+def test_workday_history(app, employee_user, fake_timesheet, fake_timesheet_db):
+    query = dict(start="2022-01-01", end="2022-01-31", limit=4, fields="id,hours")
+    pages = []
+    with app.test_client(user=employee_user) as client:
+        while True:
+            resp = client.get("/timeclock/api/v1/workdays", query_string=query)
+            assert resp.status_code == 200
+            pages.append(resp.json)
+            if resp.json["next_cursor"] is None:
+                break
+            query["cursor"] = resp.json["next_cursor"]
+    assert [len(page["items"]) for page in pages] == [4, 4, 2]
+    items = [item for page in pages for item in page["items"]]
+    assert [item["id"] for item in items] == [wd.id for wd in fake_timesheet.work_days]
+    assert pages[0]["page_hours"] == sum(item["hours"] for item in pages[0]["items"])
+    assert {(page["hours"], page["workdays"]) for page in pages} == {
+        (fake_timesheet.hours, len(fake_timesheet.work_days))
+    }
+
+
+def test_workday_history_employee_only_own(app, owner_user, employee_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get(
+            "/timeclock/api/v1/workdays", query_string=dict(user_id=owner_user.id)
+        )
+        assert resp.status_code == 403
+        resp = client.get("/timeclock/api/v1/workdays", query_string=dict(end="x"))
+        assert resp.status_code == 400
+
+
+def test_hours_employee_only_own(app, owner_user, employee_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get(
+            "/timeclock/api/v1/hours", query_string=dict(user_id=owner_user.id)
+        )
+        assert resp.status_code == 403
+        resp = client.get("/timeclock/api/v1/hours", query_string=dict(period="x"))
+        assert resp.status_code == 400
@@ -0,0 +1,120 @@
+import pendulum
+import pytest
+
+from timeclock import archive, photos, timeclock, timesheet, users
+from timeclock.db import Q, archive_path, db_conn
+from timeclock.timesheet import TimeSheet, get_past_timesheets, iter_past_timesheets
+from timeclock.workday import WorkDay
+
+
+def save_timesheet(user, start):
+    work_days = []
+    for n in range(3):
+        wd = WorkDay(
+            clock_in=start.add(days=n, hours=8), clock_out=start.add(days=n, hours=16)
+        )
+        wd._insert(user)
+        work_days.append(wd)
+    ts = TimeSheet(work_days)
+    ts.save(user, notes=str(start.date()), workday_ids={wd.id for wd in work_days})
+    return work_days
+
+
+@pytest.fixture
+def old_user(tenant_db):
+    user = users.register_user("old@test.com", "pass", users.Role.EMPLOYEE, "old")
+    old = save_timesheet(user, pendulum.local(2020, 1, 6))
+    old[0].add_photo("old.jpg", "old")
+    save_timesheet(user, pendulum.local(2020, 1, 13))
+    save_timesheet(user, pendulum.now().subtract(days=7))
+    timeclock.clock_in(user)
+    return user, old
+
+
+def main_count(table):
+    with db_conn() as conn:
+        return conn.execute(f"SELECT count(*) FROM main.{table}").fetchone()[0]
+
+
+def test_archive_timesheets(tenant_db, old_user):
+    user, old = old_user
+    before = [str(ts) for ts in get_past_timesheets(user)]
+
+    report = archive.archive_timesheets(pendulum.duration(days=365), batch_size=1)
+    assert (report.timesheets, report.workdays, report.done) == (1, 3, False)
+    report = archive.archive_timesheets(pendulum.duration(days=365), batch_size=1)
+    assert (report.timesheets, report.done) == (1, False)
+    report = archive.archive_timesheets(pendulum.duration(days=365), batch_size=1)
+    assert report.done
+
+    assert archive_path(tenant_db).exists()
+    assert main_count("timesheet") == 1
+    assert main_count("workday") == 4
+    assert main_count("workday_photo") == 0
+    assert [str(ts) for ts in get_past_timesheets(user)] == before
+
+    wd = WorkDay.from_id(old[0].id)
+    assert wd.archived
+    assert wd.user_id == user.user_id
+    assert [p.filename for p in wd.photos] == ["old.jpg"]
+    assert TimeSheet.from_id(1).notes == "2020-01-06"
+
+
+def test_past_timesheets_paged(tenant_db, old_user, monkeypatch):
+    user, _ = old_user
+    archive.archive_timesheets(pendulum.duration(days=365), batch_size=1)
+    monkeypatch.setattr(timesheet, "PAST_PAGE_SIZE", 2)
+    past = iter_past_timesheets(user)
+    assert next(past).id == 3
+    assert [ts.notes for ts in past] == ["2020-01-13", "2020-01-06"]
+
+
+def test_archived_photos_are_not_garbage(tenant_db, old_user, tmp_path):
+    archive.archive_timesheets(pendulum.duration(days=365))
+    upload_path = tmp_path / "uploads"
+    upload_path.mkdir()
+    (upload_path / "old.jpg").write_bytes(b"")
+    report = photos.collect_garbage(upload_path)
+    assert report.removed == []
+
+
+def test_archive_rerun_after_partial_move(tenant_db, old_user):
+    user, old = old_user
+    archive.create_archive(tenant_db)
+    with db_conn() as conn:
+        # Copied but the delete never happened
+        Q.copy_timesheets_to_archive(conn, ids="[1]")
+        Q.copy_workdays_to_archive(conn, ids="[1]")
+        Q.copy_timesheet_workdays_to_archive(conn, ids="[1]")
+        assert len(WorkDay.from_id(old[0].id).photos) == 1
+    assert len(get_past_timesheets(user)) == 3
+
+    archive.archive_timesheets(pendulum.duration(days=365))
+    assert main_count("timesheet") == 1
+    assert len(get_past_timesheets(user)) == 3
+
+
+def test_delete_user_removes_archived_rows(tenant_db, old_user):
+    user, _ = old_user
+    archive.archive_timesheets(pendulum.duration(days=365))
+    assert users.delete_user(user.id)
+    with db_conn() as conn:
+        assert conn.execute("SELECT count(*) FROM all_timesheet").fetchone()[0] == 0
+        assert conn.execute("SELECT count(*) FROM all_workday").fetchone()[0] == 0
+
+
+def test_archived_ids_are_never_reused(tenant_db, old_user):
+    user, _ = old_user
+    archive.archive_timesheets(pendulum.duration(days=1))
+    with db_conn() as conn:
+        archived = conn.execute("SELECT max(id) FROM archive.timesheet").fetchone()[0]
+        # The newest timesheet was archived, and the open workday goes too
+        assert main_count("timesheet") == 0
+        conn.execute("DELETE FROM workday")
+        newest = conn.execute("SELECT max(id) FROM all_workday").fetchone()[0]
+    wd = WorkDay(clock_in=pendulum.now())
+    wd._insert(user)
+    assert wd.id > newest
+    TimeSheet([wd]).save(user, notes="new", workday_ids={wd.id})
+    newest_ts = get_past_timesheets(user)[0]
+    assert newest_ts.id > archived and newest_ts.notes == "new"
@@ -0,0 +1,39 @@
+import gzip
+import json
+
+from flask import render_template_string
+
+from timeclock import assets
+
+
+def test_collect(tmp_path):
+    src, dest = tmp_path / "static", tmp_path / "www"
+    (src / "css").mkdir(parents=True)
+    (src / "uploads").mkdir()
+    css = b"body { color: red; }\n" * 50
+    (src / "css" / "site.css").write_bytes(css)
+    (src / "logo.png").write_bytes(b"\x89PNG not really")
+    (src / "uploads" / "photo.jpg").write_bytes(b"")
+
+    manifest = assets.collect(src, dest)
+
+    hashed = manifest["css/site.css"]
+    assert hashed == assets.hashed_name("css/site.css", css)
+    assert hashed.startswith("css/site.") and hashed.endswith(".css")
+    assert sorted(manifest) == ["css/site.css", "logo.png"]
+    assert json.loads((dest / "manifest.json").read_text()) == manifest
+    assert (dest / hashed).read_bytes() == css
+    assert gzip.decompress((dest / f"{hashed}.gz").read_bytes()) == css
+    assert (dest / "css" / "site.css.gz").exists()
+    assert not (dest / "logo.png.gz").exists()
+    assert not (dest / "uploads").exists()
+
+
+def test_static_url(app):
+    with app.test_request_context():
+        app.config["STATIC_MANIFEST"] = {"css/mvp.css": "css/mvp.0123456789ab.css"}
+        html = render_template_string(
+            "{{ static_url('css/mvp.css') }} {{ static_url('css/custom.css') }}"
+        )
+        app.config["STATIC_MANIFEST"] = {}
+    assert html == "/static/css/mvp.0123456789ab.css /static/css/custom.css"
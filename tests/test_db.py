@@ -0,0 +1,194 @@
+import os
+import sqlite3
+from pathlib import Path
+
+import pendulum
+import pytest
+
+from timeclock import archive, rollups, users
+from timeclock.db import (
+    CONNECTIONS,
+    MIGRATIONS,
+    ConnectionCache,
+    create_db,
+    db_conn,
+    migrate,
+    schema_version,
+    transaction,
+    use_db,
+)
+from timeclock.workday import WorkDay
+
+BASELINE_SCHEMA = Path(__file__).with_name("baseline_schema.sql")
+
+
+def test_db_conn_reuses_connection(DB):
+    with db_conn() as conn1:
+        pass
+    with db_conn() as conn2:
+        assert conn1 is conn2
+
+
+def test_connection_cache_evicts_least_recently_used(tmp_path):
+    cache = ConnectionCache(size=2)
+    a, b, c = (tmp_path / f"{n}.db" for n in "abc")
+    conn_a = cache.get(a).conn
+    cache.get(b)
+    cache.get(c)
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn_a.execute("SELECT 1")
+    assert cache.get(c).conn is cache.get(c).conn
+    cache.clear()
+
+
+def test_connection_cache_reopens_replaced_file(tmp_path):
+    db_file = tmp_path / "replaced.db"
+    with db_conn(db_file) as conn:
+        conn.execute("CREATE TABLE t (x)")
+    db_file.unlink()
+    with db_conn(db_file) as conn:
+        assert conn.execute("SELECT count(*) FROM sqlite_master").fetchone()[0] == 0
+    CONNECTIONS.clear()
+
+
+def test_forked_child_gets_its_own_connection(tmp_path):
+    cache = ConnectionCache(size=2)
+    db_file = tmp_path / "forked.db"
+    parent = cache.get(db_file).conn
+    pid = os.fork()
+    if pid == 0:
+        child = cache.get(db_file).conn
+        child.execute("SELECT 1")
+        os._exit(0 if child is not parent else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert cache.get(db_file).conn is parent
+    parent.execute("SELECT 1")
+    cache.clear()
+
+
+def test_nested_transaction_is_savepoint(tmp_path):
+    with use_db(tmp_path / "nested.db"):
+        with db_conn() as conn:
+            conn.execute("CREATE TABLE t (x)")
+            with transaction(conn):
+                conn.execute("INSERT INTO t VALUES (1)")
+                with pytest.raises(ZeroDivisionError):
+                    with transaction(conn):
+                        conn.execute("INSERT INTO t VALUES (2)")
+                        1 / 0
+            assert [r[0] for r in conn.execute("SELECT x FROM t")] == [1]
+    CONNECTIONS.clear()
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    db_file = tmp_path / "baseline.db"
+    conn = sqlite3.connect(db_file)
+    conn.executescript(BASELINE_SCHEMA.read_text())
+    conn.close()
+    with use_db(db_file):
+        yield db_file
+    CONNECTIONS.clear()
+
+
+def test_migrate(baseline_db):
+    user = users.register_user("m@test.com", "pass", users.Role.EMPLOYEE, "m")
+    clock_in = pendulum.local(2022, 1, 3, 8)
+    with db_conn() as conn:
+        conn.execute(
+            "INSERT INTO workday (user_id, clock_in, clock_out) VALUES (?, ?, ?)",
+            (user.user_id, clock_in, clock_in.add(hours=8)),
+        )
+    assert migrate(baseline_db) == 0
+    assert migrate(baseline_db) == len(MIGRATIONS)
+    with db_conn() as conn:
+        assert schema_version(conn) == len(MIGRATIONS)
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master")}
+    assert {
+        "maintenance_state",
+        "event",
+        "kiosk",
+        "badge",
+        "badge_user_id",
+        "profile_sample",
+        "hours_daily",
+        "hours_weekly",
+        "rate_limit",
+        "throttle_counter",
+        "idempotency_key",
+        "idempotency_key_created",
+        "pdf_job",
+        "pdf_job_status",
+        "shift_template",
+        "shift_template_user_id",
+        "shift",
+        "shift_start",
+        "workday_clock_in",
+        "maintenance_run",
+        "workday_open",
+    } <= tables
+    assert rollups.hours(clock_in.date(), clock_in.date())[0].hours == 8
+    first, second = (WorkDay(clock_in=pendulum.now().subtract(days=n)) for n in (1, 2))
+    for wd in (first, second):
+        wd._insert(user)
+    photo = first.add_photo("a.jpg", sha256="abc")
+    assert second.add_photo("b.jpg", sha256="abc").id == photo.id
+
+
+def test_migrate_never_reuses_archived_ids(baseline_db):
+    user = users.register_user("a@test.com", "pass", users.Role.EMPLOYEE, "a")
+    archive.create_archive(baseline_db)
+    with db_conn() as conn:
+        conn.execute(
+            "INSERT INTO archive.workday (id, user_id, clock_in) VALUES (7, ?, ?)",
+            (user.user_id, pendulum.local(2020, 1, 6, 8)),
+        )
+        conn.execute("INSERT INTO archive.timesheet VALUES (4, ?, '')", (user.user_id,))
+    migrate(baseline_db)
+    wd = WorkDay(clock_in=pendulum.now())
+    wd._insert(user)
+    assert wd.id == 8
+    with db_conn() as conn:
+        seq = dict(conn.execute("SELECT name, seq FROM sqlite_sequence"))
+    assert seq["timesheet"] == 4
+
+
+def _schema(db_file):
+    """Columns and indexes of every table, whatever the indexes are named."""
+    conn = sqlite3.connect(db_file)
+    try:
+        tables = [
+            r[0]
+            for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+                " AND name NOT LIKE 'sqlite_%'"
+            )
+        ]
+        schema = {}
+        for table in tables:
+            columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+            indexes = {
+                (
+                    tuple(
+                        r[2] for r in conn.execute(f"PRAGMA index_info('{name}')")
+                    ),
+                    unique,
+                    partial,
+                )
+                for _, name, unique, _, partial in conn.execute(
+                    f"PRAGMA index_list({table})"
+                )
+            }
+            schema[table] = (columns, indexes)
+        return schema
+    finally:
+        conn.close()
+
+
+def test_migrate_matches_create_db(baseline_db, tmp_path):
+    migrate(baseline_db)
+    fresh = tmp_path / "fresh.db"
+    create_db(fresh)
+    CONNECTIONS.clear()
+    assert _schema(baseline_db) == _schema(fresh)
@@ -0,0 +1,21 @@
+from timeclock import events, timeclock
+
+
+def test_publish_and_listen(employee_user):
+    last_id = events.latest_id()
+    wd = timeclock.clock_in(employee_user)
+    timeclock.clock_out(employee_user)
+    (batch,) = events.listen(last_id, timeout=0)
+    assert [(e.name, e.workday_id) for e in batch] == [
+        ("clock_in", wd.id),
+        ("clock_out", wd.id),
+    ]
+    assert {e.user_id for e in batch} == {employee_user.user_id}
+    assert events.latest_id() == batch[-1].id
+
+
+def test_workday_update_publishes(employee_workday):
+    last_id = events.latest_id()
+    employee_workday.update()
+    (batch,) = events.listen(last_id, timeout=0)
+    assert [e.name for e in batch] == ["workday_update"]
@@ -0,0 +1,92 @@
+import base64
+
+import pendulum
+import pytest
+
+from timeclock import archive, history, users
+from timeclock.db import db_conn
+from timeclock.timesheet import TimeSheet
+from timeclock.workday import WorkDay
+
+MARCH = (pendulum.date(2023, 3, 1), pendulum.date(2023, 3, 31))
+
+
+@pytest.fixture
+def user(tenant_db):
+    user = users.register_user("h@test.com", "pass", users.Role.EMPLOYEE, "h")
+    # Feb 28 to Apr 1, 8 hours and 7 minutes rounds to 8
+    start = pendulum.local(2023, 2, 28, 8)
+    work_days = []
+    for n in range(33):
+        wd = WorkDay(clock_in=start.add(days=n))
+        wd.clock_out = wd.clock_in.add(hours=8, minutes=7)
+        wd._insert(user)
+        work_days.append(wd)
+    # The first week is archived
+    TimeSheet(work_days[:8]).save(
+        user, notes="old", workday_ids={wd.id for wd in work_days[:8]}
+    )
+    assert archive.archive_timesheets(pendulum.duration(days=1)).workdays == 8
+    WorkDay(clock_in=pendulum.local(2023, 3, 31, 20))._insert(user)
+    return user
+
+
+def test_pages(user):
+    pages = []
+    cursor = None
+    while True:
+        page = history.get_history(user.user_id, *MARCH, cursor=cursor, limit=10)
+        pages.append(page)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert [len(page.rows) for page in pages] == [10, 10, 10, 2]
+    rows = [row for page in pages for row in page.rows]
+    assert [row.date.day for row in rows] == [*range(1, 32), 31]
+    assert rows[-1].hours is None and rows[-1].clock_out is None
+    assert [page.page_hours for page in pages] == [80, 80, 80, 8]
+    assert rows[9].running_hours == 80 and rows[10].running_hours == 8
+    assert all((page.hours, page.workdays) == (248, 31) for page in pages)
+
+
+def test_cursor_survives_edits(user):
+    first = history.get_history(user.user_id, *MARCH, limit=10)
+    last = first.rows[-1]
+    with db_conn() as conn:
+        conn.execute(
+            "UPDATE workday SET clock_in = ? WHERE id = ?",
+            (last.clock_in.add(days=5, hours=1), last.id),
+        )
+    page = history.get_history(user.user_id, *MARCH, first.next_cursor, limit=10)
+    days = [row.date.day for row in page.rows]
+    assert days == [11, 12, 13, 14, 15, 15, *range(16, 20)]
+    with db_conn() as conn:
+        conn.execute("DELETE FROM workday WHERE id = ?", (last.id,))
+    page = history.get_history(user.user_id, *MARCH, first.next_cursor, limit=10)
+    assert [row.date.day for row in page.rows] == list(range(11, 21))
+
+
+def test_bad_cursor(user):
+    period = base64.urlsafe_b64encode(b"P1D 1").decode()
+    for cursor in ("12", "bm9wZQ==", "bm9wZSAx", period):
+        with pytest.raises(ValueError):
+            history.get_history(user.user_id, *MARCH, cursor)
+
+
+def test_empty_range(user):
+    assert history.get_history(user.user_id + 1, *MARCH).rows == []
+    day = pendulum.date(2023, 3, 5)
+    page = history.get_history(user.user_id, day, day)
+    assert [(row.date.day, row.hours) for row in page.rows] == [(5, 8)]
+    assert (page.hours, page.workdays, page.next_cursor) == (8, 1, None)
+
+
+def test_parse_range():
+    today = pendulum.today().date()
+    assert history.parse_range(None, None) == (
+        today.start_of("month"),
+        today.end_of("month"),
+    )
+    assert history.parse_range("2023-03-01", "2023-03-31") == MARCH
+    with pytest.raises(ValueError):
+        history.parse_range("2023-03-31", "2023-03-01")
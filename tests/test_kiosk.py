@@ -0,0 +1,72 @@
+import pendulum
+import pytest
+
+from timeclock import kiosk, users
+
+
+@pytest.fixture
+def crew(tenant_db):
+    for name in ["ann", "bob"]:
+        user = users.register_user(
+            f"{name}@test.com", "pass", users.Role.EMPLOYEE, name
+        )
+        kiosk.set_badge(user.user_id, name)
+
+
+def punch(code, direction, timestamp):
+    return kiosk.Punch.from_json(
+        dict(code=code, direction=direction, timestamp=str(timestamp))
+    )
+
+
+def statuses(results):
+    return [r.status for r in results]
+
+
+def test_punch_from_json():
+    p = punch("ann", "in", "2022-11-07T08:00:00-06:00")
+    assert p.timestamp == pendulum.datetime(2022, 11, 7, 14)
+    assert punch("ann", "in", "2022-11-07T08:00:00").timestamp is None
+    assert punch("ann", "in", "yesterday").timestamp is None
+    with pytest.raises(ValueError):
+        punch("ann", "sideways", "2022-11-07T08:00:00-06:00")
+    with pytest.raises(ValueError):
+        kiosk.Punch.from_json(dict(code=1, direction="in", timestamp=""))
+
+
+def test_get_kiosk_id(crew):
+    token = kiosk.add_kiosk("site 1")
+    assert kiosk.get_kiosk_id(token) == 1
+    assert kiosk.get_kiosk_id(token + "x") is None
+    assert kiosk.get_kiosk_id("") is None
+
+
+def test_apply_punches(crew):
+    start = pendulum.now().subtract(hours=9).replace(microsecond=0)
+    batch = [
+        punch("bob", "out", start.add(hours=8)),
+        punch("ann", "in", start),
+        punch("bob", "in", start),
+        punch("nobody", "in", start),
+        punch("ann", "in", start.add(minutes=5)),
+        punch("ann", "out", start.add(days=1)),
+    ]
+    results = kiosk.apply_punches(batch)
+    assert statuses(results) == [
+        "ok",
+        "ok",
+        "ok",
+        "unknown_badge",
+        "already_clocked_in",
+        "invalid",
+    ]
+    assert results[0].workday_id == results[2].workday_id
+
+    # The kiosk resends everything after a timeout
+    results = kiosk.apply_punches(batch)
+    assert statuses(results)[:3] == ["duplicate"] * 3
+
+    late = kiosk.apply_punches([punch("bob", "out", start.add(hours=9))])
+    assert statuses(late) == ["not_clocked_in"]
+    early = kiosk.apply_punches([punch("bob", "in", start.add(hours=1))])
+    assert statuses(early) == ["out_of_order"]
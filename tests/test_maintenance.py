@@ -0,0 +1,115 @@
+import sqlite3
+import time
+from pathlib import Path
+
+import pendulum
+import pytest
+
+from timeclock import archive, maintenance, shifts, timeclock, users
+from timeclock.db import Q, db_conn
+from timeclock.workday import WorkDay
+
+
+@pytest.fixture
+def user(tenant_db):
+    return users.register_user("m@test.com", "pass", users.Role.EMPLOYEE, "m")
+
+
+def test_auto_clock_out(user):
+    now = pendulum.now()
+    forgotten = WorkDay(clock_in=now.subtract(hours=30), notes="left early")
+    forgotten._insert(user)
+    shift_start = now.subtract(hours=20)
+    shifts.add_shift(user.user_id, shift_start, shift_start.add(hours=8))
+    planned = WorkDay(clock_in=shift_start.add(minutes=2))
+    planned._insert(user)
+    other = users.register_user("n@test.com", "pass", users.Role.EMPLOYEE, "n")
+    working = timeclock.clock_in(other)
+
+    assert maintenance.auto_clock_out(hours=16, now=now.timestamp()) == 2
+    wd = WorkDay.from_id(forgotten.id)
+    assert wd.clock_out == wd.clock_in
+    assert wd.notes == f"left early {maintenance.AUTO_CLOCK_OUT_NOTE}"
+    wd = WorkDay.from_id(planned.id)
+    assert wd.clock_out == shift_start.add(hours=8)
+    assert wd.hours == 8
+    assert WorkDay.from_id(working.id).clock_out is None
+    assert timeclock.clocked_in(other)
+    with db_conn() as conn:
+        hours = conn.execute("SELECT sum(hours) FROM hours_daily").fetchone()[0]
+    assert hours == 8
+    assert maintenance.auto_clock_out(hours=16, now=now.timestamp()) == 0
+
+
+def test_checkpoint(user, tenant_db):
+    wal = Path(f"{tenant_db}-wal")
+    assert wal.stat().st_size
+    assert maintenance.checkpoint(quiet=3600) == "main: written 0s ago"
+    assert maintenance.checkpoint(quiet=0).startswith("main: truncated")
+    assert wal.stat().st_size == 0
+    assert maintenance.checkpoint(quiet=0) == "nothing to do"
+
+
+def test_backup(user, tenant_db, tmp_path):
+    backups = tmp_path / "backups"
+    result = maintenance.backup(backups, pages=1, sleep=0)
+    assert result.startswith("tenant.db ")
+    archive.create_archive(tenant_db)
+    result = maintenance.backup(backups, pages=1, sleep=0)
+    assert "tenant.archive.db" in result
+    copy = sqlite3.connect(backups / "tenant.db")
+    try:
+        emails = copy.execute("SELECT email FROM user").fetchall()
+    finally:
+        copy.close()
+    assert emails == [("m@test.com",)]
+    assert sorted(p.name for p in backups.iterdir()) == [
+        "tenant.archive.db",
+        "tenant.db",
+    ]
+
+
+def test_run_due(tenant_db):
+    ran = []
+
+    def ok():
+        ran.append("ok")
+        return "did it"
+
+    def broken():
+        raise OSError("disk full")
+
+    jobs = [maintenance.Job("ok", 60, ok), maintenance.Job("broken", 60, broken)]
+    now = time.time()
+    runs = maintenance.run_due(jobs, now=now)
+    assert [(r.job, r.result, r.error) for r in runs] == [
+        ("ok", "did it", None),
+        ("broken", "", "OSError: disk full"),
+    ]
+    assert all(r.seconds >= 0 for r in runs)
+    assert maintenance.run_due(jobs, now=now + 30) == []
+    assert len(maintenance.run_due(jobs, now=now + 61)) == 2
+    assert ran == ["ok", "ok"]
+    assert [r.job for r in maintenance.get_runs()] == ["broken", "ok"]
+    with db_conn() as conn:
+        assert len(Q.get_maintenance_runs(conn)) == 2
+
+
+def test_one_leader(tmp_path):
+    lock = tmp_path / "scheduler.lock"
+    first, second = maintenance._Scheduler(), maintenance._Scheduler()
+    assert first.lead(lock)
+    assert first.lead(lock)
+    assert not second.lead(lock)
+    first._leader.close()
+    assert second.lead(lock)
+    second._leader.close()
+
+
+def test_jobs():
+    assert [job.name for job in maintenance.jobs(0, None)] == ["checkpoint"]
+    assert [job.name for job in maintenance.jobs(16, Path("b"))] == [
+        "checkpoint",
+        "auto-clock-out",
+        "backup",
+    ]
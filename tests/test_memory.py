@@ -0,0 +1,67 @@
+import tracemalloc
+
+import pytest
+
+from timeclock import memory
+
+
+@pytest.fixture
+def tracing():
+    tracemalloc.start(5)
+    yield
+    tracemalloc.stop()
+
+
+def test_rss_mb():
+    assert memory.rss_mb() > 0
+
+
+def test_snapshot_path(tmp_path):
+    assert memory.snapshot_path(tmp_path, "12-34.tracemalloc") == (
+        tmp_path / "12-34.tracemalloc"
+    )
+    with pytest.raises(ValueError):
+        memory.snapshot_path(tmp_path, "../12-34.tracemalloc")
+
+
+def test_take_snapshot_not_tracing(tmp_path):
+    with pytest.raises(RuntimeError):
+        memory.take_snapshot(tmp_path)
+
+
+def test_snapshot_diff(tmp_path, tracing):
+    old = memory.take_snapshot(tmp_path)
+    leak = [bytearray(1024) for _ in range(1000)]  # noqa: F841
+    new = memory.take_snapshot(tmp_path)
+    assert memory.list_snapshots(tmp_path) == sorted([old, new])
+    assert memory.top(tmp_path / new)
+    grew = memory.diff(tmp_path / old, tmp_path / new, limit=1)[0]
+    assert "test_memory.py" in grew["site"]
+    assert grew["size_diff_kb"] >= 1000
+
+
+def test_memory_views(app, owner_user, employee_user, tracing, tmp_path):
+    app.config["MEMORY_SNAPSHOT_DIR"] = tmp_path
+    with app.test_client(user=owner_user) as client:
+        old = client.post("/timeclock/admin/memory/snapshots").json["name"]
+        new = client.post("/timeclock/admin/memory/snapshots").json["name"]
+        resp = client.get(
+            "/timeclock/admin/memory/diff", query_string=dict(old=old, new=new)
+        )
+        assert resp.status_code == 200
+        assert client.get("/timeclock/admin/memory").json["tracing"]
+    with app.test_client(user=employee_user) as client:
+        assert client.get("/timeclock/admin/memory").status_code == 403
+
+
+def test_recycler_logs_reason(app, employee_user, monkeypatch, caplog):
+    monkeypatch.setattr(memory, "RECYCLER", memory._Recycler())
+    monkeypatch.setattr(memory, "CHECK_EVERY", 1)
+    app.config["MAX_RSS_MB"] = 1
+    app.after_request(memory.RECYCLER.check)
+    with app.test_client(user=employee_user) as client:
+        client.get("/timeclock")
+        client.get("/timeclock")
+    warnings = [r.message for r in caplog.records if "MAX_RSS_MB" in r.message]
+    assert len(warnings) == 1
+    assert "not recycling" in warnings[0]
@@ -0,0 +1,149 @@
+import io
+import time
+import zipfile
+
+import pendulum
+import pytest
+from PIL import Image
+
+from timeclock import archive, pdfs, users
+from timeclock.db import Q, db_conn, transaction
+from timeclock.timesheet import TimeSheet
+from timeclock.workday import WorkDay
+
+
+@pytest.fixture
+def paths(tmp_path):
+    upload_path = tmp_path / "uploads"
+    upload_path.mkdir()
+    return upload_path, tmp_path / "pdfs"
+
+
+@pytest.fixture
+def user(tenant_db):
+    return users.register_user("pdf@test.com", "pass", users.Role.EMPLOYEE, "pdf")
+
+
+def save_timesheet(user, start, notes="ok"):
+    work_days = []
+    for n in range(3):
+        wd = WorkDay(
+            clock_in=start.add(days=n, hours=8),
+            clock_out=start.add(days=n, hours=16),
+            notes="long day " * n,
+        )
+        wd._insert(user)
+        work_days.append(wd)
+    ts = TimeSheet(work_days)
+    ts.save(user, notes=notes, workday_ids={wd.id for wd in work_days})
+    with db_conn() as conn:
+        return conn.execute("SELECT max(id) FROM timesheet").fetchone()[0], work_days
+
+
+def test_save_queues_pdf(user, paths):
+    ts_id, _ = save_timesheet(user, pendulum.local(2022, 1, 3))
+    assert pdfs.get_job(ts_id).status == "queued"
+
+    assert pdfs.run_jobs(*paths) == 1
+    job = pdfs.get_job(ts_id)
+    assert job.status == "done"
+    assert job.ready(paths[1])
+    assert (paths[1] / job.filename).read_bytes().startswith(b"%PDF")
+    assert pdfs.run_jobs(*paths) == 0
+
+
+def test_rendering_again_gives_the_same_file(user, paths):
+    ts_id, _ = save_timesheet(user, pendulum.local(2022, 1, 3))
+    pdfs.run_jobs(*paths)
+    first = pdfs.get_job(ts_id).sha256
+
+    # A ready PDF isn't rendered again
+    pdfs.request_pdfs([ts_id], paths[1])
+    assert pdfs.get_job(ts_id).status == "done"
+    (paths[1] / f"{first}.pdf").unlink()
+    pdfs.request_pdfs([ts_id], paths[1])
+    assert pdfs.get_job(ts_id).status == "queued"
+    pdfs.run_jobs(*paths)
+    assert pdfs.get_job(ts_id).sha256 == first
+    assert [p.name for p in paths[1].iterdir()] == [f"{first}.pdf"]
+
+
+def test_render_photos(user, paths):
+    upload_path, _ = paths
+    _, work_days = save_timesheet(user, pendulum.local(2022, 1, 3))
+    Image.new("RGB", (400, 300), "red").save(upload_path / "a.jpg")
+    work_days[0].add_photo("a.jpg", "a")
+    work_days[0].add_photo("gone.jpg", "gone")
+    ts = TimeSheet.from_id(1)
+
+    pdf = pdfs.render(ts, "pdf", upload_path)
+    assert pdf.startswith(b"%PDF")
+    assert pdf != pdfs.render(TimeSheet.from_id(1), "other", upload_path)
+
+
+def test_failed_job(user, paths, monkeypatch):
+    ts_id, _ = save_timesheet(user, pendulum.local(2022, 1, 3))
+
+    def broken(*args):
+        raise OSError("disk on fire")
+
+    monkeypatch.setattr(pdfs, "render", broken)
+    assert pdfs.run_jobs(*paths) == pdfs.MAX_ATTEMPTS
+    job = pdfs.get_job(ts_id)
+    assert job.status == "failed"
+    assert job.error == "OSError: disk on fire"
+
+    monkeypatch.undo()
+    # Asking for it again doesn't give it new attempts
+    pdfs.request_pdfs([ts_id], paths[1])
+    assert pdfs.get_job(ts_id).status == "failed"
+    assert pdfs.run_jobs(*paths) == 0
+    assert pdfs.retry_failed() == 1
+    assert pdfs.run_jobs(*paths) == 1
+    assert pdfs.get_job(ts_id).status == "done"
+
+
+def test_stale_job_is_claimed_again(user, paths):
+    ts_id, _ = save_timesheet(user, pendulum.local(2022, 1, 3))
+    now = time.time()
+    with db_conn() as conn:
+        with transaction(conn):
+            claim = dict(max_attempts=pdfs.MAX_ATTEMPTS, stale=now - 60)
+            assert Q.claim_pdf_job(conn, now=now - 120, **claim) == ts_id
+            assert Q.claim_pdf_job(conn, now=now, **claim) == ts_id
+            assert Q.claim_pdf_job(conn, now=now, **claim) is None
+
+
+def test_archived_timesheet(user, paths):
+    ts_id, _ = save_timesheet(user, pendulum.local(2020, 1, 6))
+    archive.archive_timesheets(pendulum.duration(days=365))
+    assert pdfs.timesheet_user_id(ts_id) == user.user_id
+    assert pdfs.run_jobs(*paths) == 1
+    assert pdfs.get_job(ts_id).status == "done"
+
+
+def test_queue_missing(user, paths):
+    ts_id, _ = save_timesheet(user, pendulum.local(2022, 1, 3))
+    with db_conn() as conn:
+        conn.execute("DELETE FROM pdf_job")
+    assert pdfs.get_job(ts_id) is None
+    assert pdfs.queue_missing() == 1
+    assert pdfs.queue_missing() == 0
+    assert pdfs.counts() == {"queued": 1}
+
+
+def test_pay_period_zip(user, paths):
+    first, _ = save_timesheet(user, pendulum.local(2022, 1, 3))
+    second, _ = save_timesheet(user, pendulum.local(2022, 1, 17))
+    save_timesheet(user, pendulum.local(2022, 2, 7))
+    pdfs.run_jobs(*paths)
+
+    timesheets = pdfs.pay_period(pendulum.date(2022, 1, 1), pendulum.date(2022, 1, 31))
+    assert [ts.id for ts in timesheets] == [first, second]
+    f = io.BytesIO()
+    pdfs.write_zip(f, paths[1], timesheets)
+    with zipfile.ZipFile(f) as zf:
+        assert zf.namelist() == [
+            f"pdf-2022-01-03-2022-01-05-{first}.pdf",
+            f"pdf-2022-01-17-2022-01-19-{second}.pdf",
+        ]
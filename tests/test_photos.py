@@ -0,0 +1,77 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from timeclock import photos
+from timeclock.workday import Photo
+
+
+def make_image(format, size=(400, 300)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, "red").save(buf, format=format)
+    buf.seek(0)
+    return buf
+
+
+def test_sniff_format():
+    assert photos.sniff_format(make_image("JPEG").read()) == "JPEG"
+    assert photos.sniff_format(make_image("PNG").read()) == "PNG"
+
+
+def test_spool_rejects_non_image(tmp_path):
+    with pytest.raises(photos.InvalidImageError):
+        photos.spool(io.BytesIO(b"GIF89a not allowed"), tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spool_hashes_upload(tmp_path):
+    data = make_image("PNG").getvalue()
+    upload = photos.spool(io.BytesIO(data), tmp_path)
+    assert upload.format == "PNG"
+    assert upload.path.read_bytes() == data
+    upload.discard()
+    assert not upload.path.exists()
+
+
+@pytest.mark.parametrize("format", ["JPEG", "PNG"])
+def test_save_reduced(tmp_path, format):
+    upload = photos.spool(make_image(format), tmp_path)
+    dest = tmp_path / "reduced"
+    photos.save_reduced(upload, dest)
+    with Image.open(dest) as image:
+        assert image.size == (100, 75)
+        assert image.format == format
+
+
+def test_save_reduced_truncated_image(tmp_path):
+    data = make_image("JPEG").getvalue()[:32]
+    upload = photos.spool(io.BytesIO(data), tmp_path)
+    dest = tmp_path / "reduced"
+    with pytest.raises(photos.InvalidImageError):
+        photos.save_reduced(upload, dest)
+    assert not dest.exists()
+
+
+def test_collect_garbage(DB, tmp_path, employee_workday):
+    employee_workday.add_photo("kept.jpg", "kept")
+    orphan = Photo.new("orphan.jpg", "orphan")
+    for name in ["kept.jpg", "orphan.jpg", "stray.jpg", "new.jpg"]:
+        (tmp_path / name).write_bytes(b"")
+    old = time.time() - photos.GC_GRACE_SECONDS - 1
+    os.utime(tmp_path / "stray.jpg", (old, old))
+
+    files_done = rows_done = False
+    removed = []
+    while not (files_done and rows_done):
+        report = photos.collect_garbage(tmp_path, batch_size=2)
+        files_done |= report.files_done
+        rows_done |= report.rows_done
+        removed += report.removed
+
+    assert sorted(removed) == ["orphan.jpg", "stray.jpg"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["kept.jpg", "new.jpg"]
+    assert Photo.from_sha256(orphan.sha256) is None
+    assert Photo.from_sha256("kept") is not None
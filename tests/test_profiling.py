@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from timeclock import profiling
+
+
+def busy(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_sampler():
+    sampler = profiling._Sampler(interval=0.001)
+    thread_id = threading.get_ident()
+    sampler.add(thread_id)
+    busy(0.05)
+    samples = sampler.remove(thread_id)
+    assert sum(samples.values()) > 5
+    assert any(stack.endswith("busy (tests/test_profiling.py:9)") for stack in samples)
+
+
+def test_enable_validation(DB):
+    with pytest.raises(ValueError):
+        profiling.enable(0, 0.5)
+    with pytest.raises(ValueError):
+        profiling.enable(60, 2)
+
+
+def test_profile_requests(app, owner_user, employee_user, monkeypatch):
+    monkeypatch.setattr(profiling.SAMPLER, "interval", 0.0005)
+    with app.test_client(user=owner_user) as client:
+        resp = client.post(
+            "/timeclock/admin/profiling", json=dict(seconds=60, sample_rate=1)
+        )
+        assert resp.status_code == 200
+        with app.test_client(user=employee_user) as employee:
+            for _ in range(5):
+                # close the streamed page so its request context is popped here
+                employee.get(
+                    "/timeclock/timesheet", query_string={"user_id": employee_user.id}
+                ).close()
+        client.delete("/timeclock/admin/profiling")
+        collapsed = client.get(
+            "/timeclock/admin/profiling/collapsed",
+            query_string={"endpoint": "timeclock.current_timesheet"},
+        )
+        speedscope = client.get("/timeclock/admin/profiling/speedscope")
+    assert collapsed.headers["Content-Disposition"].startswith("attachment")
+    lines = collapsed.text.splitlines()
+    assert lines
+    assert all(line.startswith("timeclock.current_timesheet;") for line in lines)
+    names = [p["name"] for p in speedscope.json["profiles"]]
+    assert "timeclock.current_timesheet" in names
+    assert profiling.SWITCH.sample_rate() == 0
+
+
+def test_profiling_employee_forbidden(app, employee_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.post("/timeclock/admin/profiling", json=dict(seconds=60))
+    assert resp.status_code == 403
@@ -0,0 +1,116 @@
+import csv
+
+import pendulum
+import pytest
+
+from timeclock import punch_import, rollups, users
+from timeclock.db import Q, db_conn
+from timeclock.workday import WorkDay
+
+
+@pytest.fixture
+def import_user(tenant_db):
+    return users.register_user(
+        "import@test.com", "pass", users.Role.EMPLOYEE, "imported"
+    )
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["user", "clock_in", "clock_out", "notes"])
+        writer.writerows(rows)
+    return path
+
+
+def workday_count():
+    with db_conn() as conn:
+        return conn.execute("SELECT count(*) FROM workday").fetchone()[0]
+
+
+def test_parse_timestamps():
+    tz = pendulum.timezone("America/Chicago")
+    parsed = punch_import.parse_timestamps(
+        ["2022-01-03 08:00", "2022-07-01T08:00:00+00:00", "nope", ""], tz
+    )
+    assert parsed[0].isoformat(" ") == "2022-01-03 08:00:00-06:00"
+    assert parsed[1].isoformat(" ") == "2022-07-01 08:00:00+00:00"
+    assert parsed[2:] == [None, None]
+    parsed = punch_import.parse_timestamps(["01/03/2022 8:00"], tz, "%m/%d/%Y %H:%M")
+    assert parsed == [pendulum.datetime(2022, 1, 3, 8, tz=tz)]
+
+
+def test_import_punches(import_user, tmp_path):
+    path = write_csv(
+        tmp_path / "export.csv",
+        [
+            ["import@test.com", "2022-01-03 08:00", "2022-01-03 16:00", "first"],
+            ["imported", "2022-01-04 08:00", "2022-01-04 12:30", ""],
+            ["nobody", "2022-01-05 08:00", "2022-01-05 16:00", ""],
+            ["imported", "2022-01-06 08:00", "2022-01-06 07:00", ""],
+            ["imported", "yesterday", "2022-01-07 16:00", ""],
+            ["imported", "2022-01-03 08:00", "2022-01-03 17:00", "again"],
+        ],
+    )
+    report = punch_import.import_punches(path, tz="America/Chicago", chunk_size=2)
+    assert report.rows == 6
+    assert (report.inserted, report.conflicts, report.invalid) == (2, 1, 3)
+    assert [row for row, _ in report.errors] == [3, 4, 5]
+    wd = WorkDay.current(import_user)
+    assert wd.clock_in == pendulum.datetime(2022, 1, 4, 8, tz="America/Chicago")
+    assert wd.hours == 4.5
+    january = (pendulum.date(2022, 1, 1), pendulum.date(2022, 1, 31))
+    month = rollups.hours(*january, "month")
+    assert [r.hours for r in month] == [12.5]
+
+
+def test_import_punches_resumes(import_user, tmp_path, monkeypatch):
+    rows = [
+        ["imported", f"2022-01-{d:02} 08:00", f"2022-01-{d:02} 16:00", ""]
+        for d in range(1, 11)
+    ]
+    path = write_csv(tmp_path / "export.csv", rows)
+    import_workdays = Q.import_workdays
+
+    def dies_after_one_chunk(conn, workdays):
+        monkeypatch.setattr(Q, "import_workdays", crash)
+        return import_workdays(conn, workdays)
+
+    def crash(conn, workdays):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(Q, "import_workdays", dies_after_one_chunk)
+    with pytest.raises(OSError):
+        punch_import.import_punches(path, tz="UTC", chunk_size=4)
+    monkeypatch.setattr(Q, "import_workdays", import_workdays)
+    assert workday_count() == 4
+    report = punch_import.import_punches(path, tz="UTC", chunk_size=3)
+    assert (report.resumed_at, report.rows, report.inserted) == (4, 6, 6)
+    assert workday_count() == 10
+    with db_conn() as conn:
+        assert Q.get_state(conn, key=f"punch_import.{path.resolve()}") is None
+
+    report = punch_import.import_punches(path, tz="UTC", restart=True)
+    assert (report.rows, report.inserted, report.conflicts) == (10, 0, 10)
+
+
+def test_import_punches_new_file(import_user, tmp_path):
+    rows = [
+        ["imported", f"2022-02-{d:02} 08:00", f"2022-02-{d:02} 16:00", ""]
+        for d in range(1, 11)
+    ]
+    path = write_csv(tmp_path / "export.csv", rows[:6])
+    key = f"punch_import.{path.resolve()}"
+    with db_conn() as conn:
+        Q.set_state(conn, key=key, value=f"3 {punch_import.fingerprint(path)}")
+    # Another export at the same path is read from the top
+    write_csv(path, rows[6:])
+    report = punch_import.import_punches(path, tz="UTC")
+    assert (report.resumed_at, report.rows, report.inserted) == (0, 4, 4)
+    # A checkpoint past the end of the file isn't trusted
+    with db_conn() as conn:
+        Q.set_state(conn, key=key, value=f"6 {punch_import.fingerprint(path)}")
+    with pytest.raises(ValueError):
+        punch_import.import_punches(path, tz="UTC")
+    report = punch_import.import_punches(path, tz="UTC", restart=True)
+    assert (report.rows, report.conflicts) == (4, 4)
@@ -0,0 +1,91 @@
+import pendulum
+import pytest
+
+from timeclock import rollups, timeclock, users
+from timeclock.workday import WorkDay
+
+
+@pytest.fixture
+def rollup_user(tenant_db):
+    return users.register_user(
+        "rollups@test.com", "pass", users.Role.EMPLOYEE, "rolled"
+    )
+
+
+def _workday(user, clock_in, hours):
+    wd = WorkDay(clock_in=clock_in, clock_out=clock_in.add(hours=hours))
+    wd._insert(user)
+    return wd
+
+
+def _hours(period, start=pendulum.date(2022, 1, 1), end=pendulum.date(2022, 12, 31)):
+    return [(r.period, r.hours, r.workdays) for r in rollups.hours(start, end, period)]
+
+
+def test_insert_rolls_up(rollup_user):
+    monday = pendulum.local(2022, 1, 3, 8)
+    _workday(rollup_user, monday, 8)
+    _workday(rollup_user, monday.add(hours=9), 1.5)
+    _workday(rollup_user, monday.add(days=6), 4)
+    _workday(rollup_user, monday.add(weeks=4), 7.25)
+    assert _hours("day") == [
+        ("2022-01-03", 9.5, 2),
+        ("2022-01-09", 4.0, 1),
+        ("2022-01-31", 7.25, 1),
+    ]
+    assert _hours("week") == [("2022-01-03", 13.5, 3), ("2022-01-31", 7.25, 1)]
+    assert _hours("month") == [("2022-01", 20.75, 4)]
+    assert _hours("year") == [("2022", 20.75, 4)]
+
+
+def test_hours_rounded_like_workday(rollup_user):
+    wd = _workday(rollup_user, pendulum.local(2022, 1, 7, 8, 14), 6.77)
+    assert _hours("day") == [("2022-01-07", wd.hours, 1)]
+
+
+def test_update_moves_hours(rollup_user):
+    wd = _workday(rollup_user, pendulum.local(2022, 1, 3, 8), 8)
+    wd.clock_in = wd.clock_in.add(weeks=1)
+    wd.clock_out = wd.clock_in.add(hours=6)
+    wd.update()
+    assert _hours("day") == [("2022-01-10", 6.0, 1)]
+    assert _hours("week") == [("2022-01-10", 6.0, 1)]
+
+
+def test_clock_out_rolls_up(rollup_user):
+    timeclock.clock_in(rollup_user)
+    today = pendulum.today().date()
+    assert _hours("day", today, today) == []
+    timeclock.clock_out(rollup_user)
+    assert _hours("day", today, today) == [(str(today), 0.0, 1)]
+
+
+def test_rebuild_matches_incremental(rollup_user):
+    start = pendulum.local(2022, 1, 3, 7, 50)
+    for n in range(20):
+        _workday(rollup_user, start.add(days=n), 8 + n / 7)
+    incremental = {p: _hours(p) for p in rollups.PERIODS}
+    rollups.rebuild()
+    assert {p: _hours(p) for p in rollups.PERIODS} == incremental
+
+
+def test_weeks_are_whole(rollup_user):
+    _workday(rollup_user, pendulum.local(2022, 1, 3, 8), 8)
+    friday = pendulum.date(2022, 1, 7)
+    assert _hours("week", friday, friday) == [("2022-01-03", 8.0, 1)]
+    assert _hours("day", friday, friday) == []
+
+
+def test_parse_range():
+    assert rollups.parse_range("2022-01-01", "2022-02-01") == (
+        pendulum.date(2022, 1, 1),
+        pendulum.date(2022, 2, 1),
+    )
+    start, end = rollups.parse_range(None, "2022-03-31", weeks=2)
+    assert start == pendulum.date(2022, 3, 21)
+    with pytest.raises(ValueError):
+        rollups.parse_range("2022-02-01", "2022-01-01")
+    with pytest.raises(ValueError):
+        rollups.parse_range("2022-02-01T08:00", None)
+    with pytest.raises(ValueError):
+        rollups.hours(start, end, "fortnight")
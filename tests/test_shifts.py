@@ -0,0 +1,126 @@
+import pendulum
+import pytest
+
+from timeclock import shifts, users
+from timeclock.workday import WorkDay
+
+HOUR = 3600
+
+
+def shift(user_id, start, end):
+    return shifts.Shift(user_id, f"user{user_id}", start * HOUR, end * HOUR)
+
+
+def statuses(results):
+    return [(r.status, r.late_minutes, r.covered // 60) for r in results]
+
+
+def test_template_days():
+    template = shifts.ShiftTemplate(
+        1, 1, "a", weekday=2, start="09:00", minutes=60, valid_from="2022-01-04"
+    )
+    days = template.days(pendulum.date(2022, 1, 1), pendulum.date(2022, 1, 31))
+    assert [d.day for d in days] == [5, 12, 19, 26]
+    template.valid_until = "2022-01-19"
+    days = template.days(pendulum.date(2022, 1, 10), pendulum.date(2022, 1, 31))
+    assert [d.day for d in days] == [12, 19]
+
+
+def test_reconcile():
+    shift_list = [
+        shift(1, 8, 16),
+        # overlaps the first shift's workday, on time
+        shift(1, 15, 17),
+        shift(1, 32, 40),
+        shift(2, 8, 16),
+        shift(2, 32, 40),
+        # starts after now
+        shift(2, 56, 64),
+        shift(4, 8, 16),
+    ]
+    punches = [
+        (1, 1, 8 * HOUR, 16 * HOUR),
+        (2, 1, 33 * HOUR, 36 * HOUR),
+        (3, 1, 37 * HOUR, 40 * HOUR),
+        # no shifts
+        (4, 3, 8 * HOUR, 16 * HOUR),
+        # clocked in early and still working
+        (5, 4, 7 * HOUR, None),
+    ]
+    results = list(shifts.reconcile(shift_list, punches, now=50 * HOUR))
+    assert statuses(results) == [
+        ("on_time", 0, 480),
+        ("on_time", 0, 60),
+        ("late", 60, 360),
+        ("no_show", 0, 0),
+        ("no_show", 0, 0),
+        ("upcoming", 0, 0),
+        ("on_time", 0, 480),
+    ]
+
+    cov = shifts.coverage(results)
+    assert cov[1].late == 1 and cov[1].late_minutes == 60
+    assert cov[1].percent == round(100 * (8 + 1 + 6) / (8 + 2 + 8))
+    assert cov[2].no_shows == 2 and cov[2].shifts == 2
+    assert cov[2].percent == 0
+    assert 3 not in cov
+
+
+def test_reconcile_shift_in_progress():
+    results = list(
+        shifts.reconcile([shift(1, 8, 16)], [(1, 1, 8 * HOUR, None)], now=10 * HOUR)
+    )
+    assert statuses(results) == [("on_time", 0, 120)]
+    assert shifts.coverage(results)[1].percent == 100
+
+
+@pytest.fixture
+def user(tenant_db):
+    return users.register_user("shift@test.com", "pass", users.Role.EMPLOYEE, "s")
+
+
+def test_results(user):
+    monday = pendulum.local(2022, 1, 3)
+    shifts.add_template(
+        user.user_id, 0, "08:00", 8 * 60, monday.date(), monday.add(weeks=1).date()
+    )
+    shifts.add_template(user.user_id, 2, "08:00", 8 * 60, monday.date())
+    for clock_in in (monday.add(hours=8), monday.add(days=7, hours=9)):
+        WorkDay(clock_in=clock_in, clock_out=clock_in.add(hours=7))._insert(user)
+
+    results = shifts.results(
+        monday.date(), monday.add(days=13).date(), now=monday.add(weeks=3).timestamp()
+    )
+    assert [(r.shift.starts_at.day, r.status) for r in results] == [
+        (3, "on_time"),
+        (5, "no_show"),
+        (10, "late"),
+        (12, "no_show"),
+    ]
+    cov = shifts.coverage(results)[user.user_id]
+    assert (cov.shifts, cov.late_minutes, cov.percent) == (4, 60, 44)
+    assert shifts.results(monday.date(), monday.date(), user_id=user.user_id + 1) == []
+
+
+def test_one_off_shift(user):
+    start = pendulum.local(2022, 1, 8, 22)
+    with pytest.raises(ValueError):
+        shifts.add_shift(user.user_id, start, start)
+    shifts.add_shift(user.user_id, start, start.add(hours=8))
+    WorkDay(clock_in=start.add(minutes=3), clock_out=start.add(hours=8))._insert(user)
+    now = start.add(days=1).timestamp()
+    results = shifts.results(start.date(), start.date(), now=now)
+    assert statuses(results) == [("on_time", 3, 477)]
+    assert shifts.get_shifts(start.date().add(days=1), start.date().add(days=1)) == []
+
+
+def test_end_template(user):
+    today = pendulum.date(2022, 1, 12)
+    started = shifts.add_template(user.user_id, 0, "08:00", 60, today.subtract(days=9))
+    later = shifts.add_template(user.user_id, 1, "08:00", 60, today.add(days=1))
+    with pytest.raises(ValueError):
+        shifts.add_template(user.user_id, 1, "8 o'clock", 60, today)
+    shifts.end_template(started, today)
+    shifts.end_template(later, today)
+    templates = shifts.get_templates(today.subtract(weeks=4), today.add(weeks=4))
+    assert [(t.id, t.valid_until) for t in templates] == [(started, "2022-01-12")]
@@ -0,0 +1,47 @@
+import pytest
+
+from timeclock import create_app, tenants, users
+from timeclock.db import use_db
+
+
+@pytest.fixture
+def tenant_app(monkeypatch, tmp_path):
+    monkeypatch.setenv("TIMECLOCK_TENANT_ROUTING", "prefix")
+    monkeypatch.setenv("TIMECLOCK_TENANTS_DIR", str(tmp_path))
+    for name in ["acme", "globex"]:
+        db_file = tenants.create_tenant(tmp_path, name)
+        with use_db(db_file):
+            users.register_user(
+                f"{name}@test.com", "pass", users.Role.EMPLOYEE, name
+            )
+    yield create_app()
+
+
+def test_create_tenant_invalid_name(tmp_path):
+    with pytest.raises(ValueError):
+        tenants.create_tenant(tmp_path, "../etc")
+
+
+def test_create_tenant_exists(tmp_path):
+    tenants.create_tenant(tmp_path, "acme")
+    with pytest.raises(ValueError):
+        tenants.create_tenant(tmp_path, "acme")
+
+
+def test_prefix_routing(tenant_app):
+    with tenant_app.test_client() as client:
+        resp = client.get("/acme/timeclock")
+        assert resp.status_code == 302
+        assert resp.headers["Location"] == "/acme/timeclock/auth/login"
+        assert client.get("/initech/timeclock").status_code == 404
+        assert client.get("/timeclock").status_code == 404
+
+
+def test_login_is_per_tenant(tenant_app):
+    with tenant_app.test_client() as client:
+        form = dict(email="acme@test.com", unhashed_password="pass")
+        assert client.post("/globex/timeclock/auth/login", data=form).status_code == 401
+        assert client.post("/acme/timeclock/auth/login", data=form).status_code == 302
+        assert client.get("/acme/timeclock").status_code == 200
+        # Same user id exists in globex but the session belongs to acme
+        assert client.get("/globex/timeclock").status_code == 302
@@ -0,0 +1,41 @@
+import pytest
+
+from timeclock import throttle
+
+
+@pytest.fixture
+def throttle_db(tenant_db, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(throttle.time, "time", lambda: now[0])
+    return now
+
+
+def test_account_bucket(throttle_db, monkeypatch):
+    monkeypatch.setattr(throttle, "ACCOUNT", throttle.Bucket("account", 2, 1 / 10))
+    assert throttle.check_login("10.0.0.1", "a@test.com") is None
+    assert throttle.check_login("10.0.0.2", "A@test.com ") is None
+    assert throttle.check_login("10.0.0.3", "a@test.com") == 10
+    # Other accounts are not affected
+    assert throttle.check_login("10.0.0.3", "b@test.com") is None
+    throttle_db[0] += 4
+    assert throttle.check_login("10.0.0.1", "a@test.com") == 6
+    throttle_db[0] += 6
+    assert throttle.check_login("10.0.0.1", "a@test.com") is None
+    assert throttle.counters() == dict(account_rejected=2)
+
+
+def test_ip_bucket(throttle_db, monkeypatch):
+    monkeypatch.setattr(throttle, "IP", throttle.Bucket("ip", 3, 1))
+    for n in range(3):
+        assert throttle.check_login("10.0.0.1", f"{n}@test.com") is None
+    assert throttle.check_login("10.0.0.1", "new@test.com") == 1
+    assert throttle.check_login("10.0.0.2", "new@test.com") is None
+    assert throttle.counters() == dict(ip_rejected=1)
+
+
+def test_login_succeeded_refills(throttle_db, monkeypatch):
+    monkeypatch.setattr(throttle, "ACCOUNT", throttle.Bucket("account", 1, 1 / 60))
+    assert throttle.check_login("10.0.0.1", "a@test.com") is None
+    assert throttle.check_login("10.0.0.1", "a@test.com") == 60
+    throttle.login_succeeded("a@test.com")
+    assert throttle.check_login("10.0.0.1", "a@test.com") is None
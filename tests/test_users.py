@@ -46,3 +46,48 @@ def test_verify_user_good_pass(employee_user):
 def test_verify_user_bad_pass(employee_user):
     with pytest.raises(ValueError):
         users.verify_user(employee_user.email, "badpass")
+
+
+def test_hash_password():
+    password_hash = users.hash_password("pass123")
+    assert users.bcrypt.checkpw(b"pass123", password_hash.encode())
+
+
+def test_find_user(employee_user):
+    for login in (str(employee_user.id), employee_user.email, employee_user.username):
+        assert users.find_user(login) == employee_user
+    assert users.find_user("nobody") is None
+
+
+def test_find_user_numeric_username(employee_user):
+    numeric = users.register_user(
+        "n@test.com", "pass", users.Role.EMPLOYEE, str(employee_user.id)
+    )
+    assert users.find_user(str(employee_user.id)) == numeric
+    assert users.find_user(str(numeric.id)) == numeric
+
+
+def test_import_users(tenant_db):
+    rows = [
+        dict(email="a@test.com", username="a", password="pa"),
+        dict(email="b@test.com", username="b", password="pb", role="owner"),
+        dict(email="a@test.com", username="a2", password="pa"),
+        dict(email="c@test.com", username="c", password=""),
+        dict(email="d@test.com", username="d", password="pd", role="boss"),
+        dict(email="taken@test.com", username="e", password="pe"),
+        dict(email="f@test.com", username="f", password="pf"),
+    ]
+    users.register_user("taken@test.com", "pass", users.Role.EMPLOYEE, "taken")
+    report = users.import_users(rows, workers=2)
+    assert [(r.line, r.error) for r in report] == [
+        (2, None),
+        (3, None),
+        (4, "duplicate email"),
+        (5, "missing password"),
+        (6, "unknown role BOSS"),
+        (7, "email already registered"),
+        (8, None),
+    ]
+    assert users.verify_user("b@test.com", "pb").role == users.Role.OWNER
+    assert users.verify_user("f@test.com", "pf").username == "f"
+    assert users.find_user("c@test.com") is None
@@ -1,3 +1,15 @@
+import io
+import time
+import zipfile
+
+import pendulum
+import pytest
+
+from timeclock import events, kiosk, maintenance, pdfs, throttle, timeclock
+from timeclock.db import Q, db_conn, transaction
+from timeclock.timesheet import get_past_timesheets
+
+
 def test_index_not_logged_in(app):
     """Redirect to timeclock.auth.login."""
     with app.test_client() as client:
@@ -44,7 +56,33 @@ def test_current_timesheet_employee_view(app, employee_user):
         resp = client.get(
             "/timeclock/timesheet", query_string={"user_id": employee_user.id}
         )
-    assert resp.status_code == 200
+        assert resp.status_code == 200
+        assert resp.is_streamed
+        assert "<h3>Past Timesheets</h3>" in resp.text
+
+
+def test_current_timesheet_streams_past_timesheets(
+    app, owner_user, employee_user, fake_timesheet, saved_timesheet
+):
+    ts_id = get_past_timesheets(employee_user)[0].id
+    with app.test_client(user=owner_user) as client:
+        resp = client.get(
+            "/timeclock/timesheet", query_string={"user_id": employee_user.id}
+        )
+        assert resp.is_streamed
+        assert f'<a href="/timeclock/timesheet/{ts_id}">{ts_id}</a>' in resp.text
+        resp = client.get(f"/timeclock/timesheet/{ts_id}")
+        assert resp.is_streamed
+        workdays = resp.text.count('href="/timeclock/workday/')
+        assert workdays == len(fake_timesheet.work_days)
+
+
+def test_current_timesheet_forbidden(app, employee_user, owner_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get(
+            "/timeclock/timesheet", query_string={"user_id": owner_user.id}
+        )
+    assert resp.status_code == 403
 
 
 # def test_index_owner_view(app, owner_user, fake_timesheet_db):
@@ -52,3 +90,313 @@ def test_current_timesheet_employee_view(app, employee_user):
 #         resp = client.get("/timeclock")
 #     assert resp.status_code == 200
 #     assert "<th>Employee</th>" in resp.text
+
+
+def test_overview_events(app, owner_user, employee_user):
+    app.config["SSE_STREAM_SECONDS"] = 0
+    last_id = events.latest_id()
+    timeclock.clock_in(employee_user)
+    with app.test_client(user=owner_user) as client:
+        resp = client.get(
+            "/timeclock/timesheet/overview/events",
+            headers={"Last-Event-ID": str(last_id)},
+        )
+    timeclock.clock_out(employee_user)
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    assert f"event: employee-{employee_user.id}\n" in resp.text
+    assert f'data: <tr id="employee_{employee_user.id}"' in resp.text
+
+
+def test_overview_events_employee_forbidden(app, employee_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get("/timeclock/timesheet/overview/events")
+    assert resp.status_code == 403
+
+
+def test_hours_dashboard(app, owner_user, employee_user, fake_timesheet_db):
+    with app.test_client(user=owner_user) as client:
+        resp = client.get(
+            "/timeclock/timesheet/hours",
+            query_string=dict(start="2022-01-03", end="2022-01-16"),
+        )
+    assert resp.status_code == 200
+    assert employee_user.username in resp.text
+    assert "<th>2022-01-10</th>" in resp.text
+
+
+def test_hours_dashboard_employee_forbidden(app, employee_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get("/timeclock/timesheet/hours")
+    assert resp.status_code == 403
+
+
+def test_schedule(app, owner_user, employee_user, fake_timesheet_db):
+    query = dict(start="2022-01-03", end="2022-01-16")
+    form = dict(
+        user_id=employee_user.user_id,
+        weekday=4,
+        start="08:00",
+        hours="8",
+        valid_from="2022-01-03",
+        valid_until="2022-01-16",
+    )
+    with app.test_client(user=owner_user) as client:
+        resp = client.post(
+            "/timeclock/timesheet/schedule", query_string=query, data=form
+        )
+        assert resp.status_code == 302
+        assert "start=2022-01-03" in resp.location
+        resp = client.get("/timeclock/timesheet/schedule", query_string=query)
+        assert resp.status_code == 200
+        assert "Fri 2022-01-07 08:00" in resp.text
+        assert resp.text.count("<td>late</td>") == 2
+        form.update(hours="x")
+        resp = client.post("/timeclock/timesheet/schedule", data=form)
+        assert resp.status_code == 400
+    with db_conn() as conn:
+        conn.execute("DELETE FROM shift_template")
+
+
+def test_workday_history(
+    app, owner_user, employee_user, fake_timesheet, fake_timesheet_db
+):
+    query = dict(user_id=employee_user.id, start="2022-01-01", end="2022-01-31")
+    with app.test_client(user=owner_user) as client:
+        resp = client.get("/timeclock/timesheet/history", query_string=query)
+    assert resp.status_code == 200
+    assert f"Total Hours: {fake_timesheet.hours} over 10 workdays" in resp.text
+    assert resp.text.count("/timeclock/workday/") == 10
+    assert "Next page" not in resp.text
+    with app.test_client(user=employee_user) as client:
+        resp = client.get("/timeclock/timesheet/history")
+        assert resp.status_code == 200
+        resp = client.get("/timeclock/timesheet/history?cursor=12")
+        assert resp.status_code == 400
+        resp = client.get(
+            "/timeclock/timesheet/history", query_string=dict(user_id=owner_user.id)
+        )
+        assert resp.status_code == 403
+
+
+def test_schedule_employee_forbidden(app, employee_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get("/timeclock/timesheet/schedule")
+    assert resp.status_code == 403
+
+
+def test_login_throttled(app, owner_user, monkeypatch):
+    monkeypatch.setattr(throttle, "ACCOUNT", throttle.Bucket("account", 2, 1 / 60))
+    form = dict(email="nobody@test.com", unhashed_password="guess")
+    with app.test_client() as client:
+        resps = [client.post("/timeclock/auth/login", data=form) for _ in range(3)]
+    assert [resp.status_code for resp in resps] == [401, 401, 429]
+    # The bucket refills a little during the bcrypt checks
+    assert 0 < int(resps[-1].headers["Retry-After"]) <= 60
+    with app.test_client(user=owner_user) as client:
+        resp = client.get("/timeclock/admin/throttle")
+    assert resp.json["account_rejected"] >= 1
+    assert resp.json["login_failed"] >= 2
+
+
+def test_throttle_counters_employee_forbidden(app, employee_user):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get("/timeclock/admin/throttle")
+    assert resp.status_code == 403
+
+
+def test_maintenance_runs(app, admin_user, employee_user):
+    maintenance.run_job(maintenance.Job("test", 60, lambda: "ok"))
+    with app.test_client(user=admin_user) as client:
+        resp = client.get("/timeclock/admin/maintenance")
+    assert resp.status_code == 200
+    assert resp.json["enabled"] is False
+    assert [(r["job"], r["result"]) for r in resp.json["runs"]] == [("test", "ok")]
+    with app.test_client(user=employee_user) as client:
+        resp = client.get("/timeclock/admin/maintenance")
+    assert resp.status_code == 403
+
+
+@pytest.fixture
+def employee_photo(app, tmp_path, employee_workday):
+    app.config["UPLOAD_PATH"] = tmp_path
+    (tmp_path / "served.jpeg").write_bytes(b"0123456789")
+    photo = employee_workday.add_photo("served.jpeg")
+    yield photo.filename
+    photo.delete()
+
+
+def test_photo(app, employee_user, employee_photo):
+    with app.test_client(user=employee_user) as client:
+        resp = client.get(f"/timeclock/photo/{employee_photo}")
+        assert resp.status_code == 200
+        assert resp.data == b"0123456789"
+        resp = client.get(
+            f"/timeclock/photo/{employee_photo}", headers={"Range": "bytes=2-4"}
+        )
+        assert resp.status_code == 206
+        assert resp.data == b"234"
+        etag = client.get(f"/timeclock/photo/{employee_photo}").headers["ETag"]
+        resp = client.get(
+            f"/timeclock/photo/{employee_photo}", headers={"If-None-Match": etag}
+        )
+        assert resp.status_code == 304
+
+
+def test_photo_forbidden(app, admin_user, employee_photo):
+    with app.test_client(user=admin_user) as client:
+        assert client.get(f"/timeclock/photo/{employee_photo}").status_code == 403
+        assert client.get("/timeclock/photo/unknown.jpeg").status_code == 404
+
+
+def test_photo_offload(app, owner_user, employee_photo):
+    app.config["PHOTO_OFFLOAD"] = "x-accel-redirect"
+    with app.test_client(user=owner_user) as client:
+        resp = client.get(f"/timeclock/photo/{employee_photo}")
+    assert resp.headers["X-Accel-Redirect"] == f"/static/uploads/{employee_photo}"
+    assert resp.mimetype == "image/jpeg"
+    assert resp.data == b""
+
+    app.config["PHOTO_OFFLOAD"] = ""
+    app.config["USE_X_SENDFILE"] = True
+    with app.test_client(user=owner_user) as client:
+        resp = client.get(f"/timeclock/photo/{employee_photo}")
+    assert resp.headers["X-Sendfile"] == str(app.config["UPLOAD_PATH"] / employee_photo)
+    assert resp.data == b""
+
+
+def test_clock_in_idempotent(app, employee_user):
+    headers = {"Idempotency-Key": "clock-in-1"}
+    with app.test_client(user=employee_user) as client:
+        first = client.put("/timeclock/clock_in", headers=headers)
+        replay = client.put("/timeclock/clock_in", headers=headers)
+        other = client.post("/timeclock/clock_out", headers=headers)
+        again = client.put("/timeclock/clock_in")
+        out = client.post("/timeclock/clock_out", headers={"Idempotency-Key": "x"})
+    assert first.status_code == replay.status_code == 201
+    assert replay.data == first.data
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert other.status_code == 422
+    assert again.status_code == 400
+    assert out.status_code == 200
+
+
+def test_idempotency_key_in_progress(app, employee_user):
+    with db_conn() as conn:
+        with transaction(conn):
+            Q.reserve_idempotency_key(
+                conn,
+                user_id=employee_user.user_id,
+                key="running",
+                request="PUT /timeclock/clock_in",
+                now=time.time(),
+                expired=0,
+                abandoned=0,
+            )
+    with app.test_client(user=employee_user) as client:
+        resp = client.put("/timeclock/clock_in", headers={"Idempotency-Key": "running"})
+    assert resp.status_code == 409
+
+
+def test_timesheet_pdf(app, tmp_path, employee_user, owner_user, saved_timesheet):
+    app.config["PDF_PATH"] = tmp_path
+    ts_id = get_past_timesheets(employee_user)[0].id
+    url = f"/timeclock/timesheet/{ts_id}/pdf"
+    with app.test_client(user=owner_user) as client:
+        with db_conn() as conn:
+            conn.execute("DELETE FROM pdf_job")
+        resp = client.get(url)
+        assert resp.status_code == 202
+        assert resp.headers["Retry-After"]
+        pdfs.run_jobs(tmp_path, tmp_path)
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.mimetype == "application/pdf"
+        assert resp.data.startswith(b"%PDF")
+    with app.test_client(user=employee_user) as client:
+        assert client.get(url).status_code == 200
+        assert client.get("/timeclock/timesheet/999/pdf").status_code == 404
+
+
+def test_timesheet(app, employee_user, admin_user, saved_timesheet):
+    ts_id = get_past_timesheets(employee_user)[0].id
+    with app.test_client(user=employee_user) as client:
+        assert client.get(f"/timeclock/timesheet/{ts_id}").status_code == 200
+        assert client.get("/timeclock/timesheet/999").status_code == 404
+    with app.test_client(user=admin_user) as client:
+        assert client.get(f"/timeclock/timesheet/{ts_id}").status_code == 403
+
+
+def test_timesheet_pdf_forbidden(app, admin_user, saved_timesheet, employee_user):
+    ts_id = get_past_timesheets(employee_user)[0].id
+    with app.test_client(user=admin_user) as client:
+        assert client.get(f"/timeclock/timesheet/{ts_id}/pdf").status_code == 403
+        assert client.get("/timeclock/timesheet/pdfs.zip").status_code == 403
+
+
+def test_pay_period_pdfs(app, tmp_path, owner_user, saved_timesheet):
+    app.config["PDF_PATH"] = tmp_path
+    url = "/timeclock/timesheet/pdfs.zip?start=2022-01-01&end=2022-01-31"
+    with app.test_client(user=owner_user) as client:
+        assert client.get(url).status_code == 202
+        pdfs.run_jobs(tmp_path, tmp_path)
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.mimetype == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+            assert [n.startswith("employed-2022-01-") for n in zf.namelist()] == [True]
+        resp = client.get(url.replace("2022", "2021"))
+        assert resp.status_code == 404
+        resp = client.get("/timeclock/timesheet/pdfs.zip?start=nope")
+        assert resp.status_code == 400
+
+
+def test_failed_pdf(app, tmp_path, owner_user, employee_user, saved_timesheet):
+    app.config["PDF_PATH"] = tmp_path
+    ts_id = get_past_timesheets(employee_user)[0].id
+    with db_conn() as conn:
+        conn.execute(
+            "UPDATE pdf_job SET status = 'failed', attempts = 3, error = 'boom'"
+            " WHERE timesheet_id = ?",
+            (ts_id,),
+        )
+    try:
+        with app.test_client(user=owner_user) as client:
+            resp = client.get(f"/timeclock/timesheet/{ts_id}/pdf")
+            assert resp.status_code == 500
+            assert "boom" in resp.text
+            resp = client.get(
+                "/timeclock/timesheet/pdfs.zip?start=2022-01-01&end=2022-01-31"
+            )
+            assert resp.status_code == 500
+            assert "boom" in resp.text
+        assert pdfs.get_job(ts_id).status == "failed"
+    finally:
+        with db_conn() as conn:
+            conn.execute("DELETE FROM pdf_job WHERE timesheet_id = ?", (ts_id,))
+
+
+def test_kiosk_punches(app, admin_user):
+    token = kiosk.add_kiosk("test site")
+    kiosk.set_badge(admin_user.user_id, "1234")
+    now = pendulum.now()
+    punches = [
+        dict(code="1234", direction="in", timestamp=str(now.subtract(hours=1))),
+        dict(code="1234", direction="out", timestamp=str(now)),
+    ]
+    with app.test_client() as client:
+        resp = client.post("/timeclock/kiosk/punches", json=dict(punches=punches))
+        assert resp.status_code == 401
+        resp = client.post(
+            "/timeclock/kiosk/punches",
+            json=dict(punches=punches),
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert resp.status_code == 200
+        assert [r["status"] for r in resp.json["results"]] == ["ok", "ok"]
+        resp = client.post(
+            "/timeclock/kiosk/punches",
+            json=dict(punches=[dict(code="1234")]),
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert resp.status_code == 400
@@ -1,5 +1,6 @@
 import pendulum
 
+from timeclock import workday as workday_module
 from timeclock.workday import Photo, WorkDay, get_photos
 
 
@@ -21,6 +22,37 @@ def test_workday_from_id(employee_workday):
     assert wd.clock_in == employee_workday.clock_in
 
 
+def test_workday_from_id_prefills(employee_user, employee_workday, monkeypatch):
+    wd = WorkDay.from_id(employee_workday.id)
+
+    def no_db(*args, **kwargs):
+        raise AssertionError("queried the database")
+
+    monkeypatch.setattr(workday_module, "db_conn", no_db)
+    assert wd.user_id == employee_user.user_id
+    assert wd.archived is False
+
+
+def test_workday_photos_lazy(employee_workday):
+    wd = WorkDay.from_id(employee_workday.id)
+    photo = wd.add_photo("lazy.jpeg")
+    assert wd._photos is None
+    assert wd.photos == [photo]
+    wd.remove_photo(photo.id)
+    assert wd.photos == []
+
+
+def test_workday_update_forgets(employee_workday):
+    wd = WorkDay.from_id(employee_workday.id)
+    assert wd.photos == []
+    other = WorkDay.from_id(employee_workday.id)
+    photo = other.add_photo("forgotten.jpeg")
+    assert wd.photos == []
+    wd.update()
+    assert wd.photos == [photo]
+    other.remove_photo(photo.id)
+
+
 def test_workday_user_id(employee_user, employee_workday):
     assert employee_user.user_id == employee_workday.user_id
 
@@ -65,3 +97,14 @@ def test_workday_add_photo_and_get_photos(employee_workday):
     assert pic2 == p2
     p1.delete()
     p2.delete()
+
+
+def test_workday_link_and_remove_shared_photo(
+    employee_workday, fake_timesheet, fake_timesheet_db
+):
+    other = WorkDay.from_id(fake_timesheet.work_days[0].id)
+    photo = employee_workday.add_photo("shared.jpeg", sha256="abc123")
+    other.link_photo(Photo.from_sha256("abc123"))
+    assert employee_workday.remove_photo(photo.id) == []
+    assert other.remove_photo(photo.id) == ["shared.jpeg"]
+    assert Photo.from_sha256("abc123") is None
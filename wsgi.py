@@ -1,3 +1,15 @@
+import gc
+
 from timeclock import create_app
 
 app = create_app()
+
+# uWSGI imports this module once in the master and forks the workers from it.
+# Compile the templates now so the workers share them instead of each
+# compiling its own copy on first render.
+for name in app.jinja_env.list_templates(extensions=["html"]):
+    app.jinja_env.get_template(name)
+
+# Freeze everything allocated so far so the garbage collector in each worker
+# doesn't write to (and so copy) the pages shared with the master.
+gc.freeze()